@@ -1,197 +1,186 @@
-import heapq
-import random
-import networkx as nx
-import numpy as np
-
-class Packet:
-    def __init__(self, arrival_time, priority=1):
-        self.arrival_time = arrival_time
-        self.processing_time = random.uniform(1, 10)
-        self.priority = priority
-
-class Event:
-    def __init__(self, event_type, time, packet=None):
-        self.event_type = event_type
-        self.time = time
-        self.packet = packet
-
-    def __lt__(self, other):
-        return self.time < other.time
-
-class Scheduler:
-    def __init__(self, scheduler_type='FIFO', quantum=1):
-        self.events = []
-        self.scheduler_type = scheduler_type
-        self.quantum = quantum
-        self.current_index = 0
-
-    def schedule_event(self, event):
-        if self.scheduler_type == 'PQ':
-            heapq.heappush(self.events, (event.time, event.packet.priority, event))
-        else:
-            heapq.heappush(self.events, (event.time, event))
-
-    def get_next_event(self):
-        if self.events:
-            if self.scheduler_type == 'PQ':
-                return heapq.heappop(self.events)[-1]
-            elif self.scheduler_type == 'RR':
-                current_event = self.events[self.current_index][-1]
-                del self.events[self.current_index]
-                if len(self.events) > 0:
-                    self.current_index %= len(self.events)
-                return current_event
-            else:
-                return heapq.heappop(self.events)[-1]
-        return None
-
-    def has_events(self):
-        return len(self.events) > 0
-
-class LLQScheduler(Scheduler):
-    def __init__(self):
-        super().__init__(scheduler_type='LLQ')
-        self.high_priority_queue = []
-        self.low_priority_queue = []
-
-    def schedule_event(self, event):
-        if event.packet.priority == 1:
-            heapq.heappush(self.high_priority_queue, (event.time, event))
-        else:
-            heapq.heappush(self.low_priority_queue, (event.time, event))
-
-    def get_next_event(self):
-        if self.high_priority_queue:
-            return heapq.heappop(self.high_priority_queue)[-1]
-        elif self.low_priority_queue:
-            return heapq.heappop(self.low_priority_queue)[-1]
-        else:
-            return None
-
-    def has_events(self):
-        return len(self.high_priority_queue) > 0 or len(self.low_priority_queue) > 0
-
-class Network:
-    def __init__(self):
-        self.graph = nx.Graph()
-        self.links = {}
-
-    def generate_barabasi_albert_topology(self, n, m):
-        self.graph = nx.barabasi_albert_graph(n, m)
-        self.initialize_links()
-
-    def initialize_links(self):
-        for u, v in self.graph.edges():
-            self.links[(u, v)] = {"bandwidth": np.random.uniform(10, 100), "latency": np.random.uniform(1, 10)}
-            self.links[(v, u)] = self.links[(u, v)]
+from arrivals import generate_arrivals, gc_paused
+from event import Event
+from inflight import InFlightTable
+from metrics import LatencyHistogram, RunningStats
+from network import Network
+from packet import Packet
+from packet_trace import ADMIT, ARRIVAL, DEPARTURE, DROP, HOP
+from queue_discipline import make_discipline
+from random_streams import RandomStreams
+from routing import Forwarder
+from scheduler import Scheduler
 
 class Simulator:
-    def __init__(self, max_queue_size=50, scheduler_type='FIFO', quantum=5):
+    def __init__(self, max_queue_size=50, scheduler_type='FIFO', quantum=5, queue_type='heap', weights=None, seed=None):
         self.scheduler_type = scheduler_type
-        if scheduler_type == 'LLQ':
-            self.scheduler = LLQScheduler()
-        else:
-            self.scheduler = Scheduler(scheduler_type=scheduler_type, quantum=quantum)
-        self.packet_queues = [[]]
-        self.network = Network()
+        self.quantum = quantum
+        # Named random substreams; rng is the one arrivals and traffic are drawn from
+        self.random = RandomStreams(seed)
+        self.rng = self.random.root
+        self.scheduler = Scheduler(scheduler_type=scheduler_type, queue_type=queue_type)
+        # The event list only orders events in time; which waiting packet goes
+        # onto the link next is up to the queue discipline.
+        self.discipline = make_discipline(scheduler_type, quantum=quantum, max_queue_size=max_queue_size, weights=weights,
+                                          rng=self.random.stream('red'))
+        self.link_busy = False
+        self.packet_queues = InFlightTable()
+        self.network = Network(random=self.random)
+        self.forwarder = None
         self.max_queue_size = max_queue_size
         self.arrival_count = 0
         self.departure_count = 0
         self.dropped_packets = 0
         self.total_latency = 0
-        self.latency_list = []
+        self.latency_stats = RunningStats()
+        self.latency_histogram = LatencyHistogram()
         self.simulation_end_time = 0
-
-    def initialize_events(self, num_events=100):
-        for _ in range(num_events):
-            time = random.uniform(0, 100)
-            priority = random.randint(1, 2)  # Randomly assign priorities (1 or 2)
-            packet = Packet(arrival_time=time, priority=priority)
-            self.scheduler.schedule_event(Event("arrival", time, packet))
-
-    def run_simulation(self):
-        while self.scheduler.has_events():
-            event = self.scheduler.get_next_event()
-            if isinstance(event, Event) and event.event_type == "arrival":
+        self.trace = None  # Optional packet_trace.TraceRecorder
+        self.pending_sources = {}  # Scheduled arrival event -> the source it came from
+
+    def initialize_events(self, num_events=100, distribution='uniform', **params):
+        # Arrival times, priorities (1 or 2) and processing times are drawn in
+        # bulk and loaded into the event list in one go.
+        times, priorities, processing_times = generate_arrivals(num_events, distribution, rng=self.rng, **params)
+        with gc_paused():
+            self.scheduler.schedule_events([
+                Event("arrival", time, Packet(arrival_time=time, priority=priority, processing_time=processing_time))
+                for time, priority, processing_time in zip(times.tolist(), priorities.tolist(), processing_times.tolist())
+            ])
+
+    def run_simulation(self, until=None, max_events=None):
+        # Stops after simulated time until or after max_events events, with the
+        # rest still scheduled, so a run can be snapshotted and resumed.
+        # Returns the number of events processed.
+        processed = 0
+        trace = self.trace
+        while processed != max_events and self.scheduler.has_events():
+            event = self.scheduler.get_next_event(until)
+            if event is None:
+                break
+            processed += 1
+            if self.pending_sources and event in self.pending_sources:
+                self.schedule_from_source(self.pending_sources.pop(event))
+            if isinstance(event, Event) and event.event_type == "arrival" and event.packet is not None and event.packet.destination is not None:
+                self.arrival_count += 1
+                if trace is not None:
+                    trace.record(ARRIVAL, event.time, event.packet)
+                self.forward(event.packet, event.time)
+            elif isinstance(event, Event) and event.event_type == "hop":
+                if trace is not None:
+                    trace.record(HOP, event.time, event.packet)
+                self.forward(event.packet, event.time)
+            elif isinstance(event, Event) and event.event_type == "arrival":
                 self.arrival_count += 1
-                if len(self.packet_queues) < self.max_queue_size:
-                    self.packet_queues.append(event.packet)
-                    departure_time = event.time + event.packet.processing_time
-                    self.scheduler.schedule_event(Event("departure", departure_time, event.packet))
+                if event.packet is None:
+                    continue  # A bare arrival event carries nothing to queue
+                if trace is not None:
+                    trace.record(ARRIVAL, event.time, event.packet)
+                if len(self.packet_queues) < self.max_queue_size and self.discipline.enqueue(event.packet, event.packet.priority):
+                    self.packet_queues.admit(event.packet)
+                    if trace is not None:
+                        trace.record(ADMIT, event.time, event.packet)
+                    if not self.link_busy:
+                        self.start_transmission(event.time)
                 else:
                     self.dropped_packets += 1  # Increment dropped packet count
+                    if trace is not None:
+                        trace.record(DROP, event.time, event.packet)
             elif isinstance(event, Event) and event.event_type == "departure":
-                if event.packet in self.packet_queues:
-                    self.packet_queues.remove(event.packet)
+                if event.packet is None:
+                    self.departure_count += 1  # A bare departure event holds no queue slot or link
+                elif self.packet_queues.depart(event.packet) is not None:
                     self.departure_count += 1
-                    self.total_latency += event.time - event.packet.arrival_time
-                    self.latency_list.append(event.time - event.packet.arrival_time)
+                    latency = event.time - event.packet.arrival_time
+                    if trace is not None:
+                        trace.record(DEPARTURE, event.time, event.packet, latency)
+                    self.total_latency += latency
+                    self.latency_stats.add(latency)
+                    self.latency_histogram.add(latency)
                     self.simulation_end_time = max(self.simulation_end_time, event.time)
+                    self.start_transmission(event.time)
+        return processed
+
+    def add_source(self, source):
+        # Arrivals from an arrivals.ArrivalSource are pulled one at a time: only
+        # the source's next arrival sits in the event list, so memory does not
+        # grow with the number of packets it will produce
+        self.schedule_from_source(source)
+
+    def schedule_from_source(self, source):
+        arrival = source.next_arrival()
+        if arrival is not None:
+            time, priority, processing_time = arrival
+            event = Event("arrival", time, Packet(arrival_time=time, priority=priority, flow_id=source.flow_id,
+                                                  processing_time=processing_time), flow_id=source.flow_id)
+            self.pending_sources[event] = source
+            self.scheduler.schedule_event(event)
+
+    def initialize_traffic(self, num_events=100, distribution='uniform', size=1.0, **params):
+        # Packets between random distinct node pairs of self.network, forwarded
+        # hop by hop along the precomputed next-hop table
+        num_nodes = self.network.number_of_nodes()
+        self.forwarder = Forwarder(self.network)
+        times, priorities, processing_times = generate_arrivals(num_events, distribution, rng=self.rng, **params)
+        sources = self.rng.integers(0, num_nodes, num_events)
+        destinations = (sources + self.rng.integers(1, num_nodes, num_events)) % num_nodes
+        with gc_paused():
+            events = [
+                Event("arrival", time, Packet(arrival_time=time, priority=priority, processing_time=processing_time,
+                                              source=source, destination=destination, size=size))
+                for time, priority, processing_time, source, destination in zip(
+                    times.tolist(), priorities.tolist(), processing_times.tolist(), sources.tolist(), destinations.tolist())
+            ]
+            # Same-instant multi-hop events run in packet id order, which
+            # parallel.run_parallel reproduces exactly
+            self.scheduler.schedule_events(events, [event.packet.packet_id for event in events])
+
+    def forward(self, packet, time):
+        if packet.node == packet.destination:
+            self.departure_count += 1
+            latency = time - packet.arrival_time
+            self.total_latency += latency
+            self.latency_stats.add(latency)
+            self.latency_histogram.add(latency)
+            self.simulation_end_time = max(self.simulation_end_time, time)
+            if self.trace is not None:
+                self.trace.record(DEPARTURE, time, packet, latency)
+            return
+        if self.forwarder is None:
+            self.forwarder = Forwarder(self.network)
+        next_arrival = self.forwarder.forward(packet, time)
+        if next_arrival is None:
+            self.dropped_packets += 1  # No route to the destination
+            if self.trace is not None:
+                self.trace.record(DROP, time, packet)
+        else:
+            self.scheduler.schedule_event(Event("hop", next_arrival, packet), packet.packet_id)
+
+    def start_transmission(self, time):
+        # Put the next packet chosen by the discipline on the link, if any
+        packet = self.discipline.dequeue()
+        self.link_busy = packet is not None
+        if packet is not None:
+            self.scheduler.schedule_event(Event("departure", time + packet.processing_time, packet))
+
+    def get_nodes_count(self):
+        return self.network.number_of_nodes()
+
+    def get_links_count(self):
+        return self.network.number_of_links()
+
+    def get_events_count(self):
+        return len(self.scheduler.events)
+
+    def calculate_average_latency(self):
+        return self.total_latency / self.departure_count if self.departure_count > 0 else 0
 
     def calculate_metrics(self):
         simulation_duration = self.simulation_end_time if self.simulation_end_time > 0 else 1
         throughput = self.departure_count / simulation_duration
         average_latency = self.total_latency / self.departure_count if self.departure_count > 0 else 0
-        jitter = np.std(self.latency_list) if self.latency_list else 0
+        jitter = self.latency_stats.std()
         packet_drop_rate = self.dropped_packets / self.arrival_count if self.arrival_count > 0 else 0
         return throughput, average_latency, jitter, packet_drop_rate
 
-# Example usage for FIFO scheduling
-fifo_simulator = Simulator(max_queue_size=50, scheduler_type='FIFO')
-fifo_simulator.network.generate_barabasi_albert_topology(n=10, m=2)
-fifo_simulator.initialize_events(num_events=1000)
-fifo_simulator.run_simulation()
-fifo_metrics = fifo_simulator.calculate_metrics()
-print("FIFO Scheduling Results:")
-print(f"Throughput: {fifo_metrics[0]:.2f} packets/unit time")
-print(f"Average Latency: {fifo_metrics[1]:.2f} time units")
-print(f"Jitter: {fifo_metrics[2]:.2f} time units")
-print(f"Packet Drop Rate: {fifo_metrics[3] * 100:.2f}%")
-
-# Example usage for Priority Queue (PQ) scheduling
-pq_simulator = Simulator(max_queue_size=50, scheduler_type='PQ')
-pq_simulator.network.generate_barabasi_albert_topology(n=10, m=2)
-pq_simulator.initialize_events(num_events=1000)
-pq_simulator.run_simulation()
-pq_metrics = pq_simulator.calculate_metrics()
-print("\nPriority Queue (PQ) Scheduling Results:")
-print(f"Throughput: {pq_metrics[0]:.2f} packets/unit time")
-print(f"Average Latency: {pq_metrics[1]:.2f} time units")
-print(f"Jitter: {pq_metrics[2]:.2f} time units")
-print(f"Packet Drop Rate: {pq_metrics[3] * 100:.2f}%")
-
-# Example usage for Round Robin scheduling
-rr_simulator = Simulator(max_queue_size=50, scheduler_type='RR', quantum=5)
-rr_simulator.network.generate_barabasi_albert_topology(n=10, m=2)
-rr_simulator.initialize_events(num_events=1000)
-rr_simulator.run_simulation()
-rr_metrics = rr_simulator.calculate_metrics()
-print("\nRound Robin Scheduling Results:")
-print(f"Throughput: {rr_metrics[0]:.2f} packets/unit time")
-print(f"Average Latency: {rr_metrics[1]:.2f} time units")
-print(f"Jitter: {rr_metrics[2]:.2f} time units")
-print(f"Packet Drop Rate: {rr_metrics[3] * 100:.2f}%")
-
-# Example usage for Random Early Detection (RED) scheduling
-red_simulator = Simulator(max_queue_size=50, scheduler_type='RED')
-red_simulator.network.generate_barabasi_albert_topology(n=10, m=2)
-red_simulator.initialize_events(num_events=1000)
-red_simulator.run_simulation()
-red_metrics = red_simulator.calculate_metrics()
-print("\nRandom Early Detection (RED) Scheduling Results:")
-print(f"Throughput: {red_metrics[0]:.2f} packets/unit time")
-print(f"Average Latency: {red_metrics[1]:.2f} time units")
-print(f"Jitter: {red_metrics[2]:.2f} time units")
-print(f"Packet Drop Rate: {red_metrics[3] * 100:.2f}%")
-
-# Example usage for Low Latency Queuing (LLQ) scheduling
-llq_simulator = Simulator(max_queue_size=50, scheduler_type='LLQ')
-llq_simulator.network.generate_barabasi_albert_topology(n=10, m=2)
-llq_simulator.initialize_events(num_events=1000)
-llq_simulator.run_simulation()
-llq_metrics = llq_simulator.calculate_metrics()
-print("\nLow Latency Queuing (LLQ) Scheduling Results:")
-print(f"Throughput: {llq_metrics[0]:.2f} packets/unit time")
-print(f"Average Latency: {llq_metrics[1]:.2f} time units")
-print(f"Jitter: {llq_metrics[2]:.2f} time units")
-print(f"Packet Drop Rate: {llq_metrics[3] * 100:.2f}%")
+    def calculate_latency_percentiles(self, percentiles=(50, 99, 99.9)):
+        return self.latency_histogram.percentiles(percentiles)
@@ -2,7 +2,7 @@ from Simulator import Simulator  # Import the Simulator class from Simulator mod
 
 simulator = Simulator()  # Instantiate the Simulator object
 
-simulator.network.generate_barabasi_albert_topology(n=100, m=6)  # Generate Barabasi-Albert network topology with 100 nodes and average degree 6
+simulator.network.load_topology('barabasi_albert', seed=1, n=100, m=6)  # Load (or generate and cache) a Barabasi-Albert topology with 100 nodes and average degree 6
 
 simulator.initialize_events(num_events=100)  # Initialize 100 simulation events
 
@@ -3,7 +3,7 @@ from Simulator import Simulator  # Import the Simulator class from Simulator mod
 simulator = Simulator()  # Instantiate the Simulator object
 
 # Generate network topology using Waxman model with Experiment 2 parameters
-simulator.network.generate_waxman_topology(n=200, alpha=0.57, beta=0.1)  # Adjusted to generate 1000 links (n=200)
+simulator.network.load_topology('waxman', seed=2, n=200, alpha=0.57, beta=0.1)  # Adjusted to generate 1000 links (n=200); cached after the first run
 
 # Initialize events for Experiment 2 (1000 events)
 simulator.initialize_events(num_events=1000)  # Initialize 1000 simulation events
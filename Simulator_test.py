@@ -1,5 +1,36 @@
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
 import unittest
-from Simulator import Simulator, Event, Scheduler, Network
+from unittest import mock
+import networkx as nx
+from Simulator import Simulator, Event, Scheduler, Network, Packet
+import numpy as np
+from arrivals import ArrivalSource, arrival_chunks, generate_arrivals, processing_time_for_load
+from cubic import Cubic, CubicFlows, Vegas, VegasFlows
+from cubic_simulator import Simulator as FlowSimulator
+from fast_fifo import FastFIFO
+from leackyBucket import HierarchicalTokenBucket
+from metrics import LatencyHistogram, RunningStats, TimeBinnedMetrics
+import benchmark
+import cli
+from instrumentation import Instrumentation
+from output_analysis import mser_truncation, replicate_until_precise, run_until_precise
+from packet_trace import ARRIVAL, TraceRecorder, load_records
+from plotting import IncrementalSeries, LivePlot, csv_series, decimate, simulator_series
+import random_streams
+from random_streams import RandomStreams
+from result_cache import ResultCache, restore_flows, run_key, simulator_result
+import parallel
+from parallel import lookahead, partition_nodes, run_parallel
+from routing import LazyNextHops, _python_next_hops, compute_next_hops
+from snapshot import fork, load_snapshot, restore, run_with_checkpoints, snapshot_bytes
+from trace_analysis import Trace
+from sweep import confidence_interval, expand_grid, run_sweep
+from queue_discipline import DeficitRoundRobin, LowLatencyQueue, StrictPriorityQueue, WeightedFairQueue
 
 class TestSimulator(unittest.TestCase):
 
@@ -68,6 +99,28 @@ class TestSimulator(unittest.TestCase):
         # Check if the number of events matches the expected count
         self.assertEqual(len(scheduler.events), 100)
 
+    def test_priority_scheduler_loads_packetless_events_like_single_events(self):
+        """
+        Test that bulk and one-by-one scheduling order PQ events the same way, packet-less ones included.
+        """
+        def events():
+            return [Event("tick", 5), Event("arrival", 5, Packet(5, priority=2)), Event("arrival", 5, Packet(5, priority=1)),
+                    Event("tick", 1)]
+
+        single, bulk = Scheduler(scheduler_type='PQ'), Scheduler(scheduler_type='PQ')
+        for event in events():
+            single.schedule_event(event)
+        bulk.schedule_events(events())
+        orders = []
+        for scheduler in (single, bulk):
+            order = []
+            while scheduler.has_events():
+                event = scheduler.get_next_event()
+                order.append((event.time, event.event_type, event.packet.priority if event.packet else None))
+            orders.append(order)
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], [(1, "tick", None), (5, "tick", None), (5, "arrival", 1), (5, "arrival", 2)])
+
     def test_arrival_count(self):
         """
         Test the calculation of the arrival count during the simulation.
@@ -96,5 +149,1034 @@ class TestSimulator(unittest.TestCase):
         # Check if the calculated departure count is correct
         self.assertEqual(simulator.departure_count, 2)
 
+    def test_calendar_queue_matches_heap_order(self):
+        """
+        Test that the calendar queue backend hands events back in the same order as the binary heap.
+        """
+        orders = {}
+        for queue_type in ('heap', 'calendar'):
+            rng = random.Random(7)
+            scheduler = Scheduler(queue_type=queue_type)
+            for i in range(2000):
+                scheduler.schedule_event(Event("arrival", round(rng.uniform(0, 100), 1), flow_id=i))
+            order = []
+            while scheduler.has_events():
+                event = scheduler.get_next_event()
+                order.append((event.time, event.flow_id))
+                # Schedule follow-up events while draining, as run_simulation does
+                if event.event_type == "arrival":
+                    scheduler.schedule_event(Event("departure", event.time + rng.uniform(1, 10), flow_id=event.flow_id))
+            orders[queue_type] = order
+        self.assertEqual(len(orders['heap']), 4000)
+        self.assertEqual(orders['heap'], orders['calendar'])
+        self.assertEqual(orders['heap'], sorted(orders['heap'], key=lambda item: item[0]))
+
+    def test_calendar_queue_simulation(self):
+        """
+        Test that a simulation runs to completion on the calendar queue backend.
+        """
+        simulator = Simulator(queue_type='calendar')
+        simulator.initialize_events(500)
+        simulator.run_simulation()
+        self.assertEqual(simulator.arrival_count, 500)
+        self.assertFalse(simulator.scheduler.has_events())
+
+    def test_strict_priority_discipline(self):
+        """
+        Test that strict priority always serves the lowest class value first and FIFO within a class.
+        """
+        discipline = StrictPriorityQueue()
+        for name, level in [("a", 3), ("b", 1), ("c", 2), ("d", 1)]:
+            discipline.enqueue(name, level)
+        self.assertEqual([discipline.dequeue() for _ in range(4)], ["b", "d", "c", "a"])
+        self.assertIsNone(discipline.dequeue())
+
+    def test_fair_disciplines_share_link_by_weight(self):
+        """
+        Test that DRR and WFQ split service between backlogged classes in proportion to their weights.
+        """
+        class Item:
+            def __init__(self, cls):
+                self.cls = cls
+                self.processing_time = 1
+
+        for discipline in (DeficitRoundRobin(quantum=1, weights={'a': 3}), WeightedFairQueue(weights={'a': 3})):
+            for _ in range(400):
+                discipline.enqueue(Item('a'), 'a')
+                discipline.enqueue(Item('b'), 'b')
+            served = [discipline.dequeue().cls for _ in range(400)]
+            self.assertEqual(served.count('a'), 300)
+            self.assertEqual(len(discipline), 400)
+
+    def test_llq_priority_limit(self):
+        """
+        Test that LLQ serves the priority class first but lets other classes through after priority_limit packets.
+        """
+        class Item:
+            def __init__(self, cls):
+                self.cls = cls
+                self.processing_time = 1
+
+        discipline = LowLatencyQueue(priority_classes=(1,), priority_limit=2)
+        for _ in range(4):
+            discipline.enqueue(Item(1), 1)
+            discipline.enqueue(Item(2), 2)
+        served = [discipline.dequeue().cls for _ in range(8)]
+        self.assertEqual(served, [1, 1, 2, 1, 1, 2, 2, 2])
+
+    def test_simulation_with_each_discipline(self):
+        """
+        Test that every scheduler type runs through the single-link simulation and accounts for every packet.
+        """
+        for scheduler_type in ('FIFO', 'PQ', 'RR', 'RED', 'WFQ', 'LLQ'):
+            simulator = Simulator(max_queue_size=20, scheduler_type=scheduler_type)
+            simulator.initialize_events(300)
+            simulator.run_simulation()
+            self.assertEqual(simulator.arrival_count, 300)
+            self.assertEqual(simulator.departure_count + simulator.dropped_packets, 300)
+            self.assertEqual(len(simulator.discipline), 0)
+
+    def test_cubic_window_follows_simulation_time(self):
+        """
+        Test that the Cubic window is a function of simulated time since the last congestion event.
+        """
+        cubic = Cubic(c=0.4, initial_cwnd=10)
+        self.assertEqual(cubic.update_cwnd(5.0), 10)
+        cubic.congestion_event(10.0)
+        self.assertEqual(cubic.cwnd, 5)
+        self.assertAlmostEqual(cubic.update_cwnd(12.0), 5 + 0.4 * 8)
+        self.assertEqual(cubic.update_cwnd(1000.0), cubic.max_cwnd)
+
+    def test_vegas_is_reproducible(self):
+        """
+        Test that Vegas windows depend only on event times and RTT samples from the simulated path.
+        """
+        windows = []
+        for _ in range(2):
+            vegas = Vegas()
+            vegas.congestion_event(1.0)
+            trace = []
+            for step, rtt in enumerate([4.0, 6.0, 3.0, 8.0]):
+                vegas.on_rtt_sample(rtt)
+                trace.append(vegas.update_cwnd(2.0 + step))
+            windows.append(trace)
+        self.assertEqual(windows[0], windows[1])
+
+    def test_generate_arrivals_distributions(self):
+        """
+        Test that every bulk arrival distribution returns sorted times with matching priority and processing time arrays.
+        """
+        for distribution in ('uniform', 'poisson', 'pareto', 'onoff'):
+            times, priorities, processing_times = generate_arrivals(5000, distribution, rng=np.random.default_rng(3))
+            self.assertEqual(len(times), 5000)
+            self.assertTrue(np.all(np.diff(times) >= 0))
+            self.assertEqual(set(priorities.tolist()), {1, 2})
+            self.assertTrue(np.all((processing_times >= 1) & (processing_times <= 10)))
+        # Poisson arrivals at rate 10 should average about 0.1 time units apart
+        times, _, _ = generate_arrivals(20000, 'poisson', rng=np.random.default_rng(3), rate=10.0)
+        self.assertAlmostEqual(times[-1] / len(times), 0.1, delta=0.01)
+
+    def test_initialize_events_is_seeded(self):
+        """
+        Test that two simulators with the same seed produce the same bulk-loaded arrivals and results.
+        """
+        results = []
+        for queue_type in ('heap', 'calendar'):
+            simulator = Simulator(seed=11, queue_type=queue_type)
+            simulator.initialize_events(1000, distribution='poisson', rate=0.2)
+            self.assertEqual(len(simulator.scheduler.events), 1000)
+            simulator.run_simulation()
+            results.append(simulator.calculate_metrics())
+        self.assertEqual(results[0], results[1])
+
+    def test_packet_and_event_are_slotted(self):
+        """
+        Test that packets and events carry no per-instance dict but keep their attribute interface.
+        """
+        packet = Packet(arrival_time=3.5, priority=2, processing_time=4.0)
+        event = Event("arrival", 3.5, packet, flow_id='flow1')
+        self.assertFalse(hasattr(packet, '__dict__'))
+        self.assertFalse(hasattr(event, '__dict__'))
+        self.assertEqual((event.packet.arrival_time, event.packet.priority, event.packet.processing_time), (3.5, 2, 4.0))
+        self.assertTrue(Event("departure", 1.0) < event)
+
+    def test_queue_occupancy_matches_max_queue_size(self):
+        """
+        Test that exactly max_queue_size packets are admitted into an empty queue before drops start.
+        """
+        simulator = Simulator(max_queue_size=3)
+        for i in range(5):
+            packet = Packet(arrival_time=i * 0.1, processing_time=10)
+            simulator.scheduler.schedule_event(Event("arrival", i * 0.1, packet))
+        simulator.run_simulation()
+        self.assertEqual(simulator.dropped_packets, 2)
+        self.assertEqual(simulator.departure_count, 3)
+        self.assertEqual(len(simulator.packet_queues), 0)
+
+    def test_streaming_latency_statistics(self):
+        """
+        Test that the online mean/std and histogram percentiles agree with NumPy on the full sample.
+        """
+        values = np.random.default_rng(5).exponential(5.0, 20000)
+        stats = RunningStats()
+        histogram = LatencyHistogram()
+        for value in values:
+            stats.add(value)
+            histogram.add(value)
+        self.assertAlmostEqual(stats.mean, np.mean(values), places=9)
+        self.assertAlmostEqual(stats.std(), np.std(values), places=9)
+        for q in (50, 99, 99.9):
+            self.assertAlmostEqual(histogram.percentile(q), np.percentile(values, q), delta=np.percentile(values, q) * 0.02)
+
+    def test_time_binned_metrics_grow_with_time(self):
+        """
+        Test that time bins accumulate per interval and extend past their preallocated size.
+        """
+        bins = TimeBinnedMetrics(('throughput', 'jitter'), bin_width=0.5, num_bins=4)
+        bins.add(0.2, 'throughput', 1)
+        bins.add(0.4, 'throughput', 1)
+        bins.set(10.1, 'jitter', 3.0)
+        self.assertEqual(bins.series('throughput').tolist()[:2], [2, 0])
+        self.assertEqual(len(bins.series('jitter')), 21)
+        self.assertEqual(bins.series('jitter')[20], 3.0)
+
+    def test_vegas_jitter_counters(self):
+        """
+        Test that Vegas jitter and drop rate come out the same from running counters as from the arrival list.
+        """
+        vegas = Vegas()
+        for time in [1.0, 2.5, 2.75, 6.0]:
+            vegas.simulate_packet_arrival(time)
+        vegas.simulate_packet_drop(4)
+        self.assertAlmostEqual(vegas.calculate_jitter(), (1.5 + 0.25 + 3.25) / 3)
+        self.assertAlmostEqual(vegas.calculate_packet_drop_rate(), 1 / 5)
+
+    def test_sweep_is_independent_of_worker_count(self):
+        """
+        Test that a parameter sweep gives identical tables whether it runs in one process or in a pool.
+        """
+        grid = {'scheduler_type': ['FIFO', 'PQ'], 'max_queue_size': [10, 50]}
+        self.assertEqual(len(expand_grid(grid)), 4)
+        serial = run_sweep(grid, {'n': [10], 'm': [2]}, seeds=3, num_events=200, base_seed=4, max_workers=1)
+        pooled = run_sweep(grid, {'n': [10], 'm': [2]}, seeds=3, num_events=200, base_seed=4, max_workers=2)
+        self.assertEqual(serial, pooled)
+        self.assertEqual(len(serial), 4)
+        self.assertEqual(serial[0]['seeds'], 3)
+        # Topology parameters make the traffic multi-hop, so they change the results
+        small, large = run_sweep({'scheduler_type': ['FIFO']}, {'n': [10, 200], 'm': [2]}, seeds=2, num_events=200,
+                                 base_seed=4, max_workers=1)
+        self.assertEqual((small['n'], large['n']), (10, 200))
+        self.assertGreater(large['average_latency_mean'], small['average_latency_mean'])
+
+    def test_confidence_interval(self):
+        """
+        Test the t confidence interval half width against a hand-computed value.
+        """
+        mean, half_width = confidence_interval([1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(mean, 3.0)
+        # t(0.975, 4) = 2.776, standard error = sqrt(2.5 / 5)
+        self.assertAlmostEqual(half_width, 2.776 * (2.5 / 5) ** 0.5, places=2)
+
+    def test_next_hop_table_follows_shortest_paths(self):
+        """
+        Test that walking the next-hop table gives a path as short as networkx's weighted shortest path.
+        """
+        np.random.seed(2)
+        network = Network()
+        network.generate_barabasi_albert_topology(n=40, m=2)
+        next_hops = network.next_hop_table()
+        for source, destination in [(0, 39), (5, 17), (22, 3)]:
+            node, cost = source, 0
+            while node != destination:
+                next_node = int(next_hops[node, destination])
+                cost += network.links[(node, next_node)]['latency']
+                node = next_node
+            expected = nx.shortest_path_length(network.graph, source, destination, weight='latency')
+            self.assertAlmostEqual(cost, expected)
+        self.assertTrue(all(next_hops[node, node] == node for node in range(40)))
+
+    def test_lazy_next_hop_rows_match_dense_table(self):
+        """
+        Test that per-node rows of large networks and the pure-Python fallback agree with the dense next-hop table.
+        """
+        network = Network()
+        network.generate_barabasi_albert_topology(n=300, m=2, seed=3)
+        dense = network.next_hop_table()
+        network.next_hops = {}
+        network.DENSE_NEXT_HOPS = 100
+        lazy = network.next_hop_table()
+        self.assertIsInstance(lazy, LazyNextHops)
+        for node in (0, 17, 299):
+            np.testing.assert_array_equal(lazy.row(node), dense[node])
+        self.assertEqual(len(lazy.rows), 3)
+
+        def path_cost(row_of, source, destination):
+            node, cost = source, 0.0
+            while node != destination:
+                next_node = int(row_of(node)[destination])
+                cost += network.links[(node, next_node)]['latency']
+                node = next_node
+            return cost
+
+        indptr, indices, costs = network._routing_arrays('latency')
+        rows = {}
+
+        def python_row(node):
+            if node not in rows:
+                rows[node] = _python_next_hops(indptr.tolist(), indices.tolist(), costs.tolist(), node)
+            return rows[node]
+
+        for source, destination in [(0, 299), (42, 7), (150, 151)]:
+            self.assertAlmostEqual(path_cost(python_row, source, destination), path_cost(lambda node: dense[node], source, destination))
+        unreachable = compute_next_hops([0, 1, 2, 2], [1, 0], [1.0, 1.0])
+        self.assertEqual(unreachable.tolist(), [[0, 1, -1], [0, 1, -1], [-1, -1, 2]])
+
+    def test_multi_hop_forwarding_delay(self):
+        """
+        Test that a packet crossing a two-link path accumulates transmission, queueing and propagation delay.
+        """
+        simulator = Simulator()
+        simulator.network.load_edges(3, [(0, 1), (1, 2)], bandwidth=[10.0, 10.0], latency=[2.0, 2.0])
+        first = Packet(arrival_time=0.0, source=0, destination=2, size=5.0)
+        second = Packet(arrival_time=0.0, source=0, destination=2, size=5.0)
+        simulator.scheduler.schedule_event(Event("arrival", 0.0, first))
+        simulator.scheduler.schedule_event(Event("arrival", 0.0, second))
+        simulator.run_simulation()
+        self.assertEqual(simulator.departure_count, 2)
+        self.assertEqual((first.node, first.hops), (2, 2))
+        # First packet: 0.5 + 2 on each link. Second waits 0.5 for the first link.
+        self.assertAlmostEqual(simulator.total_latency, 5.0 + 5.5)
+
+    def test_barabasi_albert_edge_arrays(self):
+        """
+        Test that the array-backed Barabasi-Albert generator gives the expected number of distinct edges and a consistent CSR adjacency.
+        """
+        network = Network()
+        network.generate_barabasi_albert_topology(n=500, m=3, seed=4)
+        self.assertEqual(network.number_of_links(), 3 + (500 - 3 - 1) * 3)
+        pairs = {tuple(sorted(edge)) for edge in network.edges.tolist()}
+        self.assertEqual(len(pairs), network.number_of_links())
+        self.assertTrue(all(u != v for u, v in pairs))
+        self.assertEqual(network.graph.number_of_edges(), network.number_of_links())
+        for node in (0, 17, 499):
+            self.assertEqual(sorted(network.neighbors(node).tolist()), sorted(network.graph.neighbors(node)))
+        u, v = network.edges[10].tolist()
+        self.assertEqual(network.links[(u, v)], network.links[(v, u)])
+
+    def test_waxman_topology(self):
+        """
+        Test that Waxman generation is reproducible with a seed and produces roughly the expected number of links.
+        """
+        first, second = Network(), Network()
+        first.generate_waxman_topology(n=300, alpha=0.5, beta=0.2, seed=9)
+        second.generate_waxman_topology(n=300, alpha=0.5, beta=0.2, seed=9)
+        self.assertTrue(np.array_equal(first.edges, second.edges))
+        self.assertTrue(np.array_equal(first.latency, second.latency))
+        for network, n, alpha, beta in ((first, 300, 0.5, 0.2), (Network(), 2000, 0.03, 0.5)):
+            if network is not first:
+                network.generate_waxman_topology(n=n, alpha=alpha, beta=beta, seed=10)
+            positions = network.positions
+            distances = np.sqrt(((positions[:, None, :] - positions[None, :, :]) ** 2).sum(axis=2))
+            probabilities = np.triu(beta * np.exp(-distances / (alpha * distances.max())), k=1)
+            expected = probabilities.sum()
+            self.assertLess(abs(network.number_of_links() - expected), 5 * np.sqrt(expected))
+            self.assertTrue(np.all(network.edges[:, 0] < network.edges[:, 1]))
+            self.assertEqual(len(np.unique(network.edges, axis=0)), len(network.edges))
+            # Short and long links in the proportions the model gives them
+            near = distances[network.edges[:, 0], network.edges[:, 1]] < alpha * distances.max()
+            expected_near = probabilities[(distances < alpha * distances.max())].sum()
+            self.assertLess(abs(near.sum() - expected_near), 5 * np.sqrt(expected_near))
+
+    def test_topology_cache_round_trip(self):
+        """
+        Test that a cached topology is memory-mapped back identical to a freshly generated one, next-hop table included.
+        """
+        fresh = Network()
+        fresh.generate_barabasi_albert_topology(n=60, m=2, seed=5)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first, second = Network(), Network()
+            first.load_topology('barabasi_albert', seed=5, cache_dir=cache_dir, n=60, m=2)
+            first_hops = first.next_hop_table()
+            second.load_topology('barabasi_albert', seed=5, cache_dir=cache_dir, n=60, m=2)
+            self.assertIsInstance(second.edges, np.memmap)
+            self.assertIsInstance(second.next_hop_table(), np.memmap)
+            for network in (first, second):
+                self.assertTrue(np.array_equal(network.edges, fresh.edges))
+                self.assertTrue(np.array_equal(network.latency, fresh.latency))
+            self.assertTrue(np.array_equal(second.next_hop_table(), fresh.next_hop_table()))
+            self.assertTrue(np.array_equal(first_hops, fresh.next_hop_table()))
+            other = Network()
+            other.load_topology('barabasi_albert', seed=6, cache_dir=cache_dir, n=60, m=2)
+            self.assertFalse(np.array_equal(other.edges, fresh.edges))
+
+    def test_imports_are_side_effect_free(self):
+        """
+        Test that importing the simulator modules runs nothing, loads neither networkx nor matplotlib, and starts within the startup budget.
+        """
+        program = "import sys, Simulator, cubic_simulator, sweep, cli; print(sorted(m for m in ('networkx', 'matplotlib') if m in sys.modules))"
+        output = subprocess.run([sys.executable, '-c', program], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+        self.assertLess(cli.measure_startup(), cli.STARTUP_BUDGET)
+
+    def test_cli_run(self):
+        """
+        Test that the run subcommand parses its options, prints metrics for each scheduler and only builds a topology for multi-hop runs.
+        """
+        command = [sys.executable, os.path.abspath(cli.__file__), 'run', '--scheduler', 'FIFO', 'LLQ', '--events', '200', '--seed', '3']
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=directory).stdout
+            self.assertEqual(os.listdir(directory), [])
+            subprocess.run(command + ['--multi-hop', '--nodes', '30'], capture_output=True, check=True, cwd=directory)
+            self.assertEqual(os.listdir(directory), ['.topology_cache'])
+        self.assertIn('FIFO Scheduling Results:', output)
+        self.assertIn('Low Latency Queuing (LLQ) Scheduling Results:', output)
+        args = cli.build_parser().parse_args(['sweep', '--scheduler', 'RR', '--seeds', '4', '--topology', 'waxman'])
+        self.assertEqual((args.scheduler, args.seeds, cli.topology_params(args)), (['RR'], 4, {'n': 10, 'alpha': 0.4, 'beta': 0.1}))
+
+    def test_cli_default_load_keeps_the_link_under_capacity(self):
+        """
+        Test that single-link runs scale processing times to the offered --load, and that --load 0 keeps the overloaded 1-10 range.
+        """
+        low, high = processing_time_for_load(0.9, 20000, 'uniform')
+        self.assertAlmostEqual(20000 / 100 * (low + high) / 2, 0.9)
+        low, high = processing_time_for_load(0.5, 1, 'onoff', rate=4, on_time=1, off_time=3)
+        self.assertAlmostEqual(4 / 4 * (low + high) / 2, 0.5)
+        drop_rates = []
+        for load in ('0.9', '0'):
+            args = cli.build_parser().parse_args(['run', '--scheduler', 'FIFO', '--events', '5000', '--seed', '3', '--load', load])
+            drop_rates.append(cli.run_single(args, 'FIFO').calculate_metrics()[3])
+        self.assertLess(drop_rates[0], 0.01)
+        self.assertGreater(drop_rates[1], 0.9)
+
+    def test_benchmark_suite_and_compare(self):
+        """
+        Test that the benchmark suite reports events per second for each case and that compare flags a slowdown.
+        """
+        cases = benchmark.suite_cases(event_counts=(200,), queue_sizes=(50, 100), queue_scaling_events=200,
+                                      topology_sizes={'barabasi_albert': (100,)}, schedulers=('FIFO',), algorithms=('vegas',),
+                                      event_list_sizes=(100,))
+        report = benchmark.run_suite(cases, isolate=False)
+        self.assertEqual([result['benchmark'] for result in report['results']],
+                         ['simulator', 'simulator', 'fast_fifo', 'flows', 'topology', 'event_list', 'event_list'])
+        self.assertEqual([result.get('queue_type') for result in report['results'][-2:]], ['heap', 'calendar'])
+        self.assertTrue(all(result['events_per_second'] > 0 for result in report['results'][:4] + report['results'][-2:]))
+        slower = {'results': [dict(result, seconds=result['seconds'] * 2) for result in report['results']]}
+        rows = benchmark.compare(report, slower, threshold=0.5)
+        self.assertEqual(len(rows), 7)
+        self.assertTrue(all(regressed for *_, regressed in rows))
+        self.assertFalse(any(regressed for *_, regressed in benchmark.compare(report, report)))
+        scaling = benchmark.benchmark_sweep_scaling((1, 2), points=4, num_events=200)
+        self.assertEqual(list(scaling), [1, 2])
+        self.assertTrue(all(seconds > 0 for seconds in scaling.values()))
+        scaling = benchmark.benchmark_parallel_scaling((1, 2), num_nodes=60, num_events=500)
+        self.assertEqual(list(scaling), ['sequential', 1, 2])
+        self.assertTrue(all(seconds > 0 for seconds in scaling.values()))
+
+    def test_instrumentation_counts_and_detaches(self):
+        """
+        Test that instrumentation counts every event and phase call, and that detaching restores the uninstrumented simulator.
+        """
+        simulator = Simulator(max_queue_size=20, seed=3)
+        simulator.initialize_events(num_events=500)
+        instrumentation = Instrumentation(sample_every=4, series_every=10).attach(simulator)
+        simulator.run_simulation()
+        instrumentation.detach()
+        report = instrumentation.report()
+        self.assertEqual(report['event_counts'], {'arrival': 500, 'departure': simulator.departure_count})
+        self.assertEqual(report['phases']['membership']['calls'], simulator.departure_count * 2)
+        self.assertGreater(report['phases']['metrics']['sampled'], 0)
+        self.assertEqual(len(report['series']['heap_depth']), report['events'] // 10)
+        self.assertTrue(all(line.startswith('run_simulation') for line in instrumentation.folded_stacks()))
+        self.assertNotIn('get_next_event', vars(simulator.scheduler))
+        self.assertNotIn('enqueue', vars(simulator.discipline))
+
+    def test_snapshot_resume_matches_uninterrupted_run(self):
+        """
+        Test that a run paused at a warm-up time, snapshotted and resumed gives exactly the metrics of an uninterrupted run.
+        """
+        def make():
+            simulator = Simulator(max_queue_size=30, scheduler_type='RED', seed=8)
+            simulator.initialize_events(num_events=3000, end=15000)
+            return simulator
+        random.seed(5)
+        reference = make()
+        reference.run_simulation()
+        random.seed(5)
+        simulator = make()
+        simulator.run_simulation(until=5000)
+        self.assertTrue(all(event_time > 5000 for event_time, *_ in simulator.scheduler.events.heap))
+        data = snapshot_bytes(simulator)
+        random.seed(123)  # Restoring the snapshot must also restore the global RNG
+        resumed = fork(data)
+        resumed.run_simulation()
+        self.assertEqual(resumed.calculate_metrics(), reference.calculate_metrics())
+        smaller = fork(data, max_queue_size=5, scheduler_type='FIFO')
+        smaller.run_simulation()
+        self.assertEqual(smaller.arrival_count, 3000)
+        self.assertGreater(smaller.dropped_packets, reference.dropped_packets)
+
+    def test_fork_with_new_scheduler_type_rekeys_the_event_list(self):
+        """
+        Test that forking a FIFO snapshot into PQ switches the scheduler too, so same-instant events run by priority.
+        """
+        simulator = Simulator(max_queue_size=30, scheduler_type='FIFO', seed=4)
+        # Four arrivals per instant, lower priority first in scheduling order
+        simulator.scheduler.schedule_events([Event("arrival", float(i // 4), Packet(float(i // 4), priority=2 - i % 2, processing_time=0.2))
+                                             for i in range(400)])
+        simulator.run_simulation(until=50)
+        data = snapshot_bytes(simulator)
+        forked = fork(data, scheduler_type='PQ')
+        self.assertEqual((forked.scheduler_type, forked.scheduler.scheduler_type), ('PQ', 'PQ'))
+        self.assertIsInstance(forked.discipline, StrictPriorityQueue)
+        self.assertEqual(restore(snapshot_bytes(forked)).scheduler.scheduler_type, 'PQ')
+        self.assertEqual(len(forked.scheduler.events), len(simulator.scheduler.events))
+        keys = []
+        while forked.scheduler.has_events():
+            item = forked.scheduler.events.pop()
+            if item[-1].event_type == 'arrival':
+                keys.append(item[:2])
+        self.assertEqual(keys, sorted(keys))
+        self.assertIn((51.0, 1), keys)
+        self.assertIn((51.0, 2), keys)
+
+    def test_checkpointed_run_resumes(self):
+        """
+        Test that checkpoints are written during a run and that a loaded checkpoint finishes the remaining events.
+        """
+        simulator = Simulator(max_queue_size=20, seed=2)
+        simulator.initialize_events(num_events=1000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            self.assertEqual(simulator.run_simulation(max_events=700), 700)
+            run_with_checkpoints(simulator, path, every_events=200, until=50)
+            checkpoint = load_snapshot(path)
+            self.assertEqual(checkpoint.arrival_count, simulator.arrival_count)
+            run_with_checkpoints(checkpoint, path, every_events=200)
+            self.assertFalse(checkpoint.scheduler.has_events())
+            self.assertEqual(checkpoint.arrival_count, 1000)
+            self.assertEqual(load_snapshot(path).departure_count, checkpoint.departure_count)
+
+    def test_trace_recorder_and_analysis(self):
+        """
+        Test that a recorded trace reproduces the simulator's counts and latency statistics through trace_analysis.
+        """
+        simulator = Simulator(max_queue_size=10, seed=6)
+        simulator.initialize_events(num_events=2000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.trace')
+            simulator.trace = TraceRecorder(path, buffer_size=64, initial_records=16)
+            simulator.run_simulation()
+            simulator.trace.close()
+            trace = Trace(path)
+            summary = trace.summary()[None]
+            self.assertEqual((summary['arrival'], summary['drop'], summary['departure']),
+                             (simulator.arrival_count, simulator.dropped_packets, simulator.departure_count))
+            self.assertEqual(summary['admit'], simulator.departure_count)
+            self.assertAlmostEqual(trace.latencies().sum(), simulator.total_latency)
+            latencies, fractions = trace.latency_cdf()
+            self.assertTrue(np.all(np.diff(latencies) >= 0))
+            self.assertEqual(fractions[-1], 1.0)
+            starts, drops, rate = trace.drop_timeline(bin_width=10)[None]
+            self.assertEqual(drops.sum(), simulator.dropped_packets)
+            self.assertTrue(np.all((rate >= 0) & (rate <= 1)))
+            _, throughput = trace.throughput_timeline(bin_width=10)[None]
+            self.assertAlmostEqual(throughput.sum() * 10, simulator.departure_count)
+            del trace
+
+    def test_trace_recorder_grows_from_empty_and_keeps_many_flows(self):
+        """
+        Test that a trace starting with no room grows as records come, and that flow indices past the int16 range survive.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'flows.trace')
+            recorder = TraceRecorder(path, buffer_size=1000, initial_records=0)
+            for index in range(40000):
+                recorder.record(ARRIVAL, float(index), Packet(float(index), flow_id=f'flow{index}', processing_time=1.0))
+            recorder.close()
+            records, flows = load_records(path)
+            self.assertEqual(len(records), 40000)
+            self.assertEqual(records['flow'].tolist(), list(range(40000)))
+            self.assertEqual(flows[-1], 'flow39999')
+            del records
+
+    def test_streamed_arrivals_match_bulk_loading(self):
+        """
+        Test that a lazy arrival source keeps one pending arrival in the event list and reproduces a bulk-loaded run.
+        """
+        bulk = Simulator(max_queue_size=20, seed=11)
+        bulk.initialize_events(num_events=3000, distribution='poisson', rate=0.2)
+        bulk.run_simulation()
+        streamed = Simulator(max_queue_size=20, seed=11)
+        streamed.add_source(ArrivalSource.synthetic(3000, 'poisson', streamed.rng, chunk_size=3000, rate=0.2))
+        self.assertEqual(len(streamed.scheduler.events), 1)
+        while streamed.run_simulation(max_events=100):
+            self.assertLessEqual(len(streamed.scheduler.events), 2)
+        self.assertEqual(streamed.calculate_metrics(), bulk.calculate_metrics())
+
+    def test_chunked_uniform_arrivals(self):
+        """
+        Test that chunked uniform arrivals come out sorted, inside the interval and evenly spread.
+        """
+        chunks = list(arrival_chunks(20000, 'uniform', np.random.default_rng(1), chunk_size=3000, start=10, end=30))
+        self.assertEqual(len(chunks), 7)
+        times = np.concatenate([chunk[0] for chunk in chunks])
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        self.assertTrue(10 <= times[0] and times[-1] <= 30)
+        counts, _ = np.histogram(times, bins=10, range=(10, 30))
+        self.assertLess(np.abs(counts - 2000).max(), 200)
+
+    def test_trace_replay_source(self):
+        """
+        Test that arrivals replayed from a recorded trace reproduce the recorded run.
+        """
+        original = Simulator(max_queue_size=15, seed=4)
+        original.initialize_events(num_events=1000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'arrivals.trace')
+            original.trace = TraceRecorder(path)
+            original.run_simulation()
+            original.trace.close()
+            replayed = Simulator(max_queue_size=15)
+            replayed.add_source(ArrivalSource.replay(path, chunk_size=128))
+            replayed.run_simulation()
+        self.assertEqual(replayed.calculate_metrics(), original.calculate_metrics())
+
+    def test_cubic_flows_match_scalar_cubic(self):
+        """
+        Test that the vectorized Cubic state follows the scalar Cubic window of every flow.
+        """
+        flows = CubicFlows(3, c=np.array([0.2, 0.4, 0.6]))
+        scalars = [Cubic(c=c) for c in (0.2, 0.4, 0.6)]
+        flows.congestion_event(np.array([0, 2]), 1.0)
+        for index in (0, 2):
+            scalars[index].congestion_event(1.0)
+        for now in (1.5, 2.0, 4.0):
+            windows = flows.update(now).tolist()
+            self.assertEqual(windows, [cubic.update_cwnd(now) for cubic in scalars])
+
+    def test_vegas_flows_match_sequential_rtt_samples(self):
+        """
+        Test that a batch of RTT samples updates each flow as if the samples were applied one at a time.
+        """
+        rng = np.random.default_rng(2)
+        sample_flows = rng.integers(0, 4, 50)
+        rtts = rng.uniform(1, 10, 50)
+        flows = VegasFlows(4)
+        flows.on_rtt_samples(sample_flows, rtts)
+        scalars = [Vegas() for _ in range(4)]
+        for flow, rtt in zip(sample_flows.tolist(), rtts.tolist()):
+            scalars[flow].update_smooth_rtt(rtt)
+        self.assertEqual(flows.base_rtt.tolist(), [vegas.base_rtt for vegas in scalars])
+        np.testing.assert_allclose(flows.smooth_rtt, [vegas.smooth_rtt for vegas in scalars])
+
+    def test_many_flow_simulation(self):
+        """
+        Test that hundreds of flows share the link with their own congestion windows.
+        """
+        simulator = FlowSimulator(max_queue_size=100, num_flows=300, rate=5, capacity=5, seed=6)
+        for flow_id in simulator.flow_ids:
+            simulator.initialize_events(num_events=20, flow_id=flow_id, end=50)
+        simulator.run_simulation(until=10)
+        self.assertGreater(len(set(simulator.cwnd)), 100)
+        simulator.run_simulation()
+        self.assertEqual(sum(simulator.arrival_counts.values()), 6000)
+        self.assertEqual(sum(simulator.departure_counts.values()) + sum(simulator.dropped_packets.values()), 6000)
+        self.assertTrue(all(len(table) == 0 for table in simulator.flows.values()))
+
+    def test_parallel_run_matches_sequential(self):
+        """
+        Test that a partitioned multi-hop run gives the same packet outcomes as the sequential engine.
+        """
+        def traffic():
+            simulator = Simulator(seed=8)
+            simulator.network.generate_barabasi_albert_topology(120, 2, seed=9)
+            simulator.initialize_traffic(num_events=3000, end=20)
+            return simulator
+
+        def run(simulator, **options):
+            owner = partition_nodes(simulator.network, 3)
+            self.assertEqual(sorted(set(owner.tolist())), [0, 1, 2])
+            self.assertGreaterEqual(lookahead(simulator.network, owner), simulator.network.latency.min())
+            return run_parallel(simulator, 3, **options)
+
+        def small_exchange(simulator):
+            # Blocks of one record, so nearly every window overflows into the pipes
+            with mock.patch.object(parallel, 'EXCHANGE_BYTES', 0), mock.patch.object(parallel, 'MIN_RECORDS', 1):
+                return run(simulator, force=True)
+
+        sequential = traffic()
+        sequential.run_simulation()
+        runs = (lambda simulator: run(simulator, processes=False), lambda simulator: run(simulator, force=True),
+                small_exchange)
+        for parallel_run in runs:
+            simulator = traffic()
+            self.assertGreater(parallel_run(simulator), 1)
+            self.assertEqual((simulator.arrival_count, simulator.departure_count, simulator.dropped_packets),
+                             (sequential.arrival_count, sequential.departure_count, sequential.dropped_packets))
+            self.assertEqual(simulator.latency_histogram.counts.tolist(), sequential.latency_histogram.counts.tolist())
+            self.assertEqual(simulator.forwarder.link_free_at, sequential.forwarder.link_free_at)
+            self.assertAlmostEqual(simulator.total_latency, sequential.total_latency, places=6)
+            self.assertAlmostEqual(simulator.latency_stats.std(), sequential.latency_stats.std(), places=9)
+
+        # Too few events to win: run_parallel says so and falls back to the sequential engine
+        simulator = traffic()
+        with self.assertWarnsRegex(RuntimeWarning, 'sequential engine'):
+            self.assertIsNone(run_parallel(simulator, 3))
+        self.assertEqual((simulator.arrival_count, simulator.departure_count, simulator.dropped_packets),
+                         (sequential.arrival_count, sequential.departure_count, sequential.dropped_packets))
+
+    def test_parallel_run_matches_sequential_on_exact_ties(self):
+        """
+        Test that partitions break same-instant ties like the sequential scheduler when every time is an integer.
+        """
+        def traffic(scheduler_type):
+            simulator = Simulator(seed=8, scheduler_type=scheduler_type)
+            network = simulator.network
+            network.generate_barabasi_albert_topology(60, 2, seed=9)
+            rng = np.random.default_rng(10)
+            network.latency = rng.integers(1, 4, len(network.latency)).astype(float)
+            network.bandwidth = np.ones(len(network.bandwidth))
+            times = rng.integers(0, 20, 2000)
+            sources = rng.integers(0, 60, 2000)
+            destinations = (sources + rng.integers(1, 60, 2000)) % 60
+            priorities = rng.integers(1, 3, 2000)
+            events = [Event("arrival", float(time), Packet(float(time), priority=int(priority), processing_time=1.0,
+                                                           source=int(source), destination=int(destination)))
+                      for time, source, destination, priority in zip(times, sources, destinations, priorities)]
+            simulator.scheduler.schedule_events(events, [event.packet.packet_id for event in events])
+            return simulator
+
+        for scheduler_type in ('FIFO', 'PQ'):
+            sequential = traffic(scheduler_type)
+            sequential.run_simulation()
+            for options in ({'processes': False}, {'force': True}):
+                simulator = traffic(scheduler_type)
+                self.assertGreater(run_parallel(simulator, 3, **options), 1)
+                self.assertEqual((simulator.arrival_count, simulator.departure_count, simulator.total_latency),
+                                 (sequential.arrival_count, sequential.departure_count, sequential.total_latency))
+                self.assertEqual(simulator.latency_histogram.counts.tolist(),
+                                 sequential.latency_histogram.counts.tolist())
+                self.assertAlmostEqual(simulator.latency_stats.std(), sequential.latency_stats.std(), places=9)
+                self.assertEqual(simulator.forwarder.link_free_at, sequential.forwarder.link_free_at)
+
+    def test_mser_finds_initial_transient(self):
+        """
+        Test that MSER truncation removes a decaying start-up bias and keeps a stationary series.
+        """
+        rng = np.random.default_rng(0)
+        noise = rng.normal(0, 1, 1000)
+        self.assertEqual(mser_truncation(noise[:900]), 0)
+        transient = np.concatenate([np.linspace(50, 0, 100) + noise[:100], noise[100:]])
+        self.assertTrue(80 <= mser_truncation(transient) <= 120)
+
+    def test_run_until_precise(self):
+        """
+        Test that runs stop once every metric reaches the requested relative confidence half-width.
+        """
+        simulator = Simulator(seed=1)
+        simulator.add_source(ArrivalSource.synthetic(10 ** 6, 'poisson', simulator.rng, rate=0.15))
+        report = run_until_precise(simulator, relative_precision=0.1, slice_width=10.0)
+        self.assertTrue(report['converged'])
+        self.assertLess(report['events'], 10 ** 6)
+        for mean, half_width in report['estimates'].values():
+            self.assertLessEqual(half_width, 0.1 * abs(mean))
+        self.assertAlmostEqual(report['estimates']['throughput'][0], 0.15, delta=0.02)
+
+        def make_simulator(seed):
+            replication = Simulator(seed=seed)
+            replication.initialize_events(num_events=500, distribution='poisson', rate=0.15)
+            return replication
+
+        report = replicate_until_precise(make_simulator, relative_precision=0.1, slice_width=10.0)
+        self.assertTrue(report['converged'])
+        self.assertGreaterEqual(report['replications'], 3)
+
+    def test_fast_fifo_matches_event_driven_run(self):
+        """
+        Test that the closed-form FIFO engine reproduces the event-driven FIFO metrics, with and without drops.
+        """
+        for max_queue_size, distribution, params in ((50, 'poisson', {'rate': 0.15}), (10, 'poisson', {'rate': 0.3}),
+                                                     (5, 'uniform', {'end': 1000}), (None, 'pareto', {'rate': 0.15})):
+            simulator = Simulator(max_queue_size=max_queue_size or 10 ** 9, seed=7)
+            simulator.initialize_events(4000, distribution, **params)
+            simulator.run_simulation()
+            engine = FastFIFO(max_queue_size, scalar_stretch=16)
+            metrics = engine.run(4000, distribution, np.random.default_rng(7), **params)
+            self.assertEqual(engine.dropped_packets, simulator.dropped_packets)
+            self.assertEqual(engine.latency_histogram.counts.tolist(), simulator.latency_histogram.counts.tolist())
+            for fast, event_driven in zip(metrics, simulator.calculate_metrics()):
+                self.assertAlmostEqual(fast, event_driven, places=6)
+
+        times, _, processing_times = generate_arrivals(4000, 'poisson', np.random.default_rng(7), rate=0.3)
+        whole = FastFIFO(10)
+        whole.process(times, processing_times)
+        chunked = FastFIFO(10)
+        for start in range(0, 4000, 300):
+            chunked.process(times[start:start + 300], processing_times[start:start + 300])
+        self.assertEqual(chunked.dropped_packets, whole.dropped_packets)
+        self.assertAlmostEqual(chunked.total_latency, whole.total_latency, places=6)
+
+    def test_fast_fifo_without_queue_room_drops_everything(self):
+        """
+        Test that a zero-size queue drops every arrival, in closed form as in the event-driven run.
+        """
+        simulator = Simulator(max_queue_size=0, scheduler_type='FIFO', seed=2)
+        simulator.initialize_events(num_events=1000, distribution='poisson')
+        simulator.run_simulation()
+        metrics = FastFIFO(0).run(1000, 'poisson', np.random.default_rng(1))
+        self.assertEqual(metrics, simulator.calculate_metrics())
+        self.assertEqual(metrics[3], 1.0)
+
+    def test_named_random_streams(self):
+        """
+        Test that named streams depend only on the seed and their name, and survive pickling mid-block.
+        """
+        first, second = RandomStreams(3, block_size=16), RandomStreams(3, block_size=16)
+        second.stream('other').random()
+        draws = [first.stream('red').random() for _ in range(40)]
+        self.assertEqual([second.stream('red').random() for _ in range(40)], draws)
+        self.assertEqual(first.generator('arrivals/flow1').random(5).tolist(),
+                         second.generator('arrivals/flow1').random(5).tolist())
+        self.assertNotEqual(first.generator('arrivals/flow2').random(), first.generator('arrivals/flow1').random())
+        self.assertEqual(RandomStreams(3).root.random(), np.random.default_rng(3).random())
+        copy = pickle.loads(pickle.dumps(first))
+        self.assertEqual(copy.stream('red').random(), first.stream('red').random())
+
+        random_streams.seed(4)
+        processing_times = [Packet(arrival_time=0.0).processing_time for _ in range(3)]
+        random_streams.seed(4)
+        self.assertEqual([Packet(arrival_time=0.0).processing_time for _ in range(3)], processing_times)
+
+    def test_seeded_topology_does_not_depend_on_earlier_draws(self):
+        """
+        Test that a seeded simulator's generated topology comes from its own streams, whatever ran before it.
+        """
+        def topology(seed):
+            simulator = Simulator(seed=seed)
+            simulator.network.generate_barabasi_albert_topology(50, 2)
+            return simulator.network.edges.copy(), simulator.network.latency.copy()
+
+        first = topology(8)
+        Network().generate_waxman_topology(30)  # Draws from the shared default streams
+        second = topology(8)
+        np.testing.assert_array_equal(first[0], second[0])
+        np.testing.assert_array_equal(first[1], second[1])
+        self.assertFalse(np.array_equal(first[1], topology(9)[1]))
+
+    def test_red_runs_do_not_depend_on_global_random_state(self):
+        """
+        Test that RED drops come from the simulator's own stream and flows keep their arrivals when others are added.
+        """
+        results = []
+        for global_seed in (1, 2):
+            random.seed(global_seed)
+            simulator = Simulator(max_queue_size=30, scheduler_type='RED', seed=8)
+            simulator.initialize_events(num_events=2000, end=8000)
+            simulator.run_simulation()
+            results.append(simulator.calculate_metrics())
+        self.assertEqual(results[0], results[1])
+
+        two, three = FlowSimulator(num_flows=2, seed=5), FlowSimulator(num_flows=3, seed=5)
+        two.initialize_events(num_events=50, flow_id='flow2')
+        three.initialize_events(num_events=30, flow_id='flow3')
+        three.initialize_events(num_events=50, flow_id='flow2')
+        self.assertEqual(sorted(event.time for _, _, event in two.scheduler.events.heap if event.event_type == "arrival"),
+                         sorted(event.time for _, _, event in three.scheduler.events.heap
+                                if event.event_type == "arrival" and event.flow_id == 'flow2'))
+
+    def test_decimation_keeps_extremes_and_order(self):
+        """
+        Test that min/max and LTTB decimation bound the point count, keep time order and endpoints, and min/max keeps spikes.
+        """
+        x = np.arange(100000, dtype=float)
+        y = np.sin(x / 1000) + np.random.default_rng(0).normal(0, 0.1, len(x))
+        y[31337] = 40
+        for method in ('minmax', 'lttb'):
+            times, values = decimate(x, y, 1000, method)
+            self.assertLessEqual(len(times), 1000)
+            self.assertTrue(np.all(np.diff(times) > 0))
+            self.assertEqual((times[0], times[-1]), (0, len(x) - 1))
+            self.assertEqual(values.max(), 40)
+        series = IncrementalSeries(max_points=300)
+        for start in range(0, len(x), 7000):
+            series.extend(x[start:start + 7000], y[start:start + 7000])
+        self.assertLessEqual(len(series.x), 300)
+        self.assertEqual((series.y.min(), series.y.max()), (y.min(), y.max()))
+
+    def test_live_plot_collects_completed_bins(self):
+        """
+        Test that incremental collection during a run ends with the same per-flow series as reading the finished run.
+        """
+        simulator = FlowSimulator(max_queue_size=50, seed=3, rate=100, capacity=100)
+        simulator.initialize_events(num_events=2000, flow_id='flow1', end=400)
+        simulator.initialize_events(num_events=500, flow_id='flow2', end=400)
+        live = LivePlot(simulator, max_points=10 ** 6)
+        for now in range(50, 450, 50):
+            simulator.run_simulation(until=now)
+            live.collect(now)
+            self.assertTrue(all(len(series.x) <= now for series in live.series.values()))
+        simulator.run_simulation()
+        live.collect()
+        final = simulator_series(simulator)
+        for (column, flow_id), series in live.series.items():
+            np.testing.assert_allclose(series.y, final[column][flow_id][1])
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                simulator.write_metrics_to_csv()
+                series = csv_series(['flow1_metrics.csv', 'flow2_metrics.csv'])
+            finally:
+                os.chdir(cwd)
+        times, throughput = series['throughput']['flow1']
+        self.assertEqual(throughput.sum(), simulator.departure_counts['flow1'])
+
+    def test_hierarchical_token_bucket(self):
+        """
+        Test that a link bucket caps its flows, that eligible times are exact and that bursts match one-by-one admission.
+        """
+        shaper = HierarchicalTokenBucket()
+        link = shaper.add_bucket(rate=2, capacity=3)
+        flows = shaper.add_buckets(rate=[1, 4], capacity=[2, 10], parent=link, count=2)
+        self.assertEqual(shaper.paths[flows[1]], (flows[1], link))
+        self.assertEqual([shaper.admit(flows[1], 0.0) for _ in range(4)], [True, True, True, False])
+        self.assertTrue(shaper.admit(flows[0], 0.5))  # Refilled from simulated time, not the host clock
+        eligible = shaper.eligible_time(flows[1], 0.5)
+        self.assertAlmostEqual(eligible, 1.0)
+        self.assertFalse(shaper.admit(flows[1], eligible - 1e-6))
+        self.assertTrue(shaper.admit(flows[1], eligible))
+        self.assertEqual(shaper.eligible_time(flows[0], 1.0, size=5), float('inf'))
+
+        bursts = [([0, 1, 1, 0], 10.0), ([1] * 8 + [0] * 3, 10.5), ([0, 1], 30.0)]
+        batched, sequential = HierarchicalTokenBucket(), HierarchicalTokenBucket()
+        for shaper in (batched, sequential):
+            link = shaper.add_bucket(rate=4, capacity=6)
+            shaper.add_buckets(rate=[1, 3], capacity=[3, 5], parent=link, count=2)
+        for flows, now in bursts:
+            expected = [sequential.admit(flow + 1, now) for flow in flows]
+            self.assertEqual(batched.admit_batch(np.array(flows) + 1, now).tolist(), expected)
+            np.testing.assert_allclose(batched.tokens, sequential.tokens)
+
+    def test_eligible_time_moves_forward_at_large_times(self):
+        """
+        Test that a shortfall too small to move a timestamp near 1e9 still gives a later eligible time that admits.
+        """
+        shaper = HierarchicalTokenBucket()
+        bucket = shaper.add_bucket(rate=1, capacity=1)
+        now = 1e9 + 0.5
+        shaper.tokens[bucket] = 1 - 5e-9
+        shaper.updated[bucket] = now
+        self.assertEqual(now + 5e-9, now)
+        self.assertFalse(shaper.admit(bucket, now))
+        eligible = shaper.eligible_time(bucket, now)
+        self.assertGreater(eligible, now)
+        self.assertTrue(shaper.admit(bucket, eligible))
+
+    def test_shaped_packets_wait_for_tokens(self):
+        """
+        Test that packets short of tokens are delayed to their eligible time instead of dropped.
+        """
+        def run(seed):
+            simulator = FlowSimulator(max_queue_size=1000, num_flows=2, rate=0.5, capacity=2, link_rate=0.8,
+                                      link_capacity=2, seed=seed, cc_params={'max_cwnd': 1000, 'initial_cwnd': 1000},
+                                      shaper_queue_size=1000)
+            for flow_id in simulator.flow_ids:
+                simulator.initialize_events(num_events=100, flow_id=flow_id, end=50)
+            simulator.run_simulation()
+            return simulator
+
+        simulator = run(4)
+        self.assertEqual(sum(simulator.dropped_packets.values()), 0)
+        self.assertEqual(sum(simulator.departure_counts.values()), 200)
+        self.assertFalse(simulator.shaped)
+        # 200 packets through a link shaped to 0.8 per unit of time, after a burst of 2
+        self.assertGreaterEqual(max(simulator.simulation_end_times.values()), (200 - 2) / 0.8)
+        self.assertEqual(run(4).total_latencies, simulator.total_latencies)
+
+    def test_same_instant_arrivals_are_shaped_in_one_batch(self):
+        """
+        Test that arrivals sharing an instant are charged through admit_batch with exactly the outcome of one admit per packet.
+        """
+        def run(batched):
+            simulator = FlowSimulator(max_queue_size=20, num_flows=10, rate=1, capacity=3, link_rate=6, link_capacity=12,
+                                      seed=2, cc_params={'max_cwnd': 1000, 'initial_cwnd': 1000}, shaper_queue_size=5)
+            simulator.scheduler.schedule_events([
+                Event("arrival", float(t), Packet(float(t), flow_id=flow_id, processing_time=0.3), flow_id=flow_id)
+                for t in range(30) for flow_id in simulator.flow_ids for _ in range(2)])
+            with mock.patch.object(simulator.shaper, 'admit_batch', wraps=simulator.shaper.admit_batch) as admit_batch:
+                if batched:
+                    simulator.run_simulation()
+                else:
+                    with mock.patch.object(simulator.scheduler, 'next_at', return_value=None):
+                        simulator.run_simulation()
+            return simulator, admit_batch.call_count
+
+        batched, calls = run(True)
+        single, single_calls = run(False)
+        self.assertGreater(calls, 0)
+        self.assertGreater(sum(batched.dropped_packets.values()), 0)
+        for name in ('arrival_counts', 'departure_counts', 'dropped_packets', 'total_latencies'):
+            self.assertEqual(getattr(batched, name), getattr(single, name))
+        self.assertEqual(batched.shaper.tokens.tolist(), single.shaper.tokens.tolist())
+
+    def test_result_cache_round_trip_and_eviction(self):
+        """
+        Test that cached runs come back identical, that keys follow the config and that the least recently used entry goes first.
+        """
+        def run(seed):
+            simulator = FlowSimulator(max_queue_size=50, seed=seed)
+            for flow_id in simulator.flow_ids:
+                simulator.initialize_events(num_events=300, flow_id=flow_id, end=100)
+            simulator.run_simulation()
+            return simulator
+
+        config = {'simulator': 'cubic', 'events': 300, 'seed': np.random.SeedSequence(7).spawn(2)[1]}
+        self.assertEqual(run_key(config), run_key(dict(config)))
+        self.assertNotEqual(run_key(config), run_key(dict(config, seed=np.random.SeedSequence(7).spawn(2)[0])))
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+            calls = []
+            first = cache.cached(config, lambda: calls.append(1) or simulator_result(run(5)))
+            second = cache.cached(config, lambda: calls.append(1) or simulator_result(run(5)))
+            self.assertEqual(len(calls), 1)
+            expected = run(5)
+            restored = restore_flows(FlowSimulator(max_queue_size=50, seed=5), second)
+            self.assertEqual(restored.departure_counts, expected.departure_counts)
+            self.assertEqual(restored.total_latencies, expected.total_latencies)
+            self.assertEqual(restored.metrics_per_second, expected.metrics_per_second)
+
+            size = os.path.getsize(cache._path(config))
+            cache.max_bytes = 2 * size + size // 2
+            cache.put({'seed': 1}, first)
+            os.utime(cache._path(config), ns=(0, 0))
+            cache.get(config)  # A hit makes it the most recently used
+            cache.put({'seed': 2}, first)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get({'seed': 1}))
+            self.assertIsNotNone(cache.get(config))
+
+    def test_cached_sweep_matches_uncached(self):
+        """
+        Test that a sweep sharing a result cache across workers gives the same table and reruns nothing the second time.
+        """
+        grid = {'scheduler_type': ['FIFO', 'RR'], 'max_queue_size': [10]}
+        uncached = run_sweep(grid, {'n': [10], 'm': [2]}, seeds=2, num_events=200, base_seed=4, max_workers=1)
+        with tempfile.TemporaryDirectory() as directory:
+            pooled = run_sweep(grid, {'n': [10], 'm': [2]}, seeds=2, num_events=200, base_seed=4, max_workers=2,
+                               cache_dir=directory)
+            self.assertEqual(len(ResultCache(directory)), 4)
+            cached = run_sweep(grid, {'n': [10], 'm': [2]}, seeds=2, num_events=200, base_seed=4, max_workers=1,
+                               cache_dir=directory)
+            self.assertEqual(len(ResultCache(directory)), 4)
+            command = [sys.executable, cli.__file__, 'run', '--scheduler', 'FIFO', '--events', '200', '--seed', '3']
+            outputs = [subprocess.run(command + extra, capture_output=True, text=True, check=True).stdout
+                       for extra in ([], ['--cache', directory], ['--cache', directory])]
+            self.assertEqual(len(ResultCache(directory)), 5)
+        self.assertEqual(uncached, pooled)
+        self.assertEqual(uncached, cached)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
 if __name__ == '__main__':
     unittest.main()
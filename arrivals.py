@@ -0,0 +1,178 @@
+import gc
+from contextlib import contextmanager
+
+import numpy as np
+
+from packet_trace import ARRIVAL, load_records
+
+
+# Bulk arrival generation. Everything is drawn as NumPy arrays in one go and
+# returned sorted by arrival time, ready to be loaded into the event calendar
+# in a single heapify/merge. For runs too large to hold every arrival at once,
+# ArrivalSource streams the same processes chunk by chunk instead.
+
+DISTRIBUTIONS = ('uniform', 'poisson', 'onoff', 'pareto')
+
+
+@contextmanager
+def gc_paused():
+    # Creating millions of packets and events back to back sets off repeated
+    # full cyclic collections that free nothing; hold them off during bulk loads.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def uniform_times(rng, num_events, start=0.0, end=100.0):
+    # Arrival instants spread uniformly over [start, end), as the simulators
+    # have always done.
+    return np.sort(rng.uniform(start, end, num_events))
+
+
+def poisson_times(rng, num_events, rate=10.0, start=0.0):
+    return start + np.cumsum(rng.exponential(1.0 / rate, num_events))
+
+
+def pareto_times(rng, num_events, rate=10.0, shape=1.5, start=0.0):
+    # Heavy-tailed inter-arrival gaps with mean 1/rate (needs shape > 1)
+    if shape <= 1:
+        raise ValueError("Pareto shape must be greater than 1 for a finite mean")
+    scale = (shape - 1) / (shape * rate)
+    gaps = (rng.pareto(shape, num_events) + 1) * scale
+    return start + np.cumsum(gaps)
+
+
+def onoff_times(rng, num_events, rate=10.0, on_time=1.0, off_time=1.0, start=0.0):
+    # Poisson arrivals at `rate` during exponentially distributed on periods,
+    # silence during off periods. Arrivals are first laid out on a clock that
+    # only runs while the source is on, then shifted by the off time that
+    # elapsed before their on period.
+    on_clock = np.cumsum(rng.exponential(1.0 / rate, num_events))
+    horizon = on_clock[-1] if num_events else 0.0
+    periods = max(16, int(horizon / on_time * 1.25) + 1)
+    on_periods = rng.exponential(on_time, periods)
+    while on_periods.sum() <= horizon:
+        on_periods = np.concatenate([on_periods, rng.exponential(on_time, periods)])
+    off_periods = rng.exponential(off_time, len(on_periods))
+    period_ends = np.cumsum(on_periods)
+    period = np.searchsorted(period_ends, on_clock, side='right')
+    off_before = np.concatenate([[0.0], np.cumsum(off_periods)])[period]
+    return start + on_clock + off_before
+
+
+def generate_arrivals(num_events, distribution='uniform', rng=None, priorities=(1, 2), processing_time=(1, 10), **params):
+    # Returns (arrival_times, priorities, processing_times), sorted by arrival time.
+    # params are passed to the chosen inter-arrival distribution.
+    if rng is None:
+        rng = np.random.default_rng()
+    if distribution == 'uniform':
+        times = uniform_times(rng, num_events, **params)
+    elif distribution == 'poisson':
+        times = poisson_times(rng, num_events, **params)
+    elif distribution == 'pareto':
+        times = pareto_times(rng, num_events, **params)
+    elif distribution == 'onoff':
+        times = onoff_times(rng, num_events, **params)
+    else:
+        raise ValueError(f"Unknown arrival distribution: {distribution}")
+    packet_priorities = rng.integers(priorities[0], priorities[1] + 1, num_events)
+    processing_times = rng.uniform(processing_time[0], processing_time[1], num_events)
+    return times, packet_priorities, processing_times
+
+
+TIME_FUNCTIONS = {'poisson': poisson_times, 'pareto': pareto_times, 'onoff': onoff_times}
+
+
+def mean_arrival_rate(num_events, distribution='uniform', start=0.0, end=100.0, rate=10.0, on_time=1.0, off_time=1.0,
+                      **params):
+    # Long-run arrivals per unit time of generate_arrivals with these parameters
+    if distribution == 'uniform':
+        return num_events / (end - start)
+    if distribution == 'onoff':
+        return rate * on_time / (on_time + off_time)
+    if distribution in TIME_FUNCTIONS:
+        return rate
+    raise ValueError(f"Unknown arrival distribution: {distribution}")
+
+
+def processing_time_for_load(load, num_events, distribution='uniform', processing_time=(1, 10), **params):
+    # processing_time range scaled so that one link serving these arrivals is
+    # offered `load` (arrival rate times mean processing time)
+    mean = (processing_time[0] + processing_time[1]) / 2
+    scale = load / (mean_arrival_rate(num_events, distribution, **params) * mean)
+    return processing_time[0] * scale, processing_time[1] * scale
+
+
+def arrival_chunks(num_events, distribution='uniform', rng=None, chunk_size=65536, priorities=(1, 2),
+                   processing_time=(1, 10), **params):
+    # generate_arrivals in chunks of at most chunk_size arrivals. Renewal
+    # processes continue from the last arrival of the previous chunk (for
+    # on/off that is exact because on periods are memoryless); uniform
+    # arrivals are drawn as ascending order statistics so no chunk needs the
+    # others. With chunk_size >= num_events, non-uniform draws match
+    # generate_arrivals exactly.
+    if rng is None:
+        rng = np.random.default_rng()
+    if distribution != 'uniform' and distribution not in TIME_FUNCTIONS:
+        raise ValueError(f"Unknown arrival distribution: {distribution}")
+    start = params.pop('start', 0.0)
+    end = params.pop('end', 100.0) if distribution == 'uniform' else None
+    log_remaining = 0.0  # log(1 - U) of the last uniform order statistic drawn
+    drawn = 0
+    while drawn < num_events:
+        size = min(chunk_size, num_events - drawn)
+        if distribution == 'uniform':
+            # 1 - U(k) is the product of V_i ** (1 / (n - i)) over i < k
+            steps = np.log1p(-rng.random(size)) / (num_events - np.arange(drawn, drawn + size))
+            log_fractions = log_remaining + np.cumsum(steps)
+            log_remaining = log_fractions[-1]
+            times = start + (end - start) * -np.expm1(log_fractions)
+        else:
+            times = TIME_FUNCTIONS[distribution](rng, size, start=start, **params)
+            start = times[-1]
+        packet_priorities = rng.integers(priorities[0], priorities[1] + 1, size)
+        processing_times = rng.uniform(processing_time[0], processing_time[1], size)
+        yield times, packet_priorities, processing_times
+        drawn += size
+
+
+def trace_chunks(path, flow_id=None, chunk_size=65536):
+    # Arrivals replayed from a packet_trace file, read through the memory
+    # map one slice at a time
+    records, flows = load_records(path)
+    flow = None if flow_id is None else flows.index(flow_id)
+    for begin in range(0, len(records), chunk_size):
+        block = records[begin:begin + chunk_size]
+        mask = block['kind'] == ARRIVAL
+        if flow is not None:
+            mask &= block['flow'] == flow
+        block = block[mask]
+        if len(block):
+            yield block['time'], block['priority'], block['value']
+
+
+class ArrivalSource:
+    # One flow's arrivals as a lazy stream of (time, priority, processing_time).
+    # Simulators pull the next arrival only when the previous one is processed,
+    # so the event list holds one pending arrival per source.
+    def __init__(self, chunks, flow_id=None):
+        self.flow_id = flow_id
+        self.arrivals = (arrival
+                         for times, priorities, processing_times in chunks
+                         for arrival in zip(times.tolist(), priorities.tolist(), processing_times.tolist()))
+
+    def next_arrival(self):
+        return next(self.arrivals, None)
+
+    @classmethod
+    def synthetic(cls, num_events, distribution='uniform', rng=None, flow_id=None, chunk_size=65536, **params):
+        return cls(arrival_chunks(num_events, distribution, rng, chunk_size, **params), flow_id)
+
+    @classmethod
+    def replay(cls, path, flow_id=None, trace_flow=None, chunk_size=65536):
+        # trace_flow picks one flow of the recorded trace; flow_id labels the replayed packets
+        return cls(trace_chunks(path, trace_flow, chunk_size), flow_id)
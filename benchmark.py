@@ -0,0 +1,409 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from event import Event
+from packet import Packet
+from queue_discipline import make_discipline
+
+
+class BenchmarkPacket:
+    def __init__(self, priority, processing_time):
+        self.priority = priority
+        self.processing_time = processing_time
+
+
+def benchmark_disciplines(scheduler_types=('FIFO', 'PQ', 'RR', 'WFQ', 'LLQ'), depths=(10, 100, 1000, 10000, 100000),
+                          operations=50000, num_classes=8, quantum=5):
+    # Fill each discipline to a fixed depth, then time enqueue+dequeue pairs so
+    # the backlog stays at that depth. Returns ns per packet keyed by
+    # (scheduler_type, depth).
+    rng = random.Random(1)
+    packets = [BenchmarkPacket(rng.randint(1, num_classes), rng.uniform(1, 10)) for _ in range(max(depths) + operations)]
+    results = {}
+    for scheduler_type in scheduler_types:
+        for depth in depths:
+            discipline = make_discipline(scheduler_type, quantum=quantum, max_queue_size=depth)
+            for packet in packets[:depth]:
+                discipline.enqueue(packet, packet.priority)
+            start = time.perf_counter()
+            for packet in packets[depth:depth + operations]:
+                discipline.enqueue(packet, packet.priority)
+                discipline.dequeue()
+            elapsed = time.perf_counter() - start
+            results[(scheduler_type, depth)] = elapsed / operations * 1e9
+    return results
+
+
+def benchmark_event_lists(queue_types=('heap', 'calendar'), sizes=(100, 1000, 10000, 100000, 1000000), operations=100000):
+    # The hold model: fill the event list to a fixed size, then time pop + push
+    # pairs where each pushed event lands an exponential gap after the popped
+    # one. Returns ns per pair keyed by (queue_type, size).
+    from calendar_queue import make_event_queue
+
+    results = {}
+    for queue_type in queue_types:
+        for size in sizes:
+            rng = random.Random(1)
+            queue = make_event_queue(queue_type)
+            queue.extend((rng.expovariate(1.0) * size, sequence) for sequence in range(size))
+            gaps = [rng.expovariate(1.0) * size for _ in range(operations)]
+            sequence = size
+            start = time.perf_counter()
+            for gap in gaps:
+                item = queue.pop()
+                sequence += 1
+                queue.push((item[0] + gap, sequence))
+            results[(queue_type, size)] = (time.perf_counter() - start) / operations * 1e9
+    return results
+
+
+def benchmark_sweep_scaling(worker_counts=None, points=64, num_events=20000):
+    # Wall time of one sweep of `points` independent runs (FIFO, single link
+    # at load 0.9) with each number of pool workers, by default powers of two
+    # up to the CPU count. Returns {workers: seconds}; speedup is
+    # seconds[1] / seconds[workers].
+    import os
+
+    from arrivals import processing_time_for_load
+    from sweep import run_sweep
+
+    if worker_counts is None:
+        cpus = os.cpu_count() or 1
+        worker_counts = [1 << power for power in range(cpus.bit_length()) if 1 << power <= cpus]
+        if worker_counts[-1] != cpus:
+            worker_counts.append(cpus)
+    arrival_args = {'processing_time': processing_time_for_load(0.9, num_events), 'end': 100.0}
+    results = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        run_sweep({'scheduler_type': ['FIFO']}, seeds=points, num_events=num_events, max_workers=workers,
+                  arrival_args=arrival_args)
+        results[workers] = time.perf_counter() - start
+    return results
+
+
+def benchmark_parallel_scaling(partition_counts=None, num_nodes=10000, num_events=200000, end=100.0):
+    # Wall time of one multi-hop run (num_events packets over a num_nodes
+    # Barabasi-Albert topology, m=2) through run_simulation and through
+    # parallel.run_parallel with each number of partitions, by default powers
+    # of two up to the usable CPUs. The next-hop table is built before timing
+    # starts. Returns {'sequential': seconds, partitions: seconds, ...}.
+    from parallel import run_parallel, usable_cpus
+    from Simulator import Simulator
+
+    if partition_counts is None:
+        cpus = usable_cpus()
+        partition_counts = [1 << power for power in range(cpus.bit_length()) if 1 << power <= cpus]
+        if partition_counts[-1] != cpus:
+            partition_counts.append(cpus)
+
+    def traffic():
+        simulator = Simulator(seed=1)
+        simulator.network.generate_barabasi_albert_topology(num_nodes, 2, seed=1)
+        simulator.initialize_traffic(num_events=num_events, end=end)
+        return simulator
+
+    results = {}
+    simulator = traffic()
+    start = time.perf_counter()
+    simulator.run_simulation()
+    results['sequential'] = time.perf_counter() - start
+    for partitions in partition_counts:
+        simulator = traffic()
+        start = time.perf_counter()
+        run_parallel(simulator, partitions, force=True)
+        results[partitions] = time.perf_counter() - start
+    return results
+
+
+class DictPacket:
+    # The pre-__slots__ layout of packet.Packet and event.Event, for comparison
+    def __init__(self, arrival_time, priority, flow_id, processing_time):
+        self.arrival_time = arrival_time
+        self.processing_time = processing_time
+        self.priority = priority
+        self.flow_id = flow_id
+
+
+class DictEvent:
+    def __init__(self, event_type, time, packet=None, flow_id=None):
+        self.event_type = event_type
+        self.time = time
+        self.packet = packet
+        self.flow_id = flow_id
+
+
+def benchmark_event_memory(num_events=100000):
+    # Bytes and allocated blocks per pending arrival (packet + event + event
+    # list entry) for the dict-based and the slotted layouts.
+    rng = random.Random(1)
+    draws = [(rng.uniform(0, 100), rng.randint(1, 2), rng.uniform(1, 10)) for _ in range(num_events)]
+    results = {}
+    for layout, packet_class, event_class in (('dict', DictPacket, DictEvent), ('slots', Packet, Event)):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        entries = [(time, sequence, event_class("arrival", time, packet_class(time, priority, 'flow1', processing_time), 'flow1'))
+                   for sequence, (time, priority, processing_time) in enumerate(draws)]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        results[layout] = {
+            'bytes_per_event': sum(stat.size_diff for stat in stats) / num_events,
+            'blocks_per_event': sum(stat.count_diff for stat in stats) / num_events,
+        }
+        del entries
+    return results
+
+
+SCHEDULER_MODES = ('FIFO', 'PQ', 'RR', 'LLQ')
+FLOW_ALGORITHMS = ('cubic', 'vegas')
+EVENT_COUNTS = (1000, 10000, 100000, 1000000, 10000000)
+QUEUE_SIZES = (50, 500, 2000, 10000)
+QUEUE_SCALING_EVENTS = 100000
+EVENT_LIST_SIZES = (100, 10000, 1000000)
+TOPOLOGY_SIZES = {'barabasi_albert': (1000, 10000, 100000), 'waxman': (1000, 5000)}
+QUICK = {'event_counts': (1000, 10000), 'queue_sizes': (50, 1000), 'queue_scaling_events': 10000,
+         'topology_sizes': {'barabasi_albert': (1000,), 'waxman': (500,)}, 'event_list_sizes': (100, 10000)}
+
+
+def _peak_rss():
+    # Peak resident set size of this process in bytes (ru_maxrss is KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def bench_simulator(scheduler_type, num_events, max_queue_size):
+    from Simulator import Simulator
+
+    # Arrivals spread so the offered load is about 1.1 of the link capacity,
+    # which keeps the queue near max_queue_size instead of dropping everything
+    simulator = Simulator(max_queue_size=max_queue_size, scheduler_type=scheduler_type, seed=1)
+    start = time.perf_counter()
+    simulator.initialize_events(num_events=num_events, end=num_events * 5)
+    simulator.run_simulation()
+    seconds = time.perf_counter() - start
+    return seconds, simulator.arrival_count + simulator.departure_count
+
+
+def bench_fast_fifo(num_events, max_queue_size):
+    import numpy as np
+    from fast_fifo import FastFIFO
+
+    # The FIFO simulator case above, computed in closed form
+    engine = FastFIFO(max_queue_size)
+    start = time.perf_counter()
+    engine.run(num_events, rng=np.random.default_rng(1), end=num_events * 5)
+    seconds = time.perf_counter() - start
+    return seconds, engine.arrival_count + engine.departure_count
+
+
+def bench_flows(algo, num_events, max_queue_size):
+    from cubic_simulator import Simulator
+
+    simulator = Simulator(max_queue_size=max_queue_size, scheduler_type='RR', algo=algo, seed=1)
+    start = time.perf_counter()
+    simulator.initialize_events(num_events=num_events, flow_id='flow1', end=num_events * 5)
+    simulator.initialize_events(num_events=num_events // 100, flow_id='flow2', end=num_events * 5)
+    simulator.run_simulation()
+    seconds = time.perf_counter() - start
+    return seconds, sum(simulator.arrival_counts.values()) + sum(simulator.departure_counts.values())
+
+
+def bench_event_list(queue_type, size, operations=100000):
+    seconds = benchmark_event_lists((queue_type,), (size,), operations)[(queue_type, size)] * operations / 1e9
+    return seconds, operations
+
+
+def bench_topology(generator, n):
+    from network import Network
+
+    params = {'n': n, 'm': 3} if generator == 'barabasi_albert' else {'n': n}
+    network = Network()
+    start = time.perf_counter()
+    getattr(network, f'generate_{generator}_topology')(seed=1, **params)
+    return time.perf_counter() - start, network.number_of_links()
+
+
+BENCHMARKS = {'simulator': bench_simulator, 'fast_fifo': bench_fast_fifo, 'flows': bench_flows, 'topology': bench_topology,
+              'event_list': bench_event_list}
+
+
+def run_case(case):
+    # Runs one benchmark case and records its wall time, throughput and the
+    # growth of peak RSS over the process's state before the case started
+    kind, params = case
+    rss_before = _peak_rss()
+    seconds, count = BENCHMARKS[kind](**params)
+    result = {'benchmark': kind, **params, 'seconds': seconds, 'peak_rss_growth_bytes': _peak_rss() - rss_before}
+    if kind == 'topology':
+        result['links'] = count
+    else:
+        result['events'] = count
+        result['events_per_second'] = count / seconds if seconds > 0 else float('inf')
+        result['bytes_per_event'] = result['peak_rss_growth_bytes'] / count if count else 0
+    return result
+
+
+def suite_cases(event_counts=EVENT_COUNTS, queue_sizes=QUEUE_SIZES, queue_scaling_events=QUEUE_SCALING_EVENTS,
+                topology_sizes=TOPOLOGY_SIZES, schedulers=SCHEDULER_MODES, algorithms=FLOW_ALGORITHMS,
+                event_list_sizes=EVENT_LIST_SIZES):
+    # Two scaling curves per mode: event count at the default queue size, and
+    # queue size at a fixed event count; plus topology generation by size and
+    # heap against calendar queue by number of pending events
+    cases = []
+    for scheduler_type in schedulers:
+        for num_events in event_counts:
+            cases.append(('simulator', {'scheduler_type': scheduler_type, 'num_events': num_events, 'max_queue_size': queue_sizes[0]}))
+        for max_queue_size in queue_sizes[1:]:
+            cases.append(('simulator', {'scheduler_type': scheduler_type, 'num_events': queue_scaling_events, 'max_queue_size': max_queue_size}))
+    if 'FIFO' in schedulers:
+        for num_events in event_counts:
+            cases.append(('fast_fifo', {'num_events': num_events, 'max_queue_size': queue_sizes[0]}))
+    for algo in algorithms:
+        for num_events in event_counts:
+            cases.append(('flows', {'algo': algo, 'num_events': num_events, 'max_queue_size': queue_sizes[0]}))
+    for generator, sizes in topology_sizes.items():
+        for n in sizes:
+            cases.append(('topology', {'generator': generator, 'n': n}))
+    for queue_type in ('heap', 'calendar'):
+        for size in event_list_sizes:
+            cases.append(('event_list', {'queue_type': queue_type, 'size': size}))
+    return cases
+
+
+def run_suite(cases, isolate=True, progress=None):
+    # With isolate=True every case runs in a fresh process, so peak RSS and
+    # allocator state are not inherited from earlier cases
+    results = []
+    if isolate:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(run_case, cases):
+                results.append(result)
+                if progress:
+                    progress(result)
+    else:
+        for case in cases:
+            results.append(run_case(case))
+            if progress:
+                progress(results[-1])
+    import numpy
+    meta = {'python': platform.python_version(), 'numpy': numpy.__version__, 'machine': platform.machine(),
+            'platform': platform.platform(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def case_key(result):
+    return tuple((name, result[name]) for name in ('benchmark', 'scheduler_type', 'algo', 'generator', 'queue_type', 'num_events',
+                                                   'max_queue_size', 'n', 'size')
+                 if name in result)
+
+
+def compare(baseline, current, threshold=0.1):
+    # Matches cases by their parameters and returns rows of (key, baseline
+    # seconds, current seconds, ratio, regressed); ratio > 1 means slower
+    baseline_by_key = {case_key(result): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = case_key(result)
+        if key not in baseline_by_key:
+            continue
+        before, after = baseline_by_key[key]['seconds'], result['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        rows.append((key, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def describe(key):
+    return ' '.join(f'{name}={value}' for name, value in key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulator benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    run = subparsers.add_parser('run', help='Run the benchmark suite and write JSON results')
+    run.add_argument('--output', default='bench_results.json')
+    run.add_argument('--quick', action='store_true', help='Small event counts and topologies only')
+    run.add_argument('--schedulers', nargs='+', default=list(SCHEDULER_MODES))
+    run.add_argument('--algorithms', nargs='+', default=list(FLOW_ALGORITHMS))
+    run.add_argument('--no-isolate', action='store_true', help='Run all cases in this process')
+    scaling = subparsers.add_parser('scaling', help='Time one sweep with growing numbers of pool workers')
+    scaling.add_argument('--workers', nargs='+', type=int, help='Worker counts (default: powers of two up to the CPU count)')
+    scaling.add_argument('--points', type=int, default=64, help='Runs in the sweep')
+    scaling.add_argument('--events', type=int, default=20000, help='Arrivals per run')
+    parallel = subparsers.add_parser('parallel', help='Time one multi-hop run sequentially and across partitions')
+    parallel.add_argument('--partitions', nargs='+', type=int, help='Partition counts (default: powers of two up to the CPU count)')
+    parallel.add_argument('--nodes', type=int, default=10000, help='Topology size')
+    parallel.add_argument('--events', type=int, default=200000, help='Packets injected')
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files and fail on regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown, 0.1 = 10%%')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        cases = suite_cases(schedulers=args.schedulers, algorithms=args.algorithms, **(QUICK if args.quick else {}))
+        report = run_suite(cases, isolate=not args.no_isolate,
+                           progress=lambda result: print(f"{describe(case_key(result)):<78} {result['seconds']:.3f}s", flush=True))
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+        return 0
+    if args.command == 'scaling':
+        import os
+
+        results = benchmark_sweep_scaling(args.workers, args.points, args.events)
+        print(f"{args.points} runs of {args.events} events on {os.cpu_count()} CPUs")
+        for workers, seconds in results.items():
+            speedup = results[min(results)] * min(results) / seconds
+            print(f"{workers:>4} workers {seconds:8.2f}s  speedup {speedup:5.2f}  efficiency {speedup / workers:5.0%}")
+        return 0
+    if args.command == 'parallel':
+        from parallel import usable_cpus
+
+        results = benchmark_parallel_scaling(args.partitions, args.nodes, args.events)
+        sequential = results.pop('sequential')
+        print(f"{args.events} packets over {args.nodes} nodes on {usable_cpus()} usable CPUs")
+        print(f"  sequential {sequential:8.2f}s")
+        for partitions, seconds in results.items():
+            speedup = sequential / seconds
+            print(f"{partitions:>4} partitions {seconds:8.2f}s  speedup {speedup:5.2f}  efficiency {speedup / partitions:5.0%}")
+        return 0
+    if args.command == 'compare':
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        rows = compare(baseline, current, args.threshold)
+        for key, before, after, ratio, regressed in rows:
+            print(f"{describe(key):<78} {before:9.3f}s {after:9.3f}s {ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+        return 1 if any(row[-1] for row in rows) else 0
+
+    # No subcommand: the queue discipline and event layout microbenchmarks
+    for layout, numbers in benchmark_event_memory().items():
+        print(f"{layout:<6} {numbers['bytes_per_event']:.0f} bytes/event, {numbers['blocks_per_event']:.1f} allocations/event")
+
+    depths = (10, 100, 1000, 10000, 100000)
+    results = benchmark_disciplines(depths=depths)
+    print("ns per packet (enqueue + dequeue) by queue depth")
+    print(f"{'scheduler':<10}" + "".join(f"{depth:>10}" for depth in depths))
+    for scheduler_type in ('FIFO', 'PQ', 'RR', 'WFQ', 'LLQ'):
+        print(f"{scheduler_type:<10}" + "".join(f"{results[(scheduler_type, depth)]:>10.0f}" for depth in depths))
+
+    sizes = (100, 1000, 10000, 100000, 1000000)
+    results = benchmark_event_lists(sizes=sizes)
+    print("ns per event (pop + push) by pending events")
+    print(f"{'event list':<10}" + "".join(f"{size:>10}" for size in sizes))
+    for queue_type in ('heap', 'calendar'):
+        print(f"{queue_type:<10}" + "".join(f"{results[(queue_type, size)]:>10.0f}" for size in sizes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
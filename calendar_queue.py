@@ -0,0 +1,162 @@
+import heapq
+from bisect import insort
+
+
+# Future-event lists used by scheduler.Scheduler. Items are tuples whose first
+# element is the event time; the remaining elements break ties, so two queues
+# fed the same items hand them back in exactly the same order.
+
+
+class BinaryHeap:
+    def __init__(self):
+        self.heap = []
+
+    def push(self, item):
+        heapq.heappush(self.heap, item)
+
+    def extend(self, items):
+        # Bulk load: one O(n) heapify instead of n pushes
+        self.heap.extend(items)
+        heapq.heapify(self.heap)
+
+    def pop(self):
+        if self.heap:
+            return heapq.heappop(self.heap)
+        return None
+
+    def peek(self):
+        if self.heap:
+            return self.heap[0]
+        return None
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class CalendarQueue:
+    # Brown's calendar queue: a ring of buckets ("days") of equal width, each
+    # holding a short sorted list. Enqueue and dequeue touch one bucket, and
+    # the ring is resized (and the day width re-estimated) whenever the
+    # population doubles or halves. A resize is O(n): items are dealt into
+    # their new buckets and only each bucket is sorted. While the width
+    # estimate keeps buckets at a few items, both operations are amortized
+    # O(1); a bucket that many events pile into costs O(its length) instead.
+    # Buckets are lists rather than deques: with about two items each,
+    # pop(0) moves a pointer or two, while an empty deque takes 760 bytes
+    # against a list's 56 and made a million-event calendar slower.
+
+    MIN_BUCKETS = 2
+    SAMPLE_SIZE = 25
+
+    def __init__(self, num_buckets=2, width=1.0):
+        self.size = 0
+        self._setup(max(num_buckets, self.MIN_BUCKETS), width)
+        self.current_day = 0
+
+    def _setup(self, num_buckets, width):
+        self.num_buckets = num_buckets
+        self.width = width
+        self.buckets = [[] for _ in range(num_buckets)]
+        self.grow_threshold = 2 * num_buckets
+        self.shrink_threshold = num_buckets // 2 - 2
+
+    def _day(self, time):
+        return int(time // self.width)
+
+    def push(self, item):
+        day = self._day(item[0])
+        insort(self.buckets[day % self.num_buckets], item)
+        self.size += 1
+        if self.size == 1 or day < self.current_day:
+            self.current_day = day
+        if self.size > self.grow_threshold:
+            self._resize(2 * self.num_buckets)
+
+    def extend(self, items):
+        # Bulk load: merge with what is already queued and lay out the whole
+        # calendar once, sized for the new population.
+        items = list(items)
+        if not items:
+            return
+        self.size += len(items)
+        num_buckets = self.MIN_BUCKETS
+        while 2 * num_buckets < self.size:
+            num_buckets *= 2
+        self._resize(num_buckets, items)
+
+    def pop(self):
+        if self.size == 0:
+            return None
+        return self._take(*self._find())
+
+    def _find(self):
+        # The bucket holding the earliest item, and that item's day
+        buckets = self.buckets
+        num_buckets = self.num_buckets
+        width = self.width
+        day = self.current_day
+        for _ in range(num_buckets):
+            bucket = buckets[day % num_buckets]
+            if bucket and int(bucket[0][0] // width) <= day:
+                return bucket, day
+            day += 1
+        # A whole year went by without a hit: jump straight to the earliest event.
+        bucket = min((b for b in buckets if b), key=lambda b: b[0])
+        return bucket, self._day(bucket[0][0])
+
+    def _take(self, bucket, day):
+        item = bucket.pop(0)
+        self.size -= 1
+        self.current_day = day
+        if self.size < self.shrink_threshold and self.num_buckets > self.MIN_BUCKETS:
+            self._resize(self.num_buckets // 2)
+        return item
+
+    def peek(self):
+        if self.size == 0:
+            return None
+        bucket, day = self._find()
+        self.current_day = day  # Nothing is earlier, so the next search starts here
+        return bucket[0]
+
+    def _resize(self, num_buckets, new_items=()):
+        items = [item for bucket in self.buckets for item in bucket]
+        items.extend(new_items)
+        self._setup(num_buckets, self._estimate_width(heapq.nsmallest(self.SAMPLE_SIZE, items)))
+        buckets = self.buckets
+        for item in items:
+            buckets[self._day(item[0]) % num_buckets].append(item)
+        for day, bucket in enumerate(buckets):
+            if len(bucket) > 1:
+                bucket.sort()
+        if items:
+            self.current_day = self._day(min(bucket[0] for bucket in buckets if bucket)[0])
+
+    def _estimate_width(self, sample):
+        # Three times the average gap between the earliest events (sample,
+        # sorted), ignoring outliers, as suggested by Brown (1988).
+        if len(sample) < 2:
+            return self.width
+        gaps = [b[0] - a[0] for a, b in zip(sample, sample[1:])]
+        average = sum(gaps) / len(gaps)
+        close = [gap for gap in gaps if gap <= 2 * average]
+        if close and sum(close) > 0:
+            average = sum(close) / len(close)
+        if average <= 0:
+            return self.width
+        return 3 * average
+
+    def __len__(self):
+        return self.size
+
+
+EVENT_QUEUES = {
+    'heap': BinaryHeap,
+    'calendar': CalendarQueue,
+}
+
+
+def make_event_queue(queue_type='heap'):
+    if queue_type not in EVENT_QUEUES:
+        raise ValueError(f"Unknown event queue type: {queue_type}")
+    return EVENT_QUEUES[queue_type]()
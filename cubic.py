@@ -1,5 +1,5 @@
-import time
-import random
+import numpy as np
+
 
 class Cubic:
     def __init__(self, c=0.4, max_cwnd=1000, initial_cwnd=10):
@@ -8,29 +8,38 @@ class Cubic:
         self.max_cwnd = max_cwnd
         self.last_congestion_time = None
         self.origin_point = self.cwnd
-        self.time_of_last_update = time.time()
-        self.packet_arrival_times = []  # Store packet arrival times
-        self.dropped_packets = []  
+        self.time_of_last_update = None
+        # Running counters instead of per-packet lists keep memory constant
+        self.arrival_count = 0
+        self.first_arrival_time = None
+        self.last_arrival_time = None
+        self.dropped_count = 0
 
-    def update_cwnd(self):
-        if self.last_congestion_time is None:
+    def update_cwnd(self, now):
+        # The window is a function of simulation time, so it is only evaluated
+        # when an admission decision asks for it, and at most once per instant.
+        if self.last_congestion_time is None or now == self.time_of_last_update:
             return self.cwnd
-        t = time.time() - self.last_congestion_time
+        t = now - self.last_congestion_time
         w_cubic = self.cubic_function(t)
         self.cwnd = min(w_cubic, self.max_cwnd)
-        self.time_of_last_update = time.time()
+        self.time_of_last_update = now
         return self.cwnd
 
     def cubic_function(self, t):
         return self.origin_point + self.c * (t ** 3)
 
-    def congestion_event(self):
-        self.last_congestion_time = time.time()
+    def congestion_event(self, now):
+        self.last_congestion_time = now
         self.origin_point = max(self.cwnd / 2, 1)  # Reduce window by half on congestion
         self.cwnd = self.origin_point
-        self.update_cwnd()
-        
-        
+        self.time_of_last_update = now
+
+    def on_rtt_sample(self, rtt):
+        # Cubic only reacts to loss
+        pass
+
+
 class Vegas(Cubic):
     def __init__(self, c=0.4, max_cwnd=1000, initial_cwnd=10, alpha=0.5, beta=0.3):
         super().__init__(c, max_cwnd, initial_cwnd)
@@ -41,20 +50,11 @@ class Vegas(Cubic):
         self.cwnd = initial_cwnd
         self.max_cwnd = max_cwnd
         self.last_congestion_time = None
-        self.packet_arrival_times = []  # Store packet arrival times
-        self.dropped_packets = []  
-
-    def update_cwnd(self):
-        if self.last_congestion_time is None:
-            return self.cwnd
-        t = time.time() - self.last_congestion_time
-        rtt_sample =random.uniform(10, 100)
-        self.update_smooth_rtt(rtt_sample)        
-        w_cubic = self.cubic_function(t)
-        self.cwnd = min(w_cubic, self.max_cwnd)
-        self.time_of_last_update = time.time()
-        return self.cwnd
 
+    def on_rtt_sample(self, rtt):
+        # RTT samples come from packets completing the simulated path
+        self.update_smooth_rtt(rtt)
+        self.time_of_last_update = None  # The window depends on the RTT estimate
 
     def update_smooth_rtt(self, rtt_sample):
         if self.base_rtt == 0:
@@ -70,26 +70,99 @@ class Vegas(Cubic):
         else:
             return self.origin_point
 
-    def congestion_event(self):
-        super().congestion_event()
+    def congestion_event(self, now):
+        super().congestion_event(now)
         self.base_rtt = self.smooth_rtt = 0  # Reset RTT parameters on congestion event
 
     def simulate_packet_arrival(self, time):
         # Simulate a packet arrival at time 'time'
-        self.packet_arrival_times.append(time)
+        if self.first_arrival_time is None:
+            self.first_arrival_time = time
+        self.last_arrival_time = time
+        self.arrival_count += 1
 
     def simulate_packet_drop(self, packet_index):
         # Simulate a packet drop
-        self.dropped_packets.append(packet_index)
+        self.dropped_count += 1
         
     def calculate_jitter(self):
-        jitter = [self.packet_arrival_times[i] - self.packet_arrival_times[i-1] 
-                  for i in range(1, len(self.packet_arrival_times))]
-        avg_jitter = sum(jitter) / len(jitter) if len(jitter) > 0 else 0
-        return avg_jitter
+        # The mean gap between consecutive arrivals telescopes to (last - first) / (n - 1)
+        if self.arrival_count < 2:
+            return 0
+        return (self.last_arrival_time - self.first_arrival_time) / (self.arrival_count - 1)
 
     def calculate_packet_drop_rate(self):
-        total_packets = len(self.packet_arrival_times) + len(self.dropped_packets)
-        packet_drop_rate = len(self.dropped_packets) / total_packets if total_packets > 0 else 0
+        total_packets = self.arrival_count + self.dropped_count
+        packet_drop_rate = self.dropped_count / total_packets if total_packets > 0 else 0
         return packet_drop_rate
 
+
+class CubicFlows:
+    # Cubic state for many flows, in arrays indexed by flow. Instead of one
+    # Python call per flow per event, congestion events and window updates
+    # are applied to every affected flow in one vectorized step.
+    def __init__(self, num_flows, c=0.4, max_cwnd=1000, initial_cwnd=10):
+        self.c = c  # A scalar, or an array with one value per flow
+        self.max_cwnd = max_cwnd
+        self.cwnd = np.full(num_flows, float(initial_cwnd))
+        self.origin_point = self.cwnd.copy()
+        self.last_congestion_time = np.full(num_flows, np.nan)  # NaN until a flow's first congestion event
+
+    def window_function(self, flows, t):
+        c = self.c[flows] if np.ndim(self.c) else self.c
+        return self.origin_point[flows] + c * t ** 3
+
+    def update(self, now):
+        # Windows of every flow that has seen congestion, as in Cubic.update_cwnd
+        flows = np.flatnonzero(~np.isnan(self.last_congestion_time))
+        if len(flows):
+            t = now - self.last_congestion_time[flows]
+            self.cwnd[flows] = np.minimum(self.window_function(flows, t), self.max_cwnd)
+        return self.cwnd
+
+    def congestion_event(self, flows, now):
+        # flows: array of distinct flow indices
+        self.last_congestion_time[flows] = now
+        self.origin_point[flows] = np.maximum(self.cwnd[flows] / 2, 1)
+        self.cwnd[flows] = self.origin_point[flows]
+
+    def on_rtt_samples(self, flows, rtts):
+        # Cubic only reacts to loss
+        pass
+
+
+class VegasFlows(CubicFlows):
+    def __init__(self, num_flows, c=0.4, max_cwnd=1000, initial_cwnd=10, alpha=0.5, beta=0.3):
+        super().__init__(num_flows, c, max_cwnd, initial_cwnd)
+        self.alpha = alpha
+        self.beta = beta
+        self.base_rtt = np.zeros(num_flows)
+        self.smooth_rtt = np.zeros(num_flows)
+
+    def on_rtt_samples(self, flows, rtts):
+        # Same recurrence as Vegas.update_smooth_rtt applied to each sample in
+        # order. Samples are grouped by how many earlier samples their flow has
+        # in this batch, and each group is one vectorized step.
+        order = np.argsort(flows, kind='stable')
+        flows, rtts = flows[order], rtts[order]
+        starts = np.flatnonzero(np.r_[True, flows[1:] != flows[:-1]])
+        rank = np.arange(len(flows)) - np.repeat(starts, np.diff(np.r_[starts, len(flows)]))
+        for step in range(int(rank.max()) + 1 if len(rank) else 0):
+            selected = rank == step
+            flow, rtt = flows[selected], rtts[selected]
+            first = self.base_rtt[flow] == 0
+            self.base_rtt[flow[first]] = rtt[first]
+            later = flow[~first]
+            self.smooth_rtt[later] = (1 - self.alpha) * self.smooth_rtt[later] + self.alpha * rtt[~first]
+
+    def window_function(self, flows, t):
+        smooth, base = self.smooth_rtt[flows], self.base_rtt[flows]
+        origin = self.origin_point[flows]
+        growing = super().window_function(flows, t)
+        backing_off = np.maximum(origin - self.beta * (base - smooth), 1)
+        return np.where(smooth < base, growing, np.where(smooth > base, backing_off, origin))
+
+    def congestion_event(self, flows, now):
+        super().congestion_event(flows, now)
+        self.base_rtt[flows] = 0
+        self.smooth_rtt[flows] = 0
@@ -1,106 +1,309 @@
-import random
+from collections import defaultdict, deque
+from functools import partial
+
 import numpy as np
-from leackyBucket import LeakyBucket
-from cubic import Cubic
-from cubic import Vegas
+from leackyBucket import HierarchicalTokenBucket
+from cubic import CubicFlows, VegasFlows
 
-from scheduler import Scheduler
-from leackyBucket import LeakyBucket
 from event import Event
 from scheduler import Scheduler
 from packet import Packet
+from packet_trace import ADMIT, ARRIVAL, DEPARTURE, DROP
 from network import Network
+from queue_discipline import make_discipline
+from random_streams import RandomStreams
+from arrivals import generate_arrivals, gc_paused
+from inflight import InFlightTable
+from metrics import LatencyHistogram, RunningStats, TimeBinnedMetrics
 
 
 import csv
 
+METRIC_COLUMNS = ('throughput', 'total_latency', 'jitter', 'packet_drop_rate')
+BATCH_ADMIT = 16  # Packets charged to the shaper at once past which admit_batch beats one admit each
+
 class Simulator:
-    def __init__(self, max_queue_size=50, scheduler_type='FIFO', quantum=5, rate=10, capacity=100,algo = 'cubic'):
+    def __init__(self, max_queue_size=50, scheduler_type='FIFO', quantum=5, rate=10, capacity=100,algo = 'cubic', queue_type='heap', weights=None, seed=None,
+                 metrics_bin_width=1.0, num_flows=2, flow_ids=None, update_interval=1.0, cc_params=None,
+                 link_rate=None, link_capacity=None, aggregates=None, shaper_queue_size=None):
         self.scheduler_type = scheduler_type
-        self.cwnd = None
-        self.scheduler = Scheduler(scheduler_type=scheduler_type, quantum=quantum)
-        self.leaky_bucket = LeakyBucket(rate, capacity)
-        if algo == 'cubic':
-            self.cubic = Cubic()
-        else:
-            self.cubic = Vegas()
-            # new_cwnd = self.cubic.update_cwnd()
+        self.quantum = quantum
+        # Named random substreams, one for each flow's arrivals
+        self.random = RandomStreams(seed)
+        self.rng = self.random.root
+        self.scheduler = Scheduler(scheduler_type=scheduler_type, queue_type=queue_type)
+        # Flows share one output link; the discipline picks which flow sends next
+        self.discipline = make_discipline(scheduler_type, quantum=quantum, max_queue_size=max_queue_size, weights=weights,
+                                          rng=self.random.stream('red'))
+        self.link_busy = False
 
-            # # Print the updated congestion window size
-            # print("Updated congestion window size:", new_cwnd)
+        # Flows are labelled flow1..flowN unless flow_ids names them. Their
+        # congestion control and shaping state lives in arrays indexed by
+        # flow_index; every update_interval of simulated time a "tick" applies
+        # the drops and RTT samples gathered since the last tick and refreshes
+        # every window in one vectorized step.
+        self.flow_ids = list(flow_ids) if flow_ids is not None else [f'flow{index + 1}' for index in range(num_flows)]
+        self.flow_index = {flow_id: index for index, flow_id in enumerate(self.flow_ids)}
+        num_flows = len(self.flow_ids)
+        self.shaper, self.flow_buckets = self.build_shaper(rate, capacity, link_rate, link_capacity, aggregates)
+        # Packets held back by the shaper wait here, per flow, until the
+        # "eligible" event scheduled for the time their tokens are there
+        self.shaper_queue_size = max_queue_size if shaper_queue_size is None else shaper_queue_size
+        self.shaped = {}
+        self.cubic = (CubicFlows if algo == 'cubic' else VegasFlows)(num_flows, **(cc_params or {}))
+        self.cwnd = self.cubic.cwnd.tolist()  # Window per flow as of the last tick
+        self.update_interval = update_interval
+        self.congested = []  # Flow indices that dropped a packet since the last tick
+        self.rtt_flows = []
+        self.rtt_samples = []
+        self.scheduler.schedule_event(Event("tick", 0.0))
 
- 
-        self.flows = {'flow1': [], 'flow2': []}
-        self.network = Network()
+        self.flows = {flow_id: InFlightTable() for flow_id in self.flow_ids}
+        self.network = Network(random=self.random)
         self.max_queue_size = max_queue_size
-        self.arrival_counts = {'flow1': 0, 'flow2': 0}
-        self.departure_counts = {'flow1': 0, 'flow2': 0}
-        self.dropped_packets = {'flow1': 0, 'flow2': 0}
-        self.total_latencies = {'flow1': 0, 'flow2': 0}
-        self.latency_lists = {'flow1': [], 'flow2': []}
-        self.simulation_end_times = {'flow1': 0, 'flow2': 0}
-        self.metrics_per_second = {flow_id: {} for flow_id in self.flows}
-
-    def initialize_events(self, num_events=100, flow_id='flow1'):
-        for _ in range(num_events):
-            event_time = random.uniform(0, 100)
-            priority = random.randint(1, 2)
-            packet = Packet(arrival_time=event_time, priority=priority)
-            self.scheduler.schedule_event(Event("arrival", event_time, packet, flow_id=flow_id))
-
-    def run_simulation(self):
-        current_second = 0
-        while self.scheduler.has_events():
-            
-            self.cwnd = self.cubic.update_cwnd()
-            event = self.scheduler.get_next_event()
-            current_second = int(event.time)  # Convert event time to an integer second
+        self.arrival_counts = dict.fromkeys(self.flow_ids, 0)
+        self.departure_counts = dict.fromkeys(self.flow_ids, 0)
+        self.dropped_packets = dict.fromkeys(self.flow_ids, 0)
+        self.total_latencies = dict.fromkeys(self.flow_ids, 0)
+        self.last_latencies = dict.fromkeys(self.flow_ids)
+        self.simulation_end_times = dict.fromkeys(self.flow_ids, 0)
+        # Per-flow accumulators are created on a flow's first departure
+        self.latency_stats = defaultdict(RunningStats)
+        self.latency_histograms = defaultdict(LatencyHistogram)
+        self.metrics_bin_width = metrics_bin_width
+        self.time_bins = defaultdict(partial(TimeBinnedMetrics, METRIC_COLUMNS, bin_width=metrics_bin_width))
+        self.trace = None  # Optional packet_trace.TraceRecorder
+        self.pending_sources = {}  # Scheduled arrival event -> the source it came from
+
+    def build_shaper(self, rate, capacity, link_rate=None, link_capacity=None, aggregates=None):
+        # Token buckets per flow (rate and capacity may be per-flow sequences),
+        # under an optional bucket for the output link, with optional
+        # aggregates {name: (rate, capacity, flow_ids)} in between
+        shaper = HierarchicalTokenBucket()
+        link = shaper.add_bucket(link_rate, link_capacity) if link_rate is not None else -1
+        parents = np.full(len(self.flow_ids), link)
+        for aggregate_rate, aggregate_capacity, members in (aggregates or {}).values():
+            aggregate = shaper.add_bucket(aggregate_rate, aggregate_capacity, link)
+            parents[[self.flow_index[flow_id] for flow_id in members]] = aggregate
+        flow_buckets = shaper.add_buckets(rate, capacity, parents, count=len(self.flow_ids))
+        return shaper, flow_buckets
+
+    def initialize_events(self, num_events=100, flow_id='flow1', distribution='uniform', **params):
+        times, priorities, processing_times = generate_arrivals(num_events, distribution, rng=self.arrival_rng(flow_id), **params)
+        with gc_paused():
+            self.scheduler.schedule_events([
+                Event("arrival", event_time, Packet(arrival_time=event_time, priority=priority, flow_id=flow_id, processing_time=processing_time), flow_id=flow_id)
+                for event_time, priority, processing_time in zip(times.tolist(), priorities.tolist(), processing_times.tolist())
+            ])
+
+    def arrival_rng(self, flow_id):
+        # Each flow draws its arrivals from its own stream, so adding a flow
+        # or changing another flow's load leaves them unchanged
+        return self.random.generator(f'arrivals/{flow_id}')
+
+    def run_simulation(self, until=None, max_events=None):
+        # Stops after simulated time until or after max_events events, with the
+        # rest still scheduled, so a run can be snapshotted and resumed.
+        # Returns the number of events processed.
+        processed = 0
+        trace = self.trace
+        while processed != max_events and self.scheduler.has_events():
+            event = self.scheduler.get_next_event(until)
+            if event is None:
+                break
+            processed += 1
+            if self.pending_sources and event in self.pending_sources:
+                self.schedule_from_source(self.pending_sources.pop(event))
 
             if isinstance(event, Event) and event.event_type == "arrival":
-                flow_id = event.flow_id
-                self.arrival_counts[flow_id] += 1
-                if self.leaky_bucket.remove_tokens(1) and len(self.flows[flow_id]) < self.cubic.cwnd:
-                    self.flows[flow_id].append(event.packet)
-                    departure_time = event.time + event.packet.processing_time
-                    self.scheduler.schedule_event(Event("departure", departure_time, event.packet, flow_id=flow_id))
-                else:
-                    self.dropped_packets[flow_id] += 1
-                    self.cubic.congestion_event()
+                arrivals = [event]
+                while processed != max_events:
+                    # Other arrivals at this instant go through the shaper together
+                    same = self.scheduler.next_at(event.time, "arrival")
+                    if same is None:
+                        break
+                    processed += 1
+                    if self.pending_sources and same in self.pending_sources:
+                        self.schedule_from_source(self.pending_sources.pop(same))
+                    arrivals.append(same)
+                self.arrive(arrivals, event.time)
             elif isinstance(event, Event) and event.event_type == "departure":
                 flow_id = event.flow_id
-                if event.packet in self.flows[flow_id]:
-                    # print(",,,,,,,,,,,,,,",event.packet)
-                    self.flows[flow_id].remove(event.packet)
+                if self.flows[flow_id].depart(event.packet) is not None:
                     self.departure_counts[flow_id] += 1
                     latency = event.time - event.packet.arrival_time
+                    if trace is not None:
+                        trace.record(DEPARTURE, event.time, event.packet, latency)
                     self.total_latencies[flow_id] += latency
-                    self.latency_lists[flow_id].append(latency)
+                    self.latency_stats[flow_id].add(latency)
+                    self.latency_histograms[flow_id].add(latency)
+                    self.rtt_flows.append(self.flow_index[flow_id])
+                    self.rtt_samples.append(latency)
                     self.simulation_end_times[flow_id] = max(self.simulation_end_times[flow_id], event.time)
-
+                    self.start_transmission(event.time)
 
                     # Calculate jitter
-                    if len(self.latency_lists[flow_id]) >= 2:
-                        jitter = self.latency_lists[flow_id][-1] - self.latency_lists[flow_id][-2]
-                    else:
-                        jitter = 0
+                    previous_latency = self.last_latencies[flow_id]
+                    jitter = latency - previous_latency if previous_latency is not None else 0
+                    self.last_latencies[flow_id] = latency
 
                     # Calculate packet drop rate
                     total_packets_sent = self.arrival_counts[flow_id]
                     total_packets_dropped = self.dropped_packets[flow_id]
                     packet_drop_rate = total_packets_dropped / total_packets_sent if total_packets_sent > 0 else 0
 
-                    # Track per-second metrics
+                    # Track per-interval metrics
+                    bins = self.time_bins[flow_id]
+                    bins.add(event.time, 'throughput', 1)
+                    bins.add(event.time, 'total_latency', latency)
+                    bins.set(event.time, 'jitter', jitter)
+                    bins.set(event.time, 'packet_drop_rate', packet_drop_rate)
+            elif isinstance(event, Event) and event.event_type == "eligible":
+                self.release(event.flow_id, event.time)
+            elif isinstance(event, Event) and event.event_type == "tick":
+                self.tick(event.time)
+        return processed
 
-                    if current_second not in self.metrics_per_second[flow_id]:
-                        self.metrics_per_second[flow_id][current_second] = {'throughput': 0, 'total_latency': 0, 'jitter': 0, 'packet_drop_rate': 0}
-                    self.metrics_per_second[flow_id][current_second]['throughput'] += 1
-                    self.metrics_per_second[flow_id][current_second]['total_latency'] += latency
-                    self.metrics_per_second[flow_id][current_second]['jitter'] = jitter
-                    self.metrics_per_second[flow_id][current_second]['packet_drop_rate'] = packet_drop_rate
-                    # if current_second not in self.metrics_per_second[flow_id]:
-                    #     self.metrics_per_second[flow_id][current_second] = {'throughput': 0, 'total_latency': 0}
-                    # self.metrics_per_second[flow_id][current_second]['throughput'] += 1
-                    # self.metrics_per_second[flow_id][current_second]['total_latency'] += latency
+    def arrive(self, events, now):
+        # Arrivals at simulated time now, in order. Packets whose flow has
+        # nothing held by the shaper are charged up front, in one admit_batch
+        # call once there are BATCH_ADMIT of them; with every packet of size
+        # 1, a flow's packets after one that fails also fail, so this decides
+        # exactly as one admit per packet would.
+        trace = self.trace
+        indices = [self.flow_index[event.flow_id] for event in events]
+        candidates = [position for position, event in enumerate(events) if not self.shaped.get(event.flow_id)]
+        buckets = [self.flow_buckets[indices[position]] for position in candidates]
+        if len(buckets) >= BATCH_ADMIT:
+            admitted = self.shaper.admit_batch(buckets, now).tolist()
+        else:
+            admitted = [self.shaper.admit(bucket, now) for bucket in buckets]
+        passed = [False] * len(events)
+        for position, passes in zip(candidates, admitted):
+            passed[position] = passes
+        for event, index, admitted in zip(events, indices, passed):
+            flow_id = event.flow_id
+            self.arrival_counts[flow_id] += 1
+            if trace is not None:
+                trace.record(ARRIVAL, now, event.packet)
+            backlog = self.shaped.get(flow_id)
+            if admitted:
+                self.admit(event.packet, flow_id, index, now)
+            elif backlog:
+                # Arrivals queue behind packets the shaper already holds
+                if len(backlog) < self.shaper_queue_size:
+                    backlog.append(event.packet)
+                else:
+                    self.drop(event.packet, flow_id, index, now)
+            else:
+                self.hold(event.packet, flow_id, index, now)
+
+    def admit(self, packet, flow_id, index, time):
+        # A packet that has its tokens still needs room in the queue and in the
+        # flow's congestion window
+        if (len(self.discipline) < self.max_queue_size and len(self.flows[flow_id]) < self.cwnd[index]
+                and self.discipline.enqueue(packet, flow_id)):
+            self.flows[flow_id].admit(packet)
+            if self.trace is not None:
+                self.trace.record(ADMIT, time, packet)
+            if not self.link_busy:
+                self.start_transmission(time)
+        else:
+            self.drop(packet, flow_id, index, time)
+
+    def drop(self, packet, flow_id, index, time):
+        self.dropped_packets[flow_id] += 1
+        self.congested.append(index)
+        if self.trace is not None:
+            self.trace.record(DROP, time, packet)
+
+    def hold(self, packet, flow_id, index, time):
+        # Keeps a packet that is short of tokens until the simulated time the
+        # shaper says they will be there, with one event for that time
+        eligible = self.shaper.eligible_time(self.flow_buckets[index], time)
+        if eligible == float('inf') or self.shaper_queue_size <= 0:
+            self.drop(packet, flow_id, index, time)
+            return
+        self.shaped.setdefault(flow_id, deque()).append(packet)
+        self.scheduler.schedule_event(Event("eligible", eligible, flow_id=flow_id))
+
+    def release(self, flow_id, now):
+        # Admits held packets of flow_id while their tokens last, then waits
+        # for the next one's eligible time
+        backlog = self.shaped[flow_id]
+        index = self.flow_index[flow_id]
+        bucket = self.flow_buckets[index]
+        count = min(len(backlog), self.shaper.affordable(bucket, now))
+        if count >= BATCH_ADMIT:
+            self.shaper.admit_batch(np.full(count, bucket), now)  # Charges the whole release at once
+        else:
+            for _ in range(count):
+                self.shaper.admit(bucket, now)
+        for _ in range(count):
+            self.admit(backlog.popleft(), flow_id, index, now)
+        if backlog:
+            self.scheduler.schedule_event(Event("eligible", self.shaper.eligible_time(bucket, now), flow_id=flow_id))
+        else:
+            del self.shaped[flow_id]
+
+    def tick(self, now):
+        # One congestion epoch for every flow at once: flows that dropped since
+        # the last tick back off, RTT samples update the estimates, then all
+        # windows are refreshed. Token buckets refill lazily from event times.
+        if self.congested:
+            self.cubic.congestion_event(np.unique(self.congested), now)
+            self.congested = []
+        if self.rtt_samples:
+            self.cubic.on_rtt_samples(np.array(self.rtt_flows), np.array(self.rtt_samples))
+            self.rtt_flows = []
+            self.rtt_samples = []
+        self.cwnd = self.cubic.update(now).tolist()
+        if self.scheduler.has_events():
+            self.scheduler.schedule_event(Event("tick", now + self.update_interval))
+
+    def add_source(self, source):
+        # Arrivals from an arrivals.ArrivalSource are pulled one at a time: only
+        # the source's next arrival sits in the event list, so memory does not
+        # grow with the number of packets it will produce
+        self.schedule_from_source(source)
+
+    def schedule_from_source(self, source):
+        arrival = source.next_arrival()
+        if arrival is not None:
+            time, priority, processing_time = arrival
+            event = Event("arrival", time, Packet(arrival_time=time, priority=priority, flow_id=source.flow_id,
+                                                  processing_time=processing_time), flow_id=source.flow_id)
+            self.pending_sources[event] = source
+            self.scheduler.schedule_event(event)
+
+    def start_transmission(self, time):
+        # Put the next packet chosen by the discipline on the link, if any
+        packet = self.discipline.dequeue()
+        self.link_busy = packet is not None
+        if packet is not None:
+            self.scheduler.schedule_event(Event("departure", time + packet.processing_time, packet, flow_id=packet.flow_id))
+
+    @property
+    def metrics_per_second(self):
+        # Dict view of the binned metrics, keyed by bin start time, for code
+        # written against the old dict-of-dicts layout
+        view = {}
+        for flow_id in self.flow_ids:
+            view[flow_id] = {}
+            if flow_id not in self.time_bins:
+                continue
+            bins = self.time_bins[flow_id]
+            throughput = bins.series('throughput')
+            for index in throughput.nonzero()[0].tolist():
+                second = index * self.metrics_bin_width
+                if float(second).is_integer():
+                    second = int(second)
+                view[flow_id][second] = {column: bins.series(column)[index].item() for column in METRIC_COLUMNS}
+                view[flow_id][second]['throughput'] = int(view[flow_id][second]['throughput'])
+        return view
+
+    def calculate_latency_percentiles(self, flow_id, percentiles=(50, 99, 99.9)):
+        return self.latency_histograms[flow_id].percentiles(percentiles)
 
     def write_metrics_to_csv(self):
         for flow_id, metrics in self.metrics_per_second.items():
@@ -119,78 +322,3 @@ class Simulator:
                     writer.writerow([second, throughput, average_latency, jitter, packet_drop_rate])
 
                     # writer.writerow([second, throughput, average_latency])
-
-# Example usage
-sim = Simulator(max_queue_size=100, scheduler_type='RR', rate=5, capacity=50,algo='vegas')
-sim.initialize_events(num_events=1000000, flow_id='flow1')
-sim.initialize_events(num_events=10000, flow_id='flow2')
-sim.run_simulation()
-sim.write_metrics_to_csv()
-import matplotlib.pyplot as plt
-
-time_data = []
-latency_data = []
-throughput_data = []
-jitter_data = []
-packet_drop_data = []
-
-# Extract data for plotting
-for flow_id, metrics in sim.metrics_per_second.items():
-    for second, metric_data in metrics.items():
-        # Append time data
-        time_data.append(second)
-        # Append latency data
-        latency_data.append(metric_data.get('total_latency', 0))
-        # Append throughput data
-        throughput_data.append(metric_data.get('throughput', 0))
-        # Append jitter data
-        jitter_data.append(metric_data.get('jitter', 0))
-        # Append packet drop data
-        packet_drop_data.append(metric_data.get('packet_drop_rate', 0))
-
-# Plot total latency
-plt.figure(figsize=(12, 6))
-plt.subplot(2, 2, 1)
-plt.plot(time_data, latency_data, label='Total Latency')
-plt.xlabel('Time (seconds)')
-plt.ylabel('Total Latency')
-plt.title('Total Latency over Time')
-plt.legend()
-plt.grid(True)
-
-# Plot throughput
-plt.subplot(2, 2, 2)
-plt.plot(time_data, throughput_data, label='Throughput')
-plt.xlabel('Time (seconds)')
-plt.ylabel('Throughput')
-plt.title('Throughput over Time')
-plt.legend()
-plt.grid(True)
-
-# Plot jitter
-plt.subplot(2, 2, 3)
-plt.plot(time_data, jitter_data, label='Jitter')
-plt.xlabel('Time (seconds)')
-plt.ylabel('Jitter')
-plt.title('Jitter over Time')
-plt.legend()
-plt.grid(True)
-
-# Plot packet drop rate
-plt.subplot(2, 2, 4)
-plt.plot(time_data, packet_drop_data, label='Packet Drop Rate')
-plt.xlabel('Time (seconds)')
-plt.ylabel('Packet Drop Rate')
-plt.title('Packet Drop Rate over Time')
-plt.legend()
-plt.grid(True)
-
-plt.tight_layout()
-plt.show()
-
-
-
-
-#num_events=100000000
-#(num_events=100000
-#max_queue_size=1000
\ No newline at end of file
@@ -1,4 +1,6 @@
 class Event:
+    __slots__ = ('event_type', 'time', 'packet', 'flow_id')
+
     def __init__(self, event_type, time, packet=None, flow_id=None):
         self.event_type = event_type
         self.time = time
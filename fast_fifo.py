@@ -0,0 +1,142 @@
+from collections import deque
+
+import numpy as np
+
+from arrivals import arrival_chunks, generate_arrivals
+from metrics import LatencyHistogram, RunningStats
+
+# Closed-form engine for the single-server FIFO queue that Simulator models
+# with scheduler_type='FIFO'. Departure times follow the Lindley recursion
+#
+#   D[i] = max(A[i], D[i - 1]) + S[i]
+#
+# which unrolls to D = C + running max of (A - C shifted by one), C being the
+# cumulative service time, so a whole chunk of arrivals is one cumsum and one
+# maximum.accumulate. With a finite max_queue_size an arrival is dropped when
+# max_queue_size admitted packets are still in the system, i.e. when the
+# max_queue_size-th most recently admitted packet has not departed yet. Chunks
+# are computed as if nothing were dropped and accepted up to the first arrival
+# that would have been; stretches with drops then go through a scalar loop
+# until scalar_stretch arrivals in a row are admitted.
+#
+#   FastFIFO(max_queue_size=50).run(1000000, 'poisson', rng, rate=0.15)
+
+
+def lindley_departures(arrivals, services, previous_departure=0.0):
+    # Departure times of back-to-back admitted packets, after a packet that
+    # left at previous_departure
+    cumulative = np.cumsum(services)
+    starts = np.maximum.accumulate(arrivals - (cumulative - services))
+    return cumulative + np.maximum(starts, previous_departure)
+
+
+class FastFIFO:
+    def __init__(self, max_queue_size=50, scalar_stretch=256):
+        self.max_queue_size = max_queue_size  # None for an unbounded queue
+        self.scalar_stretch = scalar_stretch
+        self.recent = np.empty(0)  # Departure times of the last max_queue_size admitted packets
+        self.last_departure = 0.0
+        self.arrival_count = 0
+        self.departure_count = 0
+        self.dropped_packets = 0
+        self.total_latency = 0
+        self.latency_stats = RunningStats()
+        self.latency_histogram = LatencyHistogram()
+        self.simulation_end_time = 0
+
+    def process(self, arrivals, services):
+        # Feeds one time-ordered chunk of arrivals and their processing times
+        arrivals = np.asarray(arrivals, dtype=float)
+        services = np.asarray(services, dtype=float)
+        self.arrival_count += len(arrivals)
+        if self.max_queue_size == 0:
+            # No room at all: every arrival is dropped, as in Simulator
+            self.dropped_packets += len(arrivals)
+            return
+        position = 0
+        window = self.scalar_stretch
+        while position < len(arrivals):
+            # Vectorized windows double while they pass without a drop, so a
+            # queue that is often full does not recompute long chunks
+            end = min(position + window, len(arrivals))
+            reached = self._vectorized(arrivals[:end], services[:end], position)
+            if reached == end:
+                window *= 2
+            else:
+                window = self.scalar_stretch
+                reached = self._scalar(arrivals, services, reached)
+            position = reached
+
+    def _record(self, arrivals, departures):
+        latencies = departures - arrivals
+        self.departure_count += len(departures)
+        self.total_latency += float(latencies.sum())
+        self.latency_stats.add_many(latencies)
+        self.latency_histogram.add_many(latencies)
+        self.last_departure = float(departures[-1])
+        self.simulation_end_time = max(self.simulation_end_time, self.last_departure)
+
+    def _vectorized(self, arrivals, services, position):
+        # Admits arrivals from position on until the first one that finds the
+        # queue full; returns where it stopped
+        arrivals, services = arrivals[position:], services[position:]
+        departures = lindley_departures(arrivals, services, self.last_departure)
+        accepted = len(arrivals)
+        if self.max_queue_size is not None:
+            history = np.concatenate([self.recent, departures])
+            oldest = np.arange(len(arrivals)) + len(self.recent) - self.max_queue_size
+            full = (oldest >= 0) & (history[np.maximum(oldest, 0)] >= arrivals)
+            if full.any():
+                accepted = int(np.argmax(full))
+            self.recent = history[:len(self.recent) + accepted][-self.max_queue_size:]
+        if accepted:
+            self._record(arrivals[:accepted], departures[:accepted])
+        return position + accepted
+
+    def _scalar(self, arrivals, services, position, block_size=4096):
+        # One arrival at a time until scalar_stretch arrivals in a row are admitted
+        size = self.max_queue_size
+        recent = deque(self.recent.tolist(), maxlen=size)
+        last_departure = self.last_departure
+        quiet = 0
+        end = len(arrivals)
+        while position < end and quiet < self.scalar_stretch:
+            admitted_arrivals = []
+            admitted_departures = []
+            block_end = min(position + block_size, end)
+            for arrival, service in zip(arrivals[position:block_end].tolist(), services[position:block_end].tolist()):
+                if quiet >= self.scalar_stretch:
+                    break
+                position += 1
+                if len(recent) == size and recent[0] >= arrival:
+                    self.dropped_packets += 1
+                    quiet = 0
+                else:
+                    last_departure = max(arrival, last_departure) + service
+                    recent.append(last_departure)
+                    admitted_arrivals.append(arrival)
+                    admitted_departures.append(last_departure)
+                    quiet += 1
+            if admitted_departures:
+                self._record(np.array(admitted_arrivals), np.array(admitted_departures))
+        self.recent = np.array(recent)
+        return position
+
+    def run(self, num_events, distribution='uniform', rng=None, chunk_size=1 << 20, **params):
+        # The arrivals Simulator.initialize_events would draw with the same rng,
+        # generated and processed chunk by chunk. Returns calculate_metrics().
+        if num_events <= chunk_size:
+            chunks = [generate_arrivals(num_events, distribution, rng, **params)]
+        else:
+            chunks = arrival_chunks(num_events, distribution, rng, chunk_size, **params)
+        for times, _, processing_times in chunks:
+            self.process(times, processing_times)
+        return self.calculate_metrics()
+
+    def calculate_metrics(self):
+        simulation_duration = self.simulation_end_time if self.simulation_end_time > 0 else 1
+        throughput = self.departure_count / simulation_duration
+        average_latency = self.total_latency / self.departure_count if self.departure_count > 0 else 0
+        jitter = self.latency_stats.std()
+        packet_drop_rate = self.dropped_packets / self.arrival_count if self.arrival_count > 0 else 0
+        return throughput, average_latency, jitter, packet_drop_rate
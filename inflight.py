@@ -0,0 +1,20 @@
+class InFlightTable:
+    # Packets admitted to a queue that have not departed yet, keyed by packet
+    # id, so admit, depart and occupancy are all O(1).
+    def __init__(self):
+        self.packets = {}
+
+    def admit(self, packet):
+        self.packets[packet.packet_id] = packet
+
+    def depart(self, packet):
+        # Returns the packet if it was in flight, None otherwise
+        if packet is None:
+            return None
+        return self.packets.pop(packet.packet_id, None)
+
+    def __contains__(self, packet):
+        return packet is not None and packet.packet_id in self.packets
+
+    def __len__(self):
+        return len(self.packets)
@@ -0,0 +1,191 @@
+import json
+import time
+import tracemalloc
+
+# Opt-in instrumentation for Simulator.run_simulation and
+# cubic_simulator.Simulator.run_simulation. attach() shadows the methods the
+# run loop calls (event list, congestion window, token bucket, in-flight
+# table, queue discipline, metric accumulators) with sampling wrappers on the
+# simulator's own component instances, and detach() removes them again. A
+# simulator that was never attached runs the unmodified code, so disabled
+# instrumentation costs nothing.
+#
+#   instrumentation = Instrumentation(sample_every=64)
+#   instrumentation.attach(simulator)
+#   simulator.run_simulation()
+#   instrumentation.detach()
+#   instrumentation.write_json('profile.json')
+#   instrumentation.write_folded('profile.folded')  # flamegraph.pl / speedscope input
+
+PHASES = ('event_list', 'update_cwnd', 'token_bucket', 'membership', 'discipline', 'forwarding', 'metrics')
+_MISSING = object()
+
+
+class Phase:
+    def __init__(self):
+        self.calls = 0
+        self.sampled = 0
+        self.sampled_seconds = 0.0
+
+    def estimated_seconds(self):
+        # Sampled mean scaled up to every call
+        return self.sampled_seconds / self.sampled * self.calls if self.sampled else 0.0
+
+
+class Instrumentation:
+    def __init__(self, sample_every=64, series_every=1000, trace_memory=False, memory_every=100000, top_allocations=10):
+        self.sample_every = sample_every  # Time one call in this many, per phase
+        self.series_every = series_every  # Record heap depth and occupancy every this many events
+        self.trace_memory = trace_memory
+        self.memory_every = memory_every
+        self.top_allocations = top_allocations
+        self.event_counts = {}
+        self.phases = {name: Phase() for name in PHASES}
+        self.series = {'time': [], 'heap_depth': [], 'occupancy': []}
+        self.memory = []
+        self.allocations = []
+        self.events = 0
+        self.wall_seconds = 0.0
+        self.simulator = None
+        self.patched = []
+
+    def _targets(self, simulator):
+        # (phase, component, method name) for every hot-path call the
+        # simulator has; the two simulators share most component names
+        targets = [('event_list', simulator.scheduler, 'schedule_event'),
+                   ('discipline', simulator.discipline, 'enqueue'),
+                   ('discipline', simulator.discipline, 'dequeue')]
+        if hasattr(simulator, 'cubic'):
+            targets += [('update_cwnd', simulator.cubic, 'update'),
+                        ('update_cwnd', simulator.cubic, 'congestion_event'),
+                        ('update_cwnd', simulator.cubic, 'on_rtt_samples')]
+        if getattr(simulator, 'forwarder', None) is not None:
+            targets.append(('forwarding', simulator.forwarder, 'forward'))
+        if hasattr(simulator, 'shaper'):
+            targets += [('token_bucket', simulator.shaper, 'admit'),
+                        ('token_bucket', simulator.shaper, 'eligible_time')]
+        tables = list(simulator.flows.values()) if hasattr(simulator, 'flows') else [simulator.packet_queues]
+        for table in tables:
+            targets += [('membership', table, 'admit'), ('membership', table, 'depart')]
+        if hasattr(simulator, 'time_bins'):
+            # Per-flow accumulators created during the run are wrapped by _patch_factory
+            accumulators = list(simulator.latency_stats.values()) + list(simulator.latency_histograms.values())
+            for bins in simulator.time_bins.values():
+                targets += [('metrics', bins, 'add'), ('metrics', bins, 'set')]
+        else:
+            accumulators = [simulator.latency_stats, simulator.latency_histogram]
+        targets += [('metrics', accumulator, 'add') for accumulator in accumulators]
+        return targets
+
+    def _patch(self, component, name, wrapper):
+        self.patched.append((component, name, vars(component).get(name, _MISSING)))
+        setattr(component, name, wrapper)
+
+    def _patch_factory(self, accumulators, names):
+        # Wraps accumulators a defaultdict creates after attach() as they appear
+        factory = accumulators.default_factory
+        phase = self.phases['metrics']
+
+        def create():
+            accumulator = factory()
+            for name in names:
+                self._patch(accumulator, name, self._timed(phase, getattr(accumulator, name)))
+            return accumulator
+        self.patched.append((accumulators, 'default_factory', factory))
+        accumulators.default_factory = create
+
+    def _timed(self, phase, method):
+        sample_every = self.sample_every
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            phase.calls += 1
+            if phase.calls % sample_every:
+                return method(*args, **kwargs)
+            start = perf_counter()
+            result = method(*args, **kwargs)
+            phase.sampled_seconds += perf_counter() - start
+            phase.sampled += 1
+            return result
+        return wrapper
+
+    def attach(self, simulator):
+        self.simulator = simulator
+        for phase_name, component, name in self._targets(simulator):
+            self._patch(component, name, self._timed(self.phases[phase_name], getattr(component, name)))
+        if getattr(simulator.latency_stats, 'default_factory', None) is not None:
+            self._patch_factory(simulator.latency_stats, ('add',))
+            self._patch_factory(simulator.latency_histograms, ('add',))
+            self._patch_factory(simulator.time_bins, ('add', 'set'))
+
+        # get_next_event also drives the per-event counts and the time series
+        scheduler = simulator.scheduler
+        next_event = self._timed(self.phases['event_list'], scheduler.get_next_event)
+        discipline = simulator.discipline
+        counts = self.event_counts
+
+        def get_next_event(until=None):
+            event = next_event(until)
+            if event is None:
+                return None
+            counts[event.event_type] = counts.get(event.event_type, 0) + 1
+            self.events += 1
+            if self.events % self.series_every == 0:
+                self.series['time'].append(event.time)
+                self.series['heap_depth'].append(len(scheduler.events))
+                self.series['occupancy'].append(len(discipline))
+            if self.trace_memory and self.events % self.memory_every == 0:
+                self._snapshot_memory(event.time)
+            return event
+        self._patch(scheduler, 'get_next_event', get_next_event)
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        return self
+
+    def _snapshot_memory(self, simulated_time):
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory.append({'events': self.events, 'time': simulated_time, 'current_bytes': current, 'peak_bytes': peak})
+
+    def detach(self):
+        self.wall_seconds += time.perf_counter() - self.started
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._snapshot_memory(None)
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:self.top_allocations]
+            self.allocations = [{'location': str(statistic.traceback), 'bytes': statistic.size, 'blocks': statistic.count}
+                                for statistic in statistics]
+            tracemalloc.stop()
+        for component, name, original in reversed(self.patched):
+            if original is _MISSING:
+                delattr(component, name)
+            else:
+                setattr(component, name, original)
+        self.patched = []
+        self.simulator = None
+
+    def report(self):
+        phases = {name: {'calls': phase.calls, 'sampled': phase.sampled,
+                         'mean_ns': phase.sampled_seconds / phase.sampled * 1e9 if phase.sampled else 0.0,
+                         'estimated_seconds': phase.estimated_seconds()}
+                  for name, phase in self.phases.items()}
+        accounted = sum(phase['estimated_seconds'] for phase in phases.values())
+        return {'events': self.events, 'event_counts': dict(self.event_counts), 'wall_seconds': self.wall_seconds,
+                'other_seconds': max(self.wall_seconds - accounted, 0.0), 'phases': phases,
+                'series': self.series, 'memory': self.memory, 'allocations': self.allocations}
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+
+    def folded_stacks(self):
+        # Brendan Gregg's folded format, one line per phase in microseconds
+        report = self.report()
+        lines = [f"run_simulation;{name} {round(phase['estimated_seconds'] * 1e6)}"
+                 for name, phase in report['phases'].items() if phase['calls']]
+        lines.append(f"run_simulation {round(report['other_seconds'] * 1e6)}")
+        return lines
+
+    def write_folded(self, path):
+        with open(path, 'w') as file:
+            file.write('\n'.join(self.folded_stacks()) + '\n')
@@ -1,23 +1,128 @@
-import time
+import math
 
+import numpy as np
 
-class LeakyBucket:
-    def __init__(self, rate, capacity):
-        self.capacity = capacity
-        self.tokens = capacity
-        self.rate = rate
-        self.last_checked = time.time()
+# Token buckets driven by simulated time. Buckets hold no clock of their own:
+# every call passes the current event time, and a bucket is topped up lazily
+# from the time it was last touched, so results do not depend on how fast the
+# host runs the event loop.
 
-    def add_tokens(self):
-        current_time = time.time()
-        elapsed = current_time - self.last_checked
-        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
-        self.last_checked = current_time
+TOLERANCE = 1e-9  # Tokens a bucket may be short and still pass, for float round-off at eligible times
 
-    def remove_tokens(self, num_tokens):
-        self.add_tokens()
-        if num_tokens <= self.tokens:
-            self.tokens -= num_tokens
-            return True
-        return False
 
+class HierarchicalTokenBucket:
+    # Token buckets arranged in a tree, e.g. flow -> link -> aggregate. A
+    # packet is charged to a bucket and every ancestor of it, and passes only
+    # if all of them hold enough tokens. Bucket state lives in arrays indexed
+    # by bucket:
+    #
+    #   shaper = HierarchicalTokenBucket()
+    #   link = shaper.add_bucket(rate=50, capacity=100)
+    #   flows = shaper.add_buckets(rate=5, capacity=20, parent=link, count=3)
+    #   shaper.admit(flows[0], event.time)
+    #   shaper.eligible_time(flows[0], event.time)  # when a blocked packet could pass
+    def __init__(self):
+        self.rate = np.empty(0)
+        self.capacity = np.empty(0)
+        self.tokens = np.empty(0)
+        self.updated = np.empty(0)  # Simulated time each bucket was last topped up
+        self.parent = np.empty(0, dtype=np.int64)  # -1 at the roots
+        self.paths = []  # Bucket indices from each bucket up to its root
+        self._path_table = None
+
+    def __len__(self):
+        return len(self.rate)
+
+    def add_buckets(self, rate, capacity, parent=None, count=1):
+        # Adds count buckets, starting full. rate, capacity and parent may be
+        # per-bucket sequences; a parent of None or -1 makes a root. Returns
+        # their indices.
+        first = len(self.rate)
+        parents = np.broadcast_to(np.asarray(-1 if parent is None else parent, dtype=np.int64), (count,))
+        self.rate = np.concatenate([self.rate, np.broadcast_to(np.asarray(rate, dtype=float), (count,))])
+        self.capacity = np.concatenate([self.capacity, np.broadcast_to(np.asarray(capacity, dtype=float), (count,))])
+        self.tokens = np.concatenate([self.tokens, self.capacity[first:]])
+        self.updated = np.concatenate([self.updated, np.zeros(count)])
+        self.parent = np.concatenate([self.parent, parents])
+        self.paths.extend((bucket,) + (self.paths[above] if above >= 0 else ())
+                          for bucket, above in zip(range(first, first + count), parents.tolist()))
+        self._path_table = None
+        return list(range(first, first + count))
+
+    def add_bucket(self, rate, capacity, parent=None):
+        return self.add_buckets(rate, capacity, parent)[0]
+
+    def refill(self, buckets, now):
+        # Tops up the given buckets (an index array) to simulated time now
+        elapsed = np.maximum(now - self.updated[buckets], 0)
+        self.tokens[buckets] = np.minimum(self.capacity[buckets], self.tokens[buckets] + elapsed * self.rate[buckets])
+        self.updated[buckets] = np.maximum(self.updated[buckets], now)
+
+    def _refill_path(self, path, now):
+        tokens, updated = self.tokens, self.updated
+        for bucket in path:
+            elapsed = now - updated[bucket]
+            if elapsed > 0:
+                tokens[bucket] = min(self.capacity[bucket], tokens[bucket] + elapsed * self.rate[bucket])
+                updated[bucket] = now
+
+    def admit(self, bucket, now, size=1):
+        # Charges size tokens to bucket and its ancestors if all have them
+        path = self.paths[bucket]
+        self._refill_path(path, now)
+        tokens = self.tokens
+        for member in path:
+            if tokens[member] + TOLERANCE < size:
+                return False
+        for member in path:
+            tokens[member] -= size
+        return True
+
+    def affordable(self, bucket, now, size=1):
+        # How many packets of size admit(bucket, now, size) would pass in a row
+        path = self.paths[bucket]
+        self._refill_path(path, now)
+        return int(min((self.tokens[member] + TOLERANCE) // size for member in path))
+
+    def eligible_time(self, bucket, now, size=1):
+        # Earliest simulated time at which admit(bucket, ..., size) succeeds if
+        # nothing else draws from the same buckets first; inf if never
+        path = self.paths[bucket]
+        self._refill_path(path, now)
+        eligible = now
+        for member in path:
+            shortfall = size - self.tokens[member]
+            if shortfall > 0:
+                if size > self.capacity[member] or self.rate[member] <= 0:
+                    return math.inf
+                # At large times a tiny shortfall can round back to now,
+                # which would reschedule the same instant forever
+                eligible = max(eligible, now + shortfall / self.rate[member], math.nextafter(now, math.inf))
+        return eligible
+
+    def path_table(self):
+        # (buckets, depth) array of every bucket's path, padded with -1
+        if self._path_table is None:
+            depth = max((len(path) for path in self.paths), default=0)
+            self._path_table = np.full((len(self.paths), depth), -1, dtype=np.int64)
+            for bucket, path in enumerate(self.paths):
+                self._path_table[bucket, :len(path)] = path
+        return self._path_table
+
+    def admit_batch(self, buckets, now, sizes=1):
+        # A burst of packets arriving together at simulated time now, decided
+        # in order as repeated admit() calls would. When every bucket can
+        # cover its whole share of the burst, the burst is charged in one
+        # vectorized step; otherwise packets are decided one at a time.
+        buckets = np.asarray(buckets, dtype=np.int64)
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=float), buckets.shape)
+        paths = self.path_table()[buckets]
+        members = paths[paths >= 0]
+        charges = np.broadcast_to(sizes[:, None], paths.shape)[paths >= 0]
+        touched = np.unique(members)
+        self.refill(touched, now)
+        demand = np.bincount(members, weights=charges, minlength=len(self.rate))
+        if np.all(demand[touched] <= self.tokens[touched] + TOLERANCE):
+            self.tokens[touched] -= demand[touched]
+            return np.ones(len(buckets), dtype=bool)
+        return np.array([self.admit(bucket, now, size) for bucket, size in zip(buckets.tolist(), sizes.tolist())], dtype=bool)
@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+
+
+# Constant-memory metric accumulators. Nothing here keeps per-packet values:
+# moments are updated online, latency percentiles come from a log-bucketed
+# histogram, and per-interval series live in NumPy arrays sized by simulated
+# time rather than by packet count.
+
+
+class RunningStats:
+    # Welford's online mean and variance
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values):
+            batch = RunningStats()
+            batch.count = len(values)
+            batch.mean = float(values.mean())
+            batch.m2 = float(((values - batch.mean) ** 2).sum())
+            self.merge(batch)
+
+    def merge(self, other):
+        # Chan et al.'s pairwise update: as if other's values had been added here
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        # Population variance, matching np.var/np.std defaults
+        return self.m2 / self.count if self.count > 0 else 0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+
+class LatencyHistogram:
+    # HDR-style histogram: values below sub_bucket_count * unit are counted
+    # linearly, above that every power of two is split into sub_bucket_count / 2
+    # equal slices, so any recorded value is off by at most 2 ** -precision_bits
+    # relative error. Values above highest are counted in the last bucket.
+    def __init__(self, unit=1e-3, highest=1e7, precision_bits=7):
+        self.unit = unit
+        self.precision_bits = precision_bits
+        self.sub_bucket_count = 2 ** precision_bits
+        self.half_count = self.sub_bucket_count // 2
+        self.counts = np.zeros(self._index(highest) + 1, dtype=np.int64)
+        self.total = 0
+
+    def _index(self, value):
+        scaled = value / self.unit
+        if scaled < self.sub_bucket_count:
+            return int(scaled) if scaled > 0 else 0
+        mantissa, exponent = math.frexp(scaled)
+        sub_bucket = int(mantissa * self.sub_bucket_count)
+        return self.half_count * (exponent - self.precision_bits) + sub_bucket
+
+    def _lower_bound(self, index):
+        if index < self.sub_bucket_count:
+            return index * self.unit
+        exponent, sub_bucket = divmod(index, self.half_count)
+        exponent += self.precision_bits - 1
+        sub_bucket += self.half_count
+        return sub_bucket / self.sub_bucket_count * 2.0 ** exponent * self.unit
+
+    def add(self, value):
+        index = self._index(value)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.total += 1
+
+    def add_many(self, values):
+        # Vectorized add() of every value
+        scaled = np.asarray(values, dtype=float) / self.unit
+        mantissa, exponent = np.frexp(scaled)
+        logarithmic = self.half_count * (exponent - self.precision_bits) + (mantissa * self.sub_bucket_count).astype(np.int64)
+        linear = np.where(scaled > 0, scaled, 0).astype(np.int64)
+        indices = np.where(scaled < self.sub_bucket_count, linear, logarithmic)
+        np.minimum(indices, len(self.counts) - 1, out=indices)
+        self.counts += np.bincount(indices, minlength=len(self.counts))
+        self.total += len(indices)
+
+    def merge(self, other):
+        # Histograms with the same unit, highest and precision simply add up
+        self.counts += other.counts
+        self.total += other.total
+
+    def percentile(self, q):
+        # Midpoint of the bucket holding the q-th percentile (q in 0..100)
+        if self.total == 0:
+            return 0
+        rank = max(1, math.ceil(q / 100 * self.total))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return (self._lower_bound(index) + self._lower_bound(index + 1)) / 2
+
+    def percentiles(self, qs=(50, 99, 99.9)):
+        return {q: self.percentile(q) for q in qs}
+
+
+class TimeBinnedMetrics:
+    # Per-interval series in preallocated arrays, one per column. The arrays
+    # double when simulated time runs past the last bin, so memory follows the
+    # simulated duration and never the number of packets.
+    def __init__(self, columns, bin_width=1.0, num_bins=1024):
+        self.bin_width = bin_width
+        self.columns = {name: np.zeros(num_bins) for name in columns}
+        self.used = 0
+
+    def _bin(self, time):
+        index = int(time // self.bin_width)
+        size = len(next(iter(self.columns.values())))
+        if index >= size:
+            while size <= index:
+                size *= 2
+            for name, values in self.columns.items():
+                grown = np.zeros(size)
+                grown[:len(values)] = values
+                self.columns[name] = grown
+        self.used = max(self.used, index + 1)
+        return index
+
+    def add(self, time, column, value):
+        index = self._bin(time)
+        self.columns[column][index] += value
+
+    def set(self, time, column, value):
+        index = self._bin(time)
+        self.columns[column][index] = value
+
+    def series(self, column):
+        return self.columns[column][:self.used]
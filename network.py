@@ -1,16 +1,292 @@
-import networkx as nx
+import math
+from collections.abc import Mapping
+
 import numpy as np
 
+import random_streams
+from routing import LazyNextHops, compute_next_hops
+from topology_cache import cached_next_hops, load_topology
+
+WAXMAN_MAX_CELLS = 64  # Grid side limit of the Waxman candidate sampler
+
+
+def _make_rng(seed=None, streams=None):
+    # Without an explicit seed, topologies come from the 'topology' stream of
+    # the owning simulator's RandomStreams, or of the shared default_streams
+    # (which random_streams.seed() makes reproducible) for a standalone network
+    if seed is None:
+        return (streams or random_streams.default_streams).generator('topology')
+    return np.random.default_rng(seed)
+
+
+def _diameter(positions):
+    # Largest pairwise distance. The farthest pair lies on the convex hull
+    # (Andrew's monotone chain), which for random points has few vertices.
+    if len(positions) < 2:
+        return 0.0
+    points = positions[np.lexsort((positions[:, 1], positions[:, 0]))].tolist()
+
+    def chain(points):
+        hull = []
+        for x, y in points:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (y - hull[-2][1])
+                                      - (hull[-1][1] - hull[-2][1]) * (x - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append((x, y))
+        return hull[:-1]
+
+    hull = np.array(chain(points) + chain(points[::-1]) or points[:1])
+    differences = hull[:, None, :] - hull[None, :, :]
+    return float(np.sqrt((differences ** 2).sum(axis=2)).max())
+
+
+class LinkView(Mapping):
+    # Read-only {(u, v): {"bandwidth": ..., "latency": ...}} view over the link
+    # arrays, for code written against the old dict of dicts. Both directions
+    # of an undirected link are present, as before.
+    def __init__(self, network):
+        self.network = network
+
+    def __getitem__(self, link):
+        edge = self.network.link_id(*link)
+        return {"bandwidth": float(self.network.bandwidth[edge]), "latency": float(self.network.latency[edge])}
+
+    def __iter__(self):
+        network = self.network
+        rows = np.repeat(np.arange(network.num_nodes), np.diff(network.indptr))
+        return zip(rows.tolist(), network.indices.tolist())
+
+    def __len__(self):
+        return len(self.network.indices)
+
+
 class Network:
-    def __init__(self):
-        self.graph = nx.Graph()
-        self.links = {}
-
-    def generate_barabasi_albert_topology(self, n, m):
-        self.graph = nx.barabasi_albert_graph(n, m)
-        self.initialize_links()
-
-    def initialize_links(self):
-        for u, v in self.graph.edges():
-            self.links[(u, v)] = {"bandwidth": np.random.uniform(10, 100), "latency": np.random.uniform(1, 10)}
-            self.links[(v, u)] = self.links[(u, v)]
+    # Undirected topology held as arrays: edges is an (E, 2) array, bandwidth
+    # and latency are per-edge columns, and indptr/indices/edge_ids form a CSR
+    # adjacency with each row sorted by neighbour. A networkx graph is only
+    # built when something asks for self.graph.
+    DENSE_NEXT_HOPS = 4096  # Largest network given a full next-hop table
+
+    def __init__(self, random=None):
+        self.random = random  # RandomStreams of the simulator that owns this network
+        self.next_hops = {}  # Next-hop tables per routing weight, built once per topology
+        self.cache_path = None  # Cache directory the current topology was loaded from
+        self.load_edges(0, np.empty((0, 2), dtype=np.int64), np.empty(0), np.empty(0))
+
+    def generate_barabasi_albert_topology(self, n, m, seed=None):
+        # Same growth process as networkx.barabasi_albert_graph: start from a
+        # star on m + 1 nodes, then attach each new node to m distinct targets
+        # drawn with probability proportional to degree. The node loop is
+        # inherently sequential, but all random draws are made up front.
+        if m < 1 or m >= n:
+            raise ValueError(f"Barabasi-Albert needs 1 <= m < n, got m={m}, n={n}")
+        rng = _make_rng(seed, self.random)
+        num_edges = m + (n - m - 1) * m
+        sources = [0] * m
+        targets_so_far = list(range(1, m + 1))
+        # Every edge endpoint appears once in repeated, so a uniform pick from it
+        # is degree-proportional
+        repeated = [0] * (2 * num_edges)
+        repeated[0:2 * m:2] = sources
+        repeated[1:2 * m:2] = targets_so_far
+        filled = 2 * m
+        draws = rng.random((n, 2 * m + 4))
+        for source in range(m + 1, n):
+            targets = []
+            for draw in draws[source].tolist():
+                target = repeated[int(draw * filled)]
+                if target not in targets:
+                    targets.append(target)
+                    if len(targets) == m:
+                        break
+            while len(targets) < m:
+                target = repeated[int(rng.integers(filled))]
+                if target not in targets:
+                    targets.append(target)
+            for target in targets:
+                sources.append(source)
+                targets_so_far.append(target)
+                repeated[filled] = target
+                repeated[filled + 1] = source
+                filled += 2
+        self.load_edges(n, np.column_stack([sources, targets_so_far]), rng=rng)
+
+    def generate_waxman_topology(self, n, alpha=0.4, beta=0.1, seed=None):
+        # Waxman model as in networkx.waxman_graph: nodes uniform in the unit
+        # square, u-v linked with probability beta * exp(-d / (alpha * L)) where
+        # L is the largest pairwise distance. Pairs are never enumerated: nodes
+        # are bucketed into a grid, and for each offset between two grid cells
+        # candidates are drawn with the largest probability any pair at that
+        # offset can have, then thinned to the exact one. The work is about
+        # proportional to the number of links, plus the grid's cell pairs:
+        # roughly 1 us per link on one core (100k nodes with alpha=0.4 and
+        # beta=0.001, 2.2M links: 4.7s). With the default beta=0.1 the link
+        # count itself grows as n^2 (2.2M at 10k nodes), so memory, not time,
+        # limits those networks to a few tens of thousands of nodes.
+        rng = _make_rng(seed, self.random)
+        positions = rng.random((n, 2))
+        largest = _diameter(positions)
+        scale = alpha * largest if largest > 0 else 1.0
+        # Cells a tenth of the distance scale keep the thinning overhead near
+        # exp(0.1 * sqrt(8)) = 1.33; the grid is capped so its cell pairs stay cheap
+        cells = int(max(1, min(math.ceil(10 / scale), math.ceil(math.sqrt(n)), WAXMAN_MAX_CELLS)))
+        width = 1.0 / cells
+        column = np.minimum((positions[:, 0] * cells).astype(np.int64), cells - 1)
+        row = np.minimum((positions[:, 1] * cells).astype(np.int64), cells - 1)
+        cell = row * cells + column
+        order = np.argsort(cell, kind='stable')
+        counts = np.bincount(cell, minlength=cells * cells)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        grid = np.arange(cells * cells)
+        grid_row, grid_column = grid // cells, grid % cells
+
+        chunks = []
+        for dy in range(cells):
+            for dx in range(-cells + 1, cells):
+                if dy == 0 and dx < 0:
+                    continue
+                # Cell pairs (a, b) with b = a + (dx, dy), each unordered pair once
+                valid = (grid_column + dx >= 0) & (grid_column + dx < cells) & (grid_row + dy < cells)
+                first = grid[valid]
+                second = first + dy * cells + dx
+                sizes = counts[first] * counts[second]
+                total = int(sizes.sum())
+                gap = math.hypot(max(abs(dx) - 1, 0) * width, max(dy - 1, 0) * width)
+                bound = min(1.0, beta * math.exp(-gap / scale))
+                if total == 0 or bound <= 0:
+                    continue
+                picks = rng.choice(total, rng.binomial(total, bound), replace=False)
+                pair = np.searchsorted(np.cumsum(sizes), picks, side='right')
+                local = picks - (np.cumsum(sizes) - sizes)[pair]
+                u = order[starts[first[pair]] + local // counts[second[pair]]]
+                v = order[starts[second[pair]] + local % counts[second[pair]]]
+                if dx == 0 and dy == 0:
+                    keep = u < v  # Within a cell both orders were candidates
+                    u, v = u[keep], v[keep]
+                distances = np.hypot(positions[u, 0] - positions[v, 0], positions[u, 1] - positions[v, 1])
+                linked = rng.random(len(u)) * bound < beta * np.exp(-distances / scale)
+                chunks.append(np.stack([np.minimum(u, v)[linked], np.maximum(u, v)[linked]], axis=1))
+        edges = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+        edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))] if len(edges) else edges
+        self.load_edges(n, edges, rng=rng)
+        self.positions = positions
+
+    def load_topology(self, generator, seed, cache_dir=None, **params):
+        # Cached equivalent of generate_{generator}_topology(seed=seed, **params):
+        # the arrays are memory-mapped from topology_cache when present
+        load_topology(self, generator, seed, cache_dir, **params)
+
+    def install_arrays(self, num_nodes, arrays):
+        # Adopts prebuilt edge, link and CSR arrays (e.g. memory-mapped ones)
+        self.num_nodes = num_nodes
+        for name, values in arrays.items():
+            setattr(self, name, values)
+        self._graph = None
+        self.next_hops = {}
+
+    def load_edges(self, num_nodes, edges, bandwidth=None, latency=None, rng=None):
+        # Installs an undirected edge list; missing link attributes are drawn
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.num_nodes = num_nodes
+        self.edges = edges
+        self.positions = None
+        self.bandwidth = None if bandwidth is None else np.asarray(bandwidth, dtype=float)
+        self.latency = None if latency is None else np.asarray(latency, dtype=float)
+        self._build_adjacency()
+        self.initialize_links(rng)
+
+    def _build_adjacency(self):
+        num_edges = len(self.edges)
+        sources = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        targets = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        order = np.lexsort((targets, sources))
+        self.indices = targets[order]
+        self.edge_ids = order % num_edges if num_edges else order
+        self.indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.num_nodes), out=self.indptr[1:])
+        # Rows are sorted by source then neighbour, so these keys are ascending
+        self.slot_keys = sources[order] * max(self.num_nodes, 1) + self.indices
+        self._graph = None
+        self.next_hops = {}
+        self.cache_path = None
+
+    def initialize_links(self, rng=None):
+        # Bandwidth and latency for every edge in two vectorized draws
+        num_edges = len(self.edges)
+        if num_edges == 0:
+            self.bandwidth = np.empty(0)
+            self.latency = np.empty(0)
+        rng = rng if rng is not None or num_edges == 0 else _make_rng(streams=self.random)
+        if self.bandwidth is None or len(self.bandwidth) != num_edges:
+            self.bandwidth = rng.uniform(10, 100, num_edges)
+        if self.latency is None or len(self.latency) != num_edges:
+            self.latency = rng.uniform(1, 10, num_edges)
+        self._graph = None
+        self.next_hops = {}
+
+    def link_slot(self, u, v):
+        # Position of the directed link u -> v in the CSR arrays
+        key = u * max(self.num_nodes, 1) + v
+        slot = int(np.searchsorted(self.slot_keys, key))
+        if slot >= len(self.slot_keys) or self.slot_keys[slot] != key:
+            raise KeyError((u, v))
+        return slot
+
+    def link_id(self, u, v):
+        # Index of the undirected edge u-v in the edge arrays
+        return int(self.edge_ids[self.link_slot(u, v)])
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    @property
+    def links(self):
+        return LinkView(self)
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            import networkx as nx
+            graph = nx.Graph()
+            graph.add_nodes_from(range(self.num_nodes))
+            graph.add_edges_from(
+                (u, v, {"bandwidth": bandwidth, "latency": latency})
+                for (u, v), bandwidth, latency in zip(self.edges.tolist(), self.bandwidth.tolist(), self.latency.tolist())
+            )
+            self._graph = graph
+        return self._graph
+
+    def __getstate__(self):
+        # The networkx view is rebuilt on demand rather than pickled
+        state = self.__dict__.copy()
+        state['_graph'] = None
+        return state
+
+    def number_of_nodes(self):
+        return self.num_nodes
+
+    def number_of_links(self):
+        return len(self.edges)
+
+    def next_hop_table(self, weight='latency'):
+        # weight is a link attribute to minimise, or None for fewest hops. The
+        # dense table costs one Dijkstra per node and N^2 small integers (with
+        # SciPy on one core: 1.3s and 8 MB at 2000 nodes, 35s and 200 MB at
+        # 10000), so above DENSE_NEXT_HOPS nodes rows are computed per node
+        # as forwarding first needs them (about 4 ms each at 10000 nodes).
+        if weight not in self.next_hops:
+            if self.num_nodes > self.DENSE_NEXT_HOPS:
+                indptr, indices, costs = self._routing_arrays(weight)
+                self.next_hops[weight] = LazyNextHops(indptr, indices, costs)
+            elif self.cache_path is not None:
+                self.next_hops[weight] = cached_next_hops(self.cache_path, weight, lambda: self._compute_next_hops(weight))
+            else:
+                self.next_hops[weight] = self._compute_next_hops(weight)
+        return self.next_hops[weight]
+
+    def _routing_arrays(self, weight):
+        costs = np.ones(len(self.indices)) if weight is None else np.asarray(getattr(self, weight))[self.edge_ids]
+        return np.asarray(self.indptr), np.asarray(self.indices), costs
+
+    def _compute_next_hops(self, weight):
+        return compute_next_hops(*self._routing_arrays(weight))
@@ -0,0 +1,165 @@
+import numpy as np
+
+from sweep import confidence_interval
+
+# Steady-state output analysis. A run is cut into slices of simulated time and
+# the arrivals, departures, drops and latency of every slice are recorded. The
+# MSER rule finds where the initial transient ends, that prefix is discarded,
+# and the rest is grouped into batches whose means give t confidence intervals
+# for throughput, average latency and drop rate (as in calculate_metrics).
+# Runs stop as soon as every interval is narrow enough:
+#
+#   simulator.add_source(ArrivalSource.synthetic(10 ** 7, 'poisson', rate=0.15))
+#   report = run_until_precise(simulator, relative_precision=0.05)
+#   report['estimates']['average_latency'], report['events']
+#
+# replicate_until_precise does the same across independent replications.
+
+ESTIMATES = ('throughput', 'average_latency', 'packet_drop_rate')
+COLUMNS = ('arrivals', 'departures', 'drops', 'latency', 'events')
+
+
+def mser_truncation(series, batch_size=5):
+    # MSER-5: number of leading observations to delete, minimising the
+    # standard error of the mean of what is left. Only the first half of the
+    # run is searched; a minimum there means the transient has not ended.
+    values = np.asarray(series, dtype=float)
+    num_batches = len(values) // batch_size
+    if num_batches < 4:
+        return 0
+    batches = values[:num_batches * batch_size].reshape(num_batches, batch_size).mean(axis=1)
+    counts = np.arange(num_batches, 0, -1)
+    sums = np.cumsum(batches[::-1])[::-1]
+    squares = np.cumsum(batches[::-1] ** 2)[::-1]
+    statistic = (squares - sums ** 2 / counts) / counts ** 2
+    return int(np.argmin(statistic[:num_batches // 2 + 1])) * batch_size
+
+
+def _totals(simulator):
+    # Cumulative counters of either simulator (cubic_simulator keeps them per flow)
+    def total(value):
+        return sum(value.values()) if isinstance(value, dict) else value
+
+    if hasattr(simulator, 'arrival_counts'):
+        return (total(simulator.arrival_counts), total(simulator.departure_counts),
+                total(simulator.dropped_packets), total(simulator.total_latencies))
+    return simulator.arrival_count, simulator.departure_count, simulator.dropped_packets, simulator.total_latency
+
+
+def _ratio(numerators, denominators):
+    return np.divide(numerators, denominators, out=np.full(len(numerators), np.nan), where=denominators > 0)
+
+
+def _filled(values):
+    # Carries the last defined value over slices where a ratio is undefined
+    values = values.copy()
+    defined = ~np.isnan(values)
+    if not defined.any():
+        return np.zeros(len(values))
+    positions = np.where(defined, np.arange(len(values)), 0)
+    np.maximum.accumulate(positions, out=positions)
+    values = values[positions]
+    values[:np.argmax(defined)] = values[np.argmax(defined)]
+    return values
+
+
+def slice_metrics(slices, slice_width):
+    # Per-slice throughput, average latency and drop rate
+    slices = np.asarray(slices, dtype=float).reshape(-1, len(COLUMNS))
+    arrivals, departures, drops, latency = slices[:, 0], slices[:, 1], slices[:, 2], slices[:, 3]
+    return {'throughput': departures / slice_width,
+            'average_latency': _ratio(latency, departures),
+            'packet_drop_rate': _ratio(drops, arrivals)}
+
+
+def warm_up_slices(slices, slice_width, batch_size=5):
+    # The latest MSER truncation point over the three metrics
+    return max(mser_truncation(_filled(series), batch_size) for series in slice_metrics(slices, slice_width).values())
+
+
+def _precise(estimates, relative_precision):
+    return all(half_width <= relative_precision * abs(mean) or (mean == 0 and half_width == 0)
+               for mean, half_width in estimates.values())
+
+
+def batch_means(slices, slice_width, warm_up=None, num_batches=20, confidence=0.95):
+    # Confidence intervals from num_batches consecutive batches of the slices
+    # after warm-up. Returns (warm-up slices, {metric: (mean, half width)}).
+    slices = np.asarray(slices, dtype=float).reshape(-1, len(COLUMNS))
+    if warm_up is None:
+        warm_up = warm_up_slices(slices, slice_width)
+    batch_size = (len(slices) - warm_up) // num_batches
+    if batch_size == 0:
+        return warm_up, {name: (float('nan'), float('nan')) for name in ESTIMATES}
+    start = len(slices) - batch_size * num_batches  # Any remainder joins the warm-up
+    batches = slices[start:].reshape(num_batches, batch_size, len(COLUMNS)).sum(axis=1)
+    metrics = slice_metrics(batches, slice_width * batch_size)
+    estimates = {}
+    for name in ESTIMATES:
+        values = metrics[name][~np.isnan(metrics[name])]
+        estimates[name] = confidence_interval(values, confidence) if len(values) else (0.0, 0.0)
+    return start, estimates
+
+
+def run_until_precise(simulator, relative_precision=0.05, confidence=0.95, slice_width=1.0, num_batches=20,
+                      check_every=20, max_time=None):
+    # Runs simulator in slices of simulated time until the batch-means interval
+    # of every metric is within relative_precision of its mean, the events run
+    # out, or simulated time reaches max_time. Checks are at least check_every
+    # slices and 10% of the run apart, so they cost little however long it
+    # gets. Returns a report of the estimates, the warm-up that was discarded
+    # and the events it all took.
+    slices = []
+    next_check = check_every
+    previous = _totals(simulator)
+    end = 0.0
+    estimates = {}
+    warm_up = 0
+    converged = False
+    while simulator.scheduler.has_events() and (max_time is None or end < max_time):
+        end += slice_width
+        events = simulator.run_simulation(until=end)
+        totals = _totals(simulator)
+        slices.append([current - before for current, before in zip(totals, previous)] + [events])
+        previous = totals
+        if check_every and len(slices) >= next_check:
+            next_check = max(len(slices) + check_every, int(len(slices) * 1.1))
+            warm_up, estimates = batch_means(slices, slice_width, num_batches=num_batches, confidence=confidence)
+            if _precise(estimates, relative_precision):
+                converged = True
+                break
+    if not converged and slices:
+        warm_up, estimates = batch_means(slices, slice_width, num_batches=num_batches, confidence=confidence)
+        converged = _precise(estimates, relative_precision)
+    processed = [row[4] for row in slices]
+    return {'estimates': estimates, 'converged': converged, 'events': int(sum(processed)),
+            'warm_up_events': int(sum(processed[:warm_up])), 'warm_up_time': warm_up * slice_width,
+            'simulated_time': end, 'slices': len(slices)}
+
+
+def replicate_until_precise(make_simulator, relative_precision=0.05, confidence=0.95, slice_width=1.0,
+                            min_replications=3, max_replications=100, base_seed=0):
+    # Independent replications, each seeded from its own SeedSequence child,
+    # run to completion with MSER warm-up deletion. make_simulator(seed) must
+    # return a simulator with its arrivals loaded. Stops once the t interval
+    # across replications is within relative_precision for every metric.
+    seeds = np.random.SeedSequence(base_seed).spawn(max_replications)
+    samples = {name: [] for name in ESTIMATES}
+    events = warm_up_events = 0
+    estimates = {}
+    converged = False
+    for seed in seeds:
+        simulator = make_simulator(seed)
+        report = run_until_precise(simulator, relative_precision=0, slice_width=slice_width, num_batches=1,
+                                   check_every=None)
+        for name in ESTIMATES:
+            samples[name].append(report['estimates'][name][0])
+        events += report['events']
+        warm_up_events += report['warm_up_events']
+        if len(samples[ESTIMATES[0]]) >= min_replications:
+            estimates = {name: confidence_interval(values, confidence) for name, values in samples.items()}
+            if _precise(estimates, relative_precision):
+                converged = True
+                break
+    return {'estimates': estimates, 'converged': converged, 'replications': len(samples[ESTIMATES[0]]),
+            'events': events, 'warm_up_events': warm_up_events}
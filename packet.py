@@ -1,7 +1,26 @@
-import random
+import itertools
+
+import random_streams
+
+packet_ids = itertools.count()
 
 class Packet:
-    def __init__(self, arrival_time, priority=1):
+    # Slotted: no per-instance __dict__, which matters at millions of packets
+    __slots__ = ('packet_id', 'arrival_time', 'processing_time', 'priority', 'flow_id',
+                 'source', 'destination', 'node', 'hops', 'size')
+
+    def __init__(self, arrival_time, priority=1, flow_id=None, processing_time=None, source=None, destination=None, size=1.0):
+        self.packet_id = next(packet_ids)
         self.arrival_time = arrival_time
-        self.processing_time = random.uniform(1, 10)
-        self.priority = priority
\ No newline at end of file
+        if processing_time is None:
+            processing_time = random_streams.default_streams.stream('processing_time').uniform(1, 10)
+        self.processing_time = processing_time
+        self.priority = priority
+        self.flow_id = flow_id
+        # Multi-hop packets travel from source to destination through the network;
+        # node is where the packet currently is
+        self.source = source
+        self.destination = destination
+        self.node = source
+        self.hops = 0
+        self.size = size
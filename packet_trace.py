@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+
+# Packet-level trace recorder. Every arrival, admission, drop, hop and
+# departure becomes one fixed-width record (RECORD_DTYPE). Records collect in
+# a bounded in-memory buffer and are flushed in blocks into a memory-mapped
+# file that doubles in size as needed; close() trims it and writes a small
+# JSON sidecar with the record count and the flow names. trace_analysis
+# reads the result back with np.memmap.
+#
+#   simulator.trace = TraceRecorder('run.trace')
+#   simulator.run_simulation()
+#   simulator.trace.close()
+
+ARRIVAL, ADMIT, DROP, HOP, DEPARTURE = range(5)
+KIND_NAMES = ('arrival', 'admit', 'drop', 'hop', 'departure')
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('packet_id', '<i8'),
+    ('value', '<f8'),  # Processing time for arrivals, latency for departures, 0 otherwise
+    ('node', '<i4'),  # Current node for multi-hop packets, -1 on a single link
+    ('flow', '<i4'),  # Index into the sidecar's flow names, -1 without a flow id
+    ('priority', '<i2'),
+    ('kind', 'u1'),
+])
+
+
+def meta_path(path):
+    return path + '.json'
+
+
+class TraceRecorder:
+    def __init__(self, path, buffer_size=65536, initial_records=1 << 20):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.count = 0
+        self.flows = {}
+        self.capacity = 0
+        self.file = None
+        open(path, 'wb').close()
+        self._grow(max(initial_records, 1))  # np.memmap cannot map an empty file
+
+    def _grow(self, capacity):
+        # Extend the file and map it again; existing records stay in place
+        if self.file is not None:
+            self.file.flush()
+            del self.file
+        with open(self.path, 'ab') as handle:
+            handle.truncate(capacity * RECORD_DTYPE.itemsize)
+        self.file = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def flow_index(self, flow_id):
+        if flow_id is None:
+            return -1
+        index = self.flows.get(flow_id)
+        if index is None:
+            index = self.flows[flow_id] = len(self.flows)
+        return index
+
+    def record(self, kind, time, packet, value=0.0):
+        if kind == ARRIVAL:
+            value = packet.processing_time  # Lets arrivals.ArrivalSource.replay rebuild the packet
+        node = packet.node
+        self.buffer.append((time, packet.packet_id, value, -1 if node is None else node,
+                            self.flow_index(packet.flow_id), packet.priority, kind))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        block = np.array(self.buffer, dtype=RECORD_DTYPE)
+        self.buffer = []
+        end = self.count + len(block)
+        if end > self.capacity:
+            capacity = max(self.capacity, 1)
+            while capacity < end:
+                capacity *= 2
+            self._grow(capacity)
+        self.file[self.count:end] = block
+        self.count = end
+
+    def close(self):
+        self.flush()
+        self.file.flush()
+        del self.file
+        self.file = None
+        with open(self.path, 'r+b') as handle:
+            handle.truncate(self.count * RECORD_DTYPE.itemsize)
+        flows = sorted(self.flows, key=self.flows.get)
+        with open(meta_path(self.path), 'w') as handle:
+            json.dump({'records': self.count, 'flows': flows, 'kinds': KIND_NAMES,
+                       'dtype': RECORD_DTYPE.descr}, handle)
+
+
+def load_records(path):
+    # (records, flow names) with the records memory-mapped read-only
+    with open(meta_path(path)) as handle:
+        meta = json.load(handle)
+    # The layout comes from the sidecar, so traces written before a dtype change still read correctly
+    dtype = np.dtype([tuple(field) for field in meta['dtype']])
+    if meta['records'] == 0 or os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype), meta['flows']
+    return np.memmap(path, dtype=dtype, mode='r', shape=(meta['records'],)), meta['flows']
@@ -0,0 +1,380 @@
+import heapq
+import math
+import multiprocessing
+import os
+import warnings
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import LatencyHistogram, RunningStats
+from packet import Packet
+from routing import Forwarder
+
+# Conservative parallel run of Simulator's multi-hop traffic. The nodes are
+# split into partitions, each simulated by its own worker process, and time
+# advances in YAWNS windows: every window starts at the earliest pending event
+# anywhere and is `lookahead` long, where lookahead is the smallest latency of
+# a link between two partitions. A packet handed to another partition arrives
+# at least one lookahead after it was sent, so it always lands in a later
+# window, and each partition can process its own window without hearing from
+# the others. Packets crossing partitions are exchanged through shared memory
+# once per window (see Exchange).
+#
+#   simulator.network.generate_barabasi_albert_topology(10000, 2, seed=1)
+#   simulator.initialize_traffic(num_events=100000)
+#   run_parallel(simulator, num_partitions=8)
+#   simulator.calculate_metrics()
+#
+# Events carry the sequential scheduler's key, (time, rank, order): rank is
+# the packet priority under 'PQ' and 0 otherwise, order the tie-break the
+# event was scheduled with. Simulator schedules every multi-hop arrival and hop
+# with the packet id as its order, which a partition can compute on its own,
+# and events already pending when the run starts keep the order they have, so
+# exact time ties are broken the same way in both engines and results match.
+
+
+def partition_nodes(network, num_partitions):
+    # Owner of every node: consecutive runs of a breadth-first order, so that
+    # neighbours mostly share a partition and few links are cut
+    num_nodes = network.number_of_nodes()
+    indptr, indices = network.indptr.tolist(), network.indices.tolist()
+    order = []
+    seen = [False] * num_nodes
+    for root in range(num_nodes):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbour in indices[indptr[node]:indptr[node + 1]]:
+                if not seen[neighbour]:
+                    seen[neighbour] = True
+                    queue.append(neighbour)
+    owner = np.empty(num_nodes, dtype=np.int32)
+    owner[order] = np.arange(num_nodes) * num_partitions // max(num_nodes, 1)
+    return owner
+
+
+def lookahead(network, owner):
+    # Smallest latency of a link between partitions (of any link if none is cut)
+    rows = np.repeat(np.arange(network.number_of_nodes()), np.diff(network.indptr))
+    latency = network.latency[network.edge_ids]
+    cut = owner[rows] != owner[network.indices]
+    candidates = latency[cut] if cut.any() else latency
+    return float(candidates.min()) if len(candidates) else math.inf
+
+
+class Partition:
+    # One partition's share of the run: its pending events and the links
+    # leaving its nodes. Events are (time, rank, order, packet_id, is_arrival,
+    # packet); the packet id only separates events whose keys are equal.
+    def __init__(self, index, owner, forwarder, events, by_priority=False):
+        self.index = index
+        self.owner = owner.tolist()
+        self.forwarder = forwarder
+        self.by_priority = by_priority
+        self.events = events
+        heapq.heapify(self.events)
+        self.arrival_count = 0
+        self.departure_count = 0
+        self.dropped_packets = 0
+        self.total_latency = 0
+        self.latency_stats = RunningStats()
+        self.latency_histogram = LatencyHistogram()
+        self.simulation_end_time = 0
+
+    def next_time(self):
+        return self.events[0][0] if self.events else math.inf
+
+    def step(self, window_end, incoming):
+        # Processes every event before window_end. Returns the packets sent to
+        # other partitions, by partition, and the time of the next local event.
+        events = self.events
+        for entry in incoming:
+            heapq.heappush(events, entry)
+        owner = self.owner
+        by_priority = self.by_priority
+        outgoing = {}
+        while events and events[0][0] < window_end:
+            time, _, _, _, is_arrival, packet = heapq.heappop(events)
+            if is_arrival:
+                self.arrival_count += 1
+            if packet.node == packet.destination:
+                latency = time - packet.arrival_time
+                self.departure_count += 1
+                self.total_latency += latency
+                self.latency_stats.add(latency)
+                self.latency_histogram.add(latency)
+                self.simulation_end_time = max(self.simulation_end_time, time)
+                continue
+            next_arrival = self.forwarder.forward(packet, time)
+            if next_arrival is None:
+                self.dropped_packets += 1  # No route to the destination
+                continue
+            packet_id = packet.packet_id
+            entry = (next_arrival, packet.priority if by_priority else 0, packet_id, packet_id, False, packet)
+            partition = owner[packet.node]
+            if partition == self.index:
+                heapq.heappush(events, entry)
+            else:
+                outgoing.setdefault(partition, []).append(entry)
+        return outgoing, self.next_time()
+
+    def results(self):
+        return {'arrival_count': self.arrival_count, 'departure_count': self.departure_count,
+                'dropped_packets': self.dropped_packets, 'total_latency': self.total_latency,
+                'latency_stats': self.latency_stats, 'latency_histogram': self.latency_histogram,
+                'simulation_end_time': self.simulation_end_time,
+                'link_free_at': self.forwarder.link_free_at}
+
+
+# Packets handed between partitions travel through shared memory: one block
+# of records per (sender, receiver) pair, in two copies used on alternate
+# windows, so a receiver reads what was sent last window while senders fill
+# the other copy. Only the record counts and any overflow past a block's
+# capacity go through the pipes. The buffers are allocated once per run.
+EXCHANGE_DTYPE = np.dtype([('time', '<f8'), ('rank', '<i8'), ('order', '<i8'), ('packet_id', '<i8'), ('arrival_time', '<f8'), ('processing_time', '<f8'),
+                           ('size', '<f8'), ('source', '<i8'), ('destination', '<i8'), ('node', '<i8'),
+                           ('hops', '<i8'), ('priority', '<i8'), ('is_arrival', 'u1')])
+EXCHANGE_BYTES = 64 << 20  # Shared memory budget for the exchange buffers
+MIN_RECORDS = 256  # Smallest (sender, receiver) block, whatever the budget
+MIN_PARALLEL_EVENTS = 100000  # Fewer pending events than this run sequentially
+
+
+def usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+def _packet(packet_id, arrival_time, processing_time, size, source, destination, node, hops, priority):
+    # A Packet rebuilt from its exchange record; flow ids are not carried, as
+    # multi-hop traffic has none and partitions never read them
+    packet = Packet.__new__(Packet)
+    packet.packet_id = packet_id
+    packet.arrival_time = arrival_time
+    packet.processing_time = processing_time
+    packet.size = size
+    packet.source = source
+    packet.destination = destination
+    packet.node = node
+    packet.hops = hops
+    packet.priority = priority
+    packet.flow_id = None
+    return packet
+
+
+class Exchange:
+    def __init__(self, num_partitions, capacity):
+        self.num_partitions = num_partitions
+        self.capacity = capacity
+        size = 2 * num_partitions * num_partitions * capacity * EXCHANGE_DTYPE.itemsize
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._map()
+
+    def _map(self):
+        shape = (2, self.num_partitions, self.num_partitions, self.capacity)
+        self.records = np.ndarray(shape, dtype=EXCHANGE_DTYPE, buffer=self.memory.buf)
+
+    def __getstate__(self):
+        # Spawned workers attach to the same block by name
+        return {'num_partitions': self.num_partitions, 'capacity': self.capacity, 'memory': self.memory}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._map()
+
+    def write(self, copy, sender, outgoing):
+        # Stores sender's outgoing packets; returns the count per receiver and
+        # whatever did not fit, by receiver
+        counts = [0] * self.num_partitions
+        overflow = {}
+        for receiver, entries in outgoing.items():
+            count = min(len(entries), self.capacity)
+            self.records[copy, sender, receiver, :count] = [
+                (time, rank, order, packet_id, packet.arrival_time, packet.processing_time, packet.size,
+                 packet.source, packet.destination, packet.node, packet.hops, packet.priority, is_arrival)
+                for time, rank, order, packet_id, is_arrival, packet in entries[:count]]
+            counts[receiver] = count
+            if len(entries) > count:
+                overflow[receiver] = entries[count:]
+        return counts, overflow
+
+    def read(self, copy, receiver, counts):
+        # The entries every sender stored for receiver, counts[sender] each
+        entries = []
+        for sender, count in enumerate(counts):
+            if count:
+                for (time, rank, order, packet_id, arrival_time, processing_time, size, source, destination, node,
+                     hops, priority, is_arrival) in self.records[copy, sender, receiver, :count].tolist():
+                    packet = _packet(packet_id, arrival_time, processing_time, size, source, destination, node, hops,
+                                     priority)
+                    entries.append((time, rank, order, packet_id, bool(is_arrival), packet))
+        return entries
+
+    def close(self):
+        del self.records
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _serve(connection, partition, exchange):
+    # Worker process loop: one window per message, results on None. A window
+    # message names which copy of the buffers to read; this window's packets
+    # go into the other one.
+    index = partition.index
+    while True:
+        message = connection.recv()
+        if message is None:
+            connection.send(partition.results())
+            connection.close()
+            return
+        window_end, copy, counts, overflow = message
+        incoming = exchange.read(copy, index, counts) + overflow
+        outgoing, next_time = partition.step(window_end, incoming)
+        sent, overflow = exchange.write(1 - copy, index, outgoing)
+        earliest = min((entry[0] for entries in outgoing.values() for entry in entries), default=math.inf)
+        connection.send((sent, overflow, min(next_time, earliest)))
+
+
+class _Worker:
+    # A Partition in a child process. The network and next-hop table are
+    # inherited when the platform forks, and pickled across otherwise.
+    def __init__(self, context, partition, exchange):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, partition, exchange), daemon=True)
+        self.process.start()
+        child.close()
+
+    def send(self, message):
+        self.connection.send(message)
+
+    def receive(self):
+        return self.connection.recv()
+
+    def finish(self):
+        self.connection.send(None)
+        results = self.connection.recv()
+        self.process.join()
+        return results
+
+
+def _run_local(partitions, window):
+    # Steps the partitions in this process, handing packet lists across
+    num_partitions = len(partitions)
+    incoming = [[] for _ in range(num_partitions)]
+    start = min(partition.next_time() for partition in partitions)
+    windows = 0
+    while start < math.inf:
+        window_end = start + window
+        replies = [partition.step(window_end, batch) for partition, batch in zip(partitions, incoming)]
+        incoming = [[] for _ in range(num_partitions)]
+        start = math.inf
+        for outgoing, next_time in replies:
+            start = min(start, next_time)
+            for partition, batch in outgoing.items():
+                incoming[partition].extend(batch)
+                start = min(start, min(entry[0] for entry in batch))
+        windows += 1
+    return windows, [partition.results() for partition in partitions]
+
+
+def _run_workers(partitions, window):
+    # One process per partition, exchanging packets through shared memory
+    num_partitions = len(partitions)
+    capacity = max(MIN_RECORDS, EXCHANGE_BYTES // (2 * num_partitions * num_partitions * EXCHANGE_DTYPE.itemsize))
+    exchange = Exchange(num_partitions, capacity)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    try:
+        workers = [_Worker(context, partition, exchange) for partition in partitions]
+        counts = [[0] * num_partitions for _ in range(num_partitions)]  # counts[sender][receiver], last window
+        overflow = [[] for _ in range(num_partitions)]
+        copy = 0
+        start = min(partition.next_time() for partition in partitions)
+        windows = 0
+        while start < math.inf:
+            window_end = start + window
+            for receiver, worker in enumerate(workers):
+                worker.send((window_end, copy, [row[receiver] for row in counts], overflow[receiver]))
+            overflow = [[] for _ in range(num_partitions)]
+            start = math.inf
+            for sender, worker in enumerate(workers):
+                counts[sender], spilled, next_time = worker.receive()
+                start = min(start, next_time)
+                for receiver, entries in spilled.items():
+                    overflow[receiver].extend(entries)
+            copy = 1 - copy
+            windows += 1
+        return windows, [worker.finish() for worker in workers]
+    finally:
+        exchange.close()
+
+
+def run_parallel(simulator, num_partitions=None, processes=True, force=False):
+    # Runs every scheduled multi-hop arrival of simulator to completion across
+    # num_partitions partitions (one per usable CPU by default) and adds the
+    # outcome to simulator's counters and link state. Returns the number of
+    # windows. Unless force is given, runs with fewer than two usable CPUs or
+    # MIN_PARALLEL_EVENTS pending events cannot win and go through
+    # simulator.run_simulation() instead, with a RuntimeWarning saying why, and
+    # None is returned. processes=False steps the partitions in this process,
+    # for debugging.
+    if simulator.trace is not None or simulator.pending_sources:
+        raise ValueError("Parallel runs do not support traces or lazy arrival sources")
+    if processes and not force:
+        cpus, pending = usable_cpus(), len(simulator.scheduler.events)
+        if cpus < 2 or pending < MIN_PARALLEL_EVENTS:
+            warnings.warn(f"run_parallel fell back to the sequential engine ({cpus} usable CPUs, {pending} pending "
+                          f"events, needs 2 and {MIN_PARALLEL_EVENTS}); pass force=True to partition anyway",
+                          RuntimeWarning, stacklevel=2)
+            simulator.run_simulation()
+            return None
+    num_partitions = num_partitions or usable_cpus()
+    if simulator.forwarder is None:
+        simulator.forwarder = Forwarder(simulator.network)
+    network = simulator.network
+    owner = partition_nodes(network, num_partitions)
+    window = lookahead(network, owner)
+    if window <= 0:
+        raise ValueError("Parallel runs need a positive latency on every link between partitions")
+
+    # Pending events keep their place in the scheduler's order
+    by_priority = simulator.scheduler.scheduler_type == 'PQ'
+    events = [[] for _ in range(num_partitions)]
+    item = simulator.scheduler.events.pop()
+    while item is not None:
+        event = item[-1]
+        packet = event.packet
+        if event.event_type not in ("arrival", "hop") or packet is None or packet.destination is None:
+            raise ValueError(f"Parallel runs only carry multi-hop packets, not {event.event_type} events")
+        events[owner[packet.node]].append((item[0], item[1] if by_priority else 0, item[-2], packet.packet_id,
+                                           event.event_type == "arrival", packet))
+        item = simulator.scheduler.events.pop()
+
+    partitions = [Partition(index, owner, simulator.forwarder, events[index], by_priority)
+                  for index in range(num_partitions)]
+    if processes and num_partitions > 1:
+        windows, results = _run_workers(partitions, window)
+    else:
+        windows, results = _run_local(partitions, window)
+
+    link_owner = np.repeat(owner, np.diff(network.indptr))  # Partition of each link's sending node
+    link_free_at = np.array(simulator.forwarder.link_free_at)
+    for index, result in enumerate(results):
+        simulator.arrival_count += result['arrival_count']
+        simulator.departure_count += result['departure_count']
+        simulator.dropped_packets += result['dropped_packets']
+        simulator.total_latency += result['total_latency']
+        simulator.latency_stats.merge(result['latency_stats'])
+        simulator.latency_histogram.merge(result['latency_histogram'])
+        simulator.simulation_end_time = max(simulator.simulation_end_time, result['simulation_end_time'])
+        owned = link_owner == index
+        link_free_at[owned] = np.asarray(result['link_free_at'])[owned]
+    simulator.forwarder.link_free_at = link_free_at.tolist()
+    return windows
@@ -0,0 +1,222 @@
+import os
+
+import numpy as np
+
+# Plots of the per-interval metrics of cubic_simulator runs, one line per
+# flow. Series are decimated before they reach matplotlib, so a figure costs
+# the same whether the run covered a minute or a month of simulated time:
+# 'minmax' keeps the lowest and highest point of every bucket (spikes survive),
+# 'lttb' keeps the point spanning the largest triangle with its neighbours
+# (Steinarsson's Largest-Triangle-Three-Buckets, better for smooth curves).
+#
+#   plot_metrics(simulator_series(simulator), output='metrics.png')
+#   plot_metrics(csv_series(['flow1_metrics.csv', 'flow2_metrics.csv']), output='metrics.png')
+#
+# LivePlot redraws a figure from the bins completed so far while the
+# simulation runs. matplotlib is only imported when a figure is drawn.
+
+PANELS = (('average_latency', 'Average Latency'), ('throughput', 'Throughput'),
+          ('jitter', 'Jitter'), ('packet_drop_rate', 'Packet Drop Rate'))
+CSV_COLUMNS = {'throughput': 1, 'average_latency': 2, 'jitter': 3, 'packet_drop_rate': 4}
+
+
+def min_max(x, y, max_points):
+    # Indices are kept in time order: per bucket the minimum and the maximum,
+    # plus the first and last point
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    size = -(-n // max((max_points - 2) // 2, 1))
+    num_buckets = -(-n // size)  # Every bucket holds at least one point
+    padded = np.full(num_buckets * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(num_buckets, size)
+    offsets = np.arange(num_buckets) * size
+    keep = np.concatenate([[0, n - 1], offsets + np.nanargmin(rows, axis=1), offsets + np.nanargmax(rows, axis=1)])
+    keep = np.unique(keep)
+    return x[keep], y[keep]
+
+
+def lttb(x, y, max_points):
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return x[keep], y[keep]
+
+
+DECIMATORS = {'minmax': min_max, 'lttb': lttb}
+
+
+def decimate(x, y, max_points, method='minmax'):
+    return DECIMATORS[method](np.asarray(x, dtype=float), np.asarray(y, dtype=float), max_points)
+
+
+def _bin_columns(bins, start=0, end=None):
+    # The plotted columns of one flow's TimeBinnedMetrics over bins [start, end)
+    end = bins.used if end is None else end
+    throughput = bins.series('throughput')[start:end]
+    latency = bins.series('total_latency')[start:end]
+    columns = {'throughput': throughput,
+               'average_latency': np.divide(latency, throughput, out=np.zeros(len(latency)), where=throughput > 0),
+               'jitter': bins.series('jitter')[start:end],
+               'packet_drop_rate': bins.series('packet_drop_rate')[start:end]}
+    times = (np.arange(start, end) * bins.bin_width).astype(float)
+    return times, columns
+
+
+def simulator_series(simulator):
+    # {column: {flow_id: (times, values)}} from a simulator's time bins
+    result = {column: {} for column, _ in PANELS}
+    for flow_id, bins in simulator.time_bins.items():
+        times, columns = _bin_columns(bins)
+        for column, values in columns.items():
+            result[column][flow_id] = (times, values)
+    return result
+
+
+def csv_series(paths):
+    # The same from write_metrics_to_csv files, named <flow_id>_metrics.csv
+    result = {column: {} for column, _ in PANELS}
+    for path in paths:
+        flow_id = os.path.basename(path).rsplit('_metrics.csv', 1)[0]
+        table = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        for column, position in CSV_COLUMNS.items():
+            result[column][flow_id] = (table[:, 0], table[:, position])
+    return result
+
+
+def _pyplot(output):
+    import matplotlib
+    if output:
+        matplotlib.use('Agg')  # Headless: nothing is opened when writing a file
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_metrics(series, output=None, max_points=2000, method='minmax'):
+    # One panel per metric, one decimated line per flow. Saves to output, or
+    # shows the figure when output is None.
+    plt = _pyplot(output)
+    figure, axes = plt.subplots(2, 2, figsize=(12, 6))
+    for axis, (column, label) in zip(axes.flat, PANELS):
+        for flow_id, (times, values) in sorted(series[column].items(), key=lambda item: str(item[0])):
+            axis.plot(*decimate(times, values, max_points, method), label=f'{label} ({flow_id})')
+        _label(axis, label)
+    figure.tight_layout()
+    if output:
+        figure.savefig(output)
+        plt.close(figure)
+    else:
+        plt.show()
+    return figure
+
+
+def _label(axis, label):
+    axis.set_xlabel('Time (seconds)')
+    axis.set_ylabel(label)
+    axis.set_title(f'{label} over Time')
+    axis.grid(True)
+    if axis.get_lines():
+        axis.legend()
+
+
+class IncrementalSeries:
+    # A growing series held decimated. Chunks are appended as they come and
+    # the whole is re-decimated to half of max_points whenever it outgrows
+    # max_points, so memory and redraw cost stay bounded. Min/max decimation
+    # of min/max-decimated data still keeps every extreme.
+    def __init__(self, max_points=2000, method='minmax'):
+        self.max_points = max_points
+        self.method = method
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+
+    def extend(self, x, y):
+        x, y = decimate(x, y, self.max_points, self.method)
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        if len(self.x) > self.max_points:
+            self.x, self.y = decimate(self.x, self.y, self.max_points // 2, self.method)
+
+
+class LivePlot:
+    # Incrementally updated figure for a running cubic_simulator.Simulator:
+    #
+    #   live = LivePlot(simulator, output='metrics.png')
+    #   for now in range(100, 10000, 100):
+    #       simulator.run_simulation(until=now)
+    #       live.update(now)
+    #   simulator.run_simulation()
+    #   live.update()
+    #
+    # update(now) takes the bins completed before now (a bin still being
+    # filled is left for later), update() takes everything.
+    def __init__(self, simulator, output=None, max_points=2000, method='minmax'):
+        self.simulator = simulator
+        self.output = output
+        self.max_points = max_points
+        self.method = method
+        self.series = {}  # (column, flow_id) -> IncrementalSeries
+        self.consumed = {}  # flow_id -> bins already taken
+        self.figure = None
+        self.lines = {}
+
+    def collect(self, now=None):
+        # Moves newly completed bins into the decimated series
+        for flow_id, bins in list(self.simulator.time_bins.items()):
+            end = bins.used if now is None else min(bins.used, int(now // bins.bin_width))
+            start = self.consumed.get(flow_id, 0)
+            if end <= start:
+                continue
+            times, columns = _bin_columns(bins, start, end)
+            for column, values in columns.items():
+                key = (column, flow_id)
+                if key not in self.series:
+                    self.series[key] = IncrementalSeries(self.max_points, self.method)
+                self.series[key].extend(times, values)
+            self.consumed[flow_id] = end
+
+    def update(self, now=None):
+        self.collect(now)
+        plt = _pyplot(self.output)
+        if self.figure is None:
+            self.figure, axes = plt.subplots(2, 2, figsize=(12, 6))
+            self.axes = dict(zip((column for column, _ in PANELS), axes.flat))
+        for (column, flow_id), series in self.series.items():
+            line = self.lines.get((column, flow_id))
+            if line is None:
+                label = dict(PANELS)[column]
+                line, = self.axes[column].plot(series.x, series.y, label=f'{label} ({flow_id})')
+                self.lines[(column, flow_id)] = line
+                _label(self.axes[column], label)
+            else:
+                line.set_data(series.x, series.y)
+        for axis in self.axes.values():
+            axis.relim()
+            axis.autoscale_view()
+        self.figure.tight_layout()
+        if self.output:
+            self.figure.savefig(self.output)
+        else:
+            plt.pause(0.001)
+        return self.figure
+
+    def close(self):
+        if self.figure is not None:
+            _pyplot(self.output).close(self.figure)
+            self.figure = None
+            self.lines = {}
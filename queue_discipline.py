@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import random
+from collections import deque
+
+
+# Packet queue disciplines for the output link. Each discipline keeps one deque
+# per class (priority level or flow) and exposes enqueue(packet, cls) -> bool,
+# dequeue() -> packet or None and len(). A packet's cost is its processing_time,
+# i.e. how long it occupies the link.
+
+
+class FIFOQueue:
+    def __init__(self):
+        self.queue = deque()
+
+    def enqueue(self, packet, cls=None):
+        self.queue.append(packet)
+        return True
+
+    def dequeue(self):
+        if self.queue:
+            return self.queue.popleft()
+        return None
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class REDQueue(FIFOQueue):
+    # Random Early Detection: drop arrivals with a probability that grows
+    # linearly with the averaged queue length between the two thresholds.
+    def __init__(self, min_threshold, max_threshold, max_p=0.1, weight=0.002, rng=None):
+        super().__init__()
+        self.rng = rng  # A random_streams.BufferedStream; the global random module if None
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_p = max_p
+        self.weight = weight
+        self.average = 0
+
+    def enqueue(self, packet, cls=None):
+        self.average = (1 - self.weight) * self.average + self.weight * len(self.queue)
+        if self.average >= self.max_threshold:
+            return False
+        if self.average > self.min_threshold:
+            drop_p = self.max_p * (self.average - self.min_threshold) / (self.max_threshold - self.min_threshold)
+            draw = self.rng.random() if self.rng is not None else random.random()
+            if draw < drop_p:
+                return False
+        self.queue.append(packet)
+        return True
+
+
+class StrictPriorityQueue:
+    # N-level strict priority; a lower class value is served first. Only
+    # backlogged levels sit in the heap, so dequeue is O(log levels).
+    def __init__(self):
+        self.queues = {}
+        self.active = []
+        self.size = 0
+
+    def enqueue(self, packet, cls=1):
+        queue = self.queues.get(cls)
+        if queue is None:
+            queue = self.queues[cls] = deque()
+        if not queue:
+            heapq.heappush(self.active, cls)
+        queue.append(packet)
+        self.size += 1
+        return True
+
+    def dequeue(self):
+        if not self.active:
+            return None
+        queue = self.queues[self.active[0]]
+        packet = queue.popleft()
+        if not queue:
+            heapq.heappop(self.active)
+        self.size -= 1
+        return packet
+
+    def __len__(self):
+        return self.size
+
+
+class DeficitRoundRobin:
+    # Deficit round robin (Shreedhar & Varghese). Each backlogged class gets
+    # quantum * weight of credit per turn and sends while its deficit covers
+    # the head packet.
+    def __init__(self, quantum=1, weights=None):
+        if quantum <= 0:
+            raise ValueError("DRR quantum must be positive")
+        self.quantum = quantum
+        self.weights = weights or {}
+        self.queues = {}
+        self.deficits = {}
+        self.active = deque()
+        self.in_turn = False
+        self.size = 0
+
+    def enqueue(self, packet, cls=None):
+        queue = self.queues.get(cls)
+        if queue is None:
+            queue = self.queues[cls] = deque()
+            self.deficits[cls] = 0
+        if not queue:
+            self.active.append(cls)
+        queue.append(packet)
+        self.size += 1
+        return True
+
+    def dequeue(self):
+        active = self.active
+        while active:
+            cls = active[0]
+            if not self.in_turn:
+                self.deficits[cls] += self.quantum * self.weights.get(cls, 1)
+                self.in_turn = True
+            queue = self.queues[cls]
+            cost = queue[0].processing_time
+            if self.deficits[cls] >= cost:
+                self.deficits[cls] -= cost
+                packet = queue.popleft()
+                self.size -= 1
+                if not queue:
+                    self.deficits[cls] = 0
+                    active.popleft()
+                    self.in_turn = False
+                return packet
+            active.rotate(-1)
+            self.in_turn = False
+        return None
+
+    def __len__(self):
+        return self.size
+
+
+class WeightedFairQueue:
+    # Self-clocked weighted fair queuing: packets get virtual finish tags and
+    # the class whose head has the smallest tag is served next. The system
+    # virtual time is the tag of the packet last sent.
+    def __init__(self, weights=None):
+        self.weights = weights or {}
+        self.queues = {}
+        self.last_finish = {}
+        self.heads = []
+        self.virtual_time = 0
+        self.sequence = itertools.count()
+        self.size = 0
+
+    def enqueue(self, packet, cls=None):
+        queue = self.queues.get(cls)
+        if queue is None:
+            queue = self.queues[cls] = deque()
+        start = max(self.virtual_time, self.last_finish.get(cls, 0))
+        finish = start + packet.processing_time / self.weights.get(cls, 1)
+        self.last_finish[cls] = finish
+        if not queue:
+            heapq.heappush(self.heads, (finish, next(self.sequence), cls))
+        queue.append((finish, packet))
+        self.size += 1
+        return True
+
+    def dequeue(self):
+        if not self.heads:
+            return None
+        finish, _, cls = heapq.heappop(self.heads)
+        queue = self.queues[cls]
+        packet = queue.popleft()[1]
+        self.virtual_time = finish
+        if queue:
+            heapq.heappush(self.heads, (queue[0][0], next(self.sequence), cls))
+        self.size -= 1
+        return packet
+
+    def __len__(self):
+        return self.size
+
+
+class LowLatencyQueue:
+    # Low latency queuing: priority classes are served strictly ahead of the
+    # rest, which share the link by DRR. priority_limit caps how many priority
+    # packets go back to back while other classes wait, standing in for the
+    # policer that keeps the priority queue from starving them.
+    def __init__(self, priority_classes=(1,), quantum=1, weights=None, priority_limit=None):
+        self.priority_classes = set(priority_classes)
+        self.priority = StrictPriorityQueue()
+        self.others = DeficitRoundRobin(quantum=quantum, weights=weights)
+        self.priority_limit = priority_limit
+        self.priority_run = 0
+
+    def enqueue(self, packet, cls=None):
+        if cls in self.priority_classes:
+            return self.priority.enqueue(packet, cls)
+        return self.others.enqueue(packet, cls)
+
+    def dequeue(self):
+        if self.priority and (self.priority_limit is None or self.priority_run < self.priority_limit or not self.others):
+            self.priority_run += 1
+            return self.priority.dequeue()
+        self.priority_run = 0
+        return self.others.dequeue()
+
+    def __len__(self):
+        return len(self.priority) + len(self.others)
+
+
+def make_discipline(scheduler_type='FIFO', quantum=1, max_queue_size=50, weights=None, rng=None):
+    if scheduler_type == 'FIFO':
+        return FIFOQueue()
+    if scheduler_type == 'RED':
+        return REDQueue(min_threshold=max_queue_size / 4, max_threshold=3 * max_queue_size / 4, rng=rng)
+    if scheduler_type in ('PQ', 'SP'):
+        return StrictPriorityQueue()
+    if scheduler_type in ('RR', 'DRR'):
+        return DeficitRoundRobin(quantum=quantum, weights=weights)
+    if scheduler_type == 'WFQ':
+        return WeightedFairQueue(weights=weights)
+    if scheduler_type == 'LLQ':
+        return LowLatencyQueue(quantum=quantum, weights=weights)
+    raise ValueError(f"Unknown scheduler type: {scheduler_type}")
@@ -0,0 +1,84 @@
+import hashlib
+
+import numpy as np
+
+# Random number streams. A RandomStreams is built from one seed and hands out
+# named substreams: each name ('red', 'topology', 'arrivals/flow2', ...) gets
+# its own SeedSequence child keyed by a hash of the name, so a component's
+# draws do not depend on which other components exist or in what order they
+# draw, and a pickled simulator carries every stream's exact position.
+#
+#   streams = RandomStreams(seed)
+#   streams.generator('arrivals/flow1').exponential(0.1, 100000)  # bulk draws
+#   streams.stream('red').random()                                # buffered scalars
+#
+# Code that does not own a RandomStreams draws from default_streams, which
+# seed() resets.
+
+
+def name_key(name):
+    # Stable across processes and Python versions, unlike hash()
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'little')
+
+
+class BufferedStream:
+    # Scalar draws served from blocks of block_size uniforms, so the hot loop
+    # pays a list index instead of a NumPy call per draw
+    def __init__(self, generator, block_size=4096):
+        self.generator = generator
+        self.block_size = block_size
+        self.block = []
+        self.position = 0
+
+    def random(self):
+        if self.position == len(self.block):
+            self.block = self.generator.random(self.block_size).tolist()
+            self.position = 0
+        value = self.block[self.position]
+        self.position += 1
+        return value
+
+    def uniform(self, low=0.0, high=1.0):
+        return low + (high - low) * self.random()
+
+    def integers(self, low, high):
+        # Uniform integer in [low, high)
+        return low + int((high - low) * self.random())
+
+
+class RandomStreams:
+    def __init__(self, seed=None, block_size=4096):
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.block_size = block_size
+        # Same stream as np.random.default_rng(seed), so seeded results from
+        # before named streams existed are unchanged
+        self.root = np.random.default_rng(self.seed_sequence)
+        self.generators = {}
+        self.streams = {}
+
+    def seed_for(self, name):
+        root = self.seed_sequence
+        return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (name_key(name),), pool_size=root.pool_size)
+
+    def generator(self, name):
+        # The named substream as a NumPy Generator, for vectorized draws
+        if name not in self.generators:
+            self.generators[name] = np.random.default_rng(self.seed_for(name))
+        return self.generators[name]
+
+    def stream(self, name):
+        # The named substream as a BufferedStream, for scalar draws. Separate
+        # from generator(name), which has its own key.
+        if name not in self.streams:
+            self.streams[name] = BufferedStream(np.random.default_rng(self.seed_for(f'{name}#buffered')), self.block_size)
+        return self.streams[name]
+
+
+default_streams = RandomStreams()
+
+
+def seed(value=None):
+    # Reseeds the streams used by code without a RandomStreams of its own
+    global default_streams
+    default_streams = RandomStreams(value)
+    return default_streams
@@ -0,0 +1,169 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# On-disk store of finished runs. A run is described by a JSON-able config
+# (simulator arguments, topology parameters, arrival model, seed) and stored
+# under a hash of that config plus a hash of the simulator source, so editing
+# the model invalidates old results. Entries are .npz files of named arrays:
+# calculate_metrics() outputs under 'metrics', and for cubic_simulator runs
+# the per-flow counters and per-interval metric series.
+#
+#   cache = ResultCache('.result_cache')
+#   metrics = cache.cached(config, lambda: simulator_result(run(config)))['metrics']
+#
+# Entries are written to a temporary file and renamed into place, and reads
+# treat a vanished file as a miss, so sweep workers can share a directory
+# without locks. A hit refreshes the entry's modification time; once the
+# directory outgrows max_bytes the least recently used entries are deleted.
+
+CACHE_DIR = '.result_cache'
+CACHE_VERSION = 1
+MAX_BYTES = 1 << 30
+STALE_SECONDS = 3600  # Temporary files older than this were left by a crashed writer
+SOURCE_FILES = ('Simulator.py', 'cubic_simulator.py', 'arrivals.py', 'calendar_queue.py', 'cubic.py', 'event.py',
+                'inflight.py', 'leackyBucket.py', 'metrics.py', 'network.py', 'packet.py', 'queue_discipline.py',
+                'random_streams.py', 'routing.py', 'scheduler.py', 'sweep.py', 'topology_cache.py')
+FLOW_COUNTERS = ('arrival_counts', 'departure_counts', 'dropped_packets', 'total_latencies', 'simulation_end_times')
+
+
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    # Hash of every module that decides a run's outcome
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCE_FILES:
+        digest.update(name.encode())
+        with open(os.path.join(directory, name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _plain(value):
+    # JSON form of the config values json does not know
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': value.entropy, 'spawn_key': list(value.spawn_key)}
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Cannot key a run on {type(value).__name__}")
+
+
+def run_key(config):
+    description = json.dumps({'version': CACHE_VERSION, 'source': source_hash(), 'config': config},
+                             sort_keys=True, default=_plain)
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def simulator_result(simulator):
+    # The arrays kept for a finished run of either simulator
+    if not hasattr(simulator, 'time_bins'):
+        return {'metrics': np.array(simulator.calculate_metrics())}
+    result = {'flow_ids': np.array(simulator.flow_ids)}
+    for name in FLOW_COUNTERS:
+        result[name] = np.array([getattr(simulator, name)[flow_id] for flow_id in simulator.flow_ids])
+    for flow_id in simulator.flow_ids:
+        if flow_id in simulator.time_bins:
+            bins = simulator.time_bins[flow_id]
+            for column in bins.columns:
+                result[f'{flow_id}/{column}'] = bins.series(column)
+    return result
+
+
+def restore_flows(simulator, result):
+    # Fills a cubic_simulator.Simulator that has not run with a cached run's
+    # counters and per-interval metrics, for write_metrics_to_csv and plotting
+    flow_ids = result['flow_ids'].tolist()
+    for name in FLOW_COUNTERS:
+        getattr(simulator, name).update(zip(flow_ids, result[name].tolist()))
+    for flow_id in flow_ids:
+        if f'{flow_id}/throughput' in result:
+            bins = simulator.time_bins[flow_id]
+            for column in bins.columns:
+                bins.columns[column] = np.array(result[f'{flow_id}/{column}'])
+            bins.used = len(bins.columns['throughput'])
+    return simulator
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        self.directory = directory or CACHE_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, config):
+        return os.path.join(self.directory, f'{run_key(config)}.npz')
+
+    def get(self, config):
+        # The stored arrays, or None on a miss
+        path = self._path(config)
+        try:
+            with np.load(path) as data:
+                result = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def put(self, config, result):
+        handle, temporary = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.npz')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                np.savez(file, **result)
+            os.replace(temporary, self._path(config))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def cached(self, config, compute):
+        # get(config), running compute() and storing its result on a miss
+        result = self.get(config)
+        if result is None:
+            result = compute()
+            self.put(config, result)
+        return result
+
+    def entries(self):
+        # (modification time, size, path) of every entry, oldest first
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    if stat.st_mtime < time.time() - STALE_SECONDS:
+                        _remove(entry.path)
+                elif entry.name.endswith('.npz'):
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        # Deletes least recently used entries until the rest fit in max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def __len__(self):
+        return len(self.entries())
+
+
+def _remove(path):
+    # Another worker may have removed it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
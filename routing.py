@@ -0,0 +1,144 @@
+import heapq
+
+import numpy as np
+
+
+def index_dtype(num_nodes):
+    # Smallest signed integer type that can hold every node id plus -1
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_nodes <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _first_hops(predecessors, sources):
+    # Turns shortest-path trees (one row of predecessors per source, negative
+    # where there is none) into next hops: each node's pointer jumps up its
+    # tree until it reaches a child of the source, doubling the distance
+    # covered on every pass
+    rows = np.arange(len(sources))[:, None]
+    sources = np.asarray(sources)
+    unreachable = predecessors < 0
+    terminal = unreachable | (predecessors == sources[:, None])
+    hops = np.where(terminal, np.arange(predecessors.shape[1]), predecessors)
+    while True:
+        jumped = hops[rows, hops]
+        if np.array_equal(jumped, hops):
+            break
+        hops = jumped
+    hops[unreachable] = -1
+    hops[rows[:, 0], sources] = sources
+    return hops
+
+
+def _python_next_hops(indptr, indices, costs, source):
+    # One Dijkstra from source in pure Python, recording the first hop taken
+    # towards every node; used when SciPy is not installed
+    num_nodes = len(indptr) - 1
+    infinity = float('inf')
+    distances = [infinity] * num_nodes
+    row = [-1] * num_nodes
+    distances[source] = 0
+    row[source] = source
+    heap = [(0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for slot in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[slot]
+            candidate = distance + costs[slot]
+            if candidate < distances[neighbour]:
+                distances[neighbour] = candidate
+                row[neighbour] = neighbour if node == source else row[node]
+                heapq.heappush(heap, (candidate, neighbour))
+    return row
+
+
+def compute_next_hops(indptr, indices, costs, sources=None, block_size=256):
+    # Next-hop rows: next_hops[i, d] is the neighbour sources[i] forwards to on
+    # a shortest path to d, d itself for the source and -1 if d is unreachable.
+    # All sources (the dense N x N table) when sources is None. The graph is
+    # an undirected CSR adjacency with matching costs. With SciPy the rows come
+    # from csgraph.dijkstra, block_size sources at a time to bound the float
+    # distance matrix it returns.
+    indptr, indices = np.asarray(indptr), np.asarray(indices)
+    costs = np.asarray(costs, dtype=float)
+    num_nodes = len(indptr) - 1
+    sources = np.arange(num_nodes) if sources is None else np.asarray(sources, dtype=np.int64)
+    next_hops = np.full((len(sources), num_nodes), -1, dtype=index_dtype(num_nodes))
+    if num_nodes == 0 or len(sources) == 0:
+        return next_hops
+    try:
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError:
+        indptr, indices, costs = indptr.tolist(), indices.tolist(), costs.tolist()
+        for position, source in enumerate(sources.tolist()):
+            next_hops[position] = _python_next_hops(indptr, indices, costs, source)
+        return next_hops
+    graph = csr_matrix((costs, indices, indptr), shape=(num_nodes, num_nodes))
+    for start in range(0, len(sources), block_size):
+        block = sources[start:start + block_size]
+        _, predecessors = dijkstra(graph, indices=block, return_predecessors=True)
+        next_hops[start:start + len(block)] = _first_hops(predecessors, block)
+    return next_hops
+
+
+class LazyNextHops:
+    # Next-hop table for networks too large for the dense N x N one: the row
+    # of a node is computed the first time a packet is forwarded from it, so
+    # memory follows the nodes traffic actually passes through. Indexed like
+    # the dense table, table[node, destination].
+    def __init__(self, indptr, indices, costs):
+        self.indptr = indptr
+        self.indices = indices
+        self.costs = costs
+        self.rows = {}
+
+    def row(self, node):
+        row = self.rows.get(node)
+        if row is None:
+            row = self.rows[node] = compute_next_hops(self.indptr, self.indices, self.costs, [node])[0]
+        return row
+
+    def __getitem__(self, key):
+        node, destination = key
+        return self.row(int(node))[destination]
+
+    @property
+    def shape(self):
+        num_nodes = len(self.indptr) - 1
+        return num_nodes, num_nodes
+
+
+class Forwarder:
+    # Hop-by-hop forwarding over a Network. Every directed link transmits one
+    # packet at a time in FIFO order; a packet leaves a node after waiting for
+    # the link, spends size / bandwidth transmitting and then latency in
+    # propagation before it reaches the next node.
+    def __init__(self, network, weight='latency'):
+        self.network = network
+        self.next_hops = network.next_hop_table(weight)
+        # Per directed link (CSR slot), as Python lists for cheap scalar access
+        self.bandwidth = network.bandwidth[network.edge_ids].tolist()
+        self.latency = network.latency[network.edge_ids].tolist()
+        self.link_free_at = [0.0] * len(network.indices)
+        self.slots = {}
+
+    def forward(self, packet, time):
+        # Sends the packet one hop on from packet.node. Returns the time it
+        # reaches the next node, or None if the destination is unreachable.
+        node = packet.node
+        next_node = int(self.next_hops[node, packet.destination])
+        if next_node < 0:
+            return None
+        slot = self.slots.get((node, next_node))
+        if slot is None:
+            slot = self.slots[(node, next_node)] = self.network.link_slot(node, next_node)
+        start = max(time, self.link_free_at[slot])
+        transmitted = start + packet.size / self.bandwidth[slot]
+        self.link_free_at[slot] = transmitted
+        packet.node = next_node
+        packet.hops += 1
+        return transmitted + self.latency[slot]
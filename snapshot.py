@@ -0,0 +1,140 @@
+import itertools
+import os
+import pickle
+import random
+import tempfile
+import zlib
+
+import numpy as np
+
+import packet
+import random_streams
+from queue_discipline import make_discipline
+
+# Snapshots of a running Simulator or cubic_simulator.Simulator: the event
+# list, queues, in-flight tables, congestion control and token bucket state,
+# counters and every random number generator, pickled and zlib-compressed
+# behind a small header. A warmed-up simulator can be saved once and forked
+# into many continuations with different parameters:
+#
+#   simulator.run_simulation(until=warm_up_time)
+#   data = snapshot_bytes(simulator)
+#   for size in (50, 100, 200):
+#       branch = fork(data, max_queue_size=size)
+#       branch.run_simulation()
+#
+# Instrumentation must be detached and any trace recorder closed before taking
+# a snapshot. Lazy arrival sources hold generators, which do not pickle.
+
+MAGIC = b'NETSIM-SNAPSHOT\x01'
+
+
+def snapshot_bytes(simulator, level=6):
+    state = {
+        'simulator': simulator,
+        'next_packet_id': _next_packet_id(),
+        'random': random.getstate(),
+        'np_random': np.random.get_state(),
+        'streams': random_streams.default_streams,
+    }
+    return MAGIC + zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+
+def restore(data, restore_global_rng=True):
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a simulator snapshot")
+    state = pickle.loads(zlib.decompress(data[len(MAGIC):]))
+    # New packets must not reuse ids still held by restored in-flight tables
+    packet.packet_ids = itertools.count(max(state['next_packet_id'], _next_packet_id()))
+    if restore_global_rng:
+        random.setstate(state['random'])
+        np.random.set_state(state['np_random'])
+        random_streams.default_streams = state['streams']
+    return state['simulator']
+
+
+def _next_packet_id():
+    next_id = next(packet.packet_ids)
+    packet.packet_ids = itertools.count(next_id)
+    return next_id
+
+
+def save_snapshot(simulator, path, level=6):
+    # Written to a temporary file and renamed, so a crash mid-write never
+    # replaces a good checkpoint with a truncated one
+    data = snapshot_bytes(simulator, level)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def load_snapshot(path, restore_global_rng=True):
+    with open(path, 'rb') as file:
+        return restore(file.read(), restore_global_rng)
+
+
+def _drop(simulator, queued):
+    # Account for a waiting packet the new discipline would not take
+    if hasattr(simulator, 'flows'):
+        simulator.flows[queued.flow_id].depart(queued)
+        simulator.dropped_packets[queued.flow_id] += 1
+    else:
+        simulator.packet_queues.depart(queued)
+        simulator.dropped_packets += 1
+
+
+def set_discipline(simulator, scheduler_type, quantum=None, weights=None):
+    # Swaps the queue discipline, moving waiting packets across in the order
+    # the old discipline would have served them
+    quantum = simulator.quantum if quantum is None else quantum
+    discipline = make_discipline(scheduler_type, quantum=quantum, max_queue_size=simulator.max_queue_size, weights=weights,
+                                 rng=simulator.random.stream('red'))
+    by_flow = hasattr(simulator, 'flows')
+    waiting = simulator.discipline.dequeue()
+    while waiting is not None:
+        if not discipline.enqueue(waiting, waiting.flow_id if by_flow else waiting.priority):
+            _drop(simulator, waiting)
+        waiting = simulator.discipline.dequeue()
+    simulator.discipline = discipline
+    simulator.scheduler_type = scheduler_type
+    simulator.scheduler.set_scheduler_type(scheduler_type)
+    simulator.quantum = quantum
+
+
+def apply_changes(simulator, scheduler_type=None, quantum=None, weights=None, cubic=None, **changes):
+    # scheduler_type/quantum/weights rebuild the discipline, cubic is a dict
+    # of congestion-control attributes (e.g. {'c': 0.6}), and anything else
+    # must be an existing simulator attribute such as max_queue_size
+    if scheduler_type is not None or quantum is not None or weights is not None:
+        set_discipline(simulator, scheduler_type or simulator.scheduler_type, quantum, weights)
+    for name, value in (cubic or {}).items():
+        if not hasattr(simulator.cubic, name):
+            raise ValueError(f"Unknown congestion control parameter: {name}")
+        setattr(simulator.cubic, name, value)
+    for name, value in changes.items():
+        if not hasattr(simulator, name):
+            raise ValueError(f"Unknown simulator parameter: {name}")
+        setattr(simulator, name, value)
+    return simulator
+
+
+def fork(snapshot, **changes):
+    # An independent copy of the snapshotted simulator (bytes or a file path)
+    # with changes applied
+    simulator = restore(snapshot) if isinstance(snapshot, bytes) else load_snapshot(snapshot)
+    return apply_changes(simulator, **changes)
+
+
+def run_with_checkpoints(simulator, path, every_events=1000000, until=None):
+    # Runs to completion (or until), saving a snapshot every every_events
+    # events. After a crash, run_with_checkpoints(load_snapshot(path), path)
+    # picks up from the last checkpoint.
+    total = 0
+    while simulator.scheduler.has_events():
+        processed = simulator.run_simulation(until=until, max_events=every_events)
+        total += processed
+        save_snapshot(simulator, path)
+        if processed < every_events:
+            break
+    return total
@@ -0,0 +1,151 @@
+import csv
+import itertools
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+import random_streams
+from Simulator import Simulator
+
+METRIC_NAMES = ('throughput', 'average_latency', 'jitter', 'packet_drop_rate')
+CHUNKS_PER_WORKER = 4
+
+
+def expand_grid(grid):
+    # {'a': [1, 2], 'b': [3]} -> [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]
+    if not grid:
+        return [{}]
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def run_point(simulator_args, topology_args, num_events, seed_sequence, cache_dir=None, arrival_args=None):
+    # Runs one configuration with one seed. Every stochastic component in the
+    # worker is seeded from this point's own SeedSequence, so results do not
+    # depend on which process ran the point or in what order. With topology
+    # arguments the traffic is multi-hop, between random node pairs of that
+    # topology; without, it is the single-link model. arrival_args go to
+    # generate_arrivals. With cache_dir the metrics come from a
+    # result_cache.ResultCache when the point has run before.
+    if cache_dir is not None:
+        from result_cache import ResultCache
+
+        config = {'simulator': 'Simulator', 'simulator_args': simulator_args, 'topology_args': topology_args,
+                  'num_events': num_events, 'seed': seed_sequence, 'arrival_args': arrival_args}
+        result = ResultCache(cache_dir).cached(
+            config, lambda: {'metrics': np.array(run_point(simulator_args, topology_args, num_events, seed_sequence,
+                                                           arrival_args=arrival_args))})
+        return tuple(result['metrics'].tolist())
+    seeds = seed_sequence.generate_state(3)
+    random.seed(int(seeds[0]))
+    np.random.seed(int(seeds[1]))
+    random_streams.seed(int(seeds[2]))
+    simulator = Simulator(seed=seed_sequence, **simulator_args)
+    topology_args = dict(topology_args)
+    if topology_args:
+        generator = topology_args.pop('generator', 'barabasi_albert')
+        if 'seed' in topology_args:
+            # A fixed topology seed lets every worker map the same cached copy
+            simulator.network.load_topology(generator, **topology_args)
+        else:
+            getattr(simulator.network, f'generate_{generator}_topology')(**topology_args)
+        simulator.initialize_traffic(num_events=num_events, **(arrival_args or {}))
+    else:
+        simulator.initialize_events(num_events=num_events, **(arrival_args or {}))
+    simulator.run_simulation()
+    return simulator.calculate_metrics()
+
+
+def _run_task(task):
+    return run_point(*task)
+
+
+def t_quantile(p, df):
+    # Student t quantile: exact for 1 and 2 degrees of freedom, Cornish-Fisher
+    # expansion around the normal quantile beyond that.
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z
+            + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+
+
+def confidence_interval(values, confidence=0.95):
+    # Returns (mean, half width) of the t confidence interval
+    values = np.asarray(values, dtype=float)
+    mean = float(values.mean())
+    if len(values) < 2:
+        return mean, float('nan')
+    standard_error = float(values.std(ddof=1)) / math.sqrt(len(values))
+    return mean, t_quantile(0.5 + confidence / 2, len(values) - 1) * standard_error
+
+
+def run_sweep(simulator_grid, topology_grid=None, seeds=10, num_events=1000, base_seed=0, max_workers=None, confidence=0.95,
+              cache_dir=None, arrival_args=None):
+    # Runs every combination of simulator_grid x topology_grid for `seeds`
+    # replications across a process pool. Returns one row per configuration
+    # with the mean and confidence half width of each calculate_metrics value.
+    # A topology_grid makes the traffic multi-hop (see run_point). Points
+    # already in the result cache at cache_dir are not rerun.
+    configurations = [(simulator_args, topology_args)
+                      for simulator_args in expand_grid(simulator_grid)
+                      for topology_args in expand_grid(topology_grid or {})]
+    streams = np.random.SeedSequence(base_seed).spawn(len(configurations) * seeds)
+    tasks = [(simulator_args, topology_args, num_events, streams[index * seeds + replication], cache_dir, arrival_args)
+             for index, (simulator_args, topology_args) in enumerate(configurations)
+             for replication in range(seeds)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1:
+        results = [_run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # About CHUNKS_PER_WORKER chunks each: few enough round trips to
+            # the pool, enough that one slow chunk does not hold up the rest
+            chunksize = max(1, len(tasks) // (max_workers * CHUNKS_PER_WORKER))
+            results = list(pool.map(_run_task, tasks, chunksize=chunksize))
+
+    rows = []
+    for index, (simulator_args, topology_args) in enumerate(configurations):
+        samples = results[index * seeds:(index + 1) * seeds]
+        row = dict(simulator_args)
+        row.update(topology_args)
+        row['seeds'] = seeds
+        for position, name in enumerate(METRIC_NAMES):
+            mean, half_width = confidence_interval([sample[position] for sample in samples], confidence)
+            row[f'{name}_mean'] = mean
+            row[f'{name}_ci'] = half_width
+        rows.append(row)
+    return rows
+
+
+def write_table_csv(rows, path):
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    # The five scheduler comparisons from Simulator.py, ten seeds each, on a
+    # single link offered 90% of its capacity
+    from arrivals import processing_time_for_load
+
+    rows = run_sweep({'scheduler_type': ['FIFO', 'PQ', 'RR', 'RED', 'LLQ'], 'max_queue_size': [50]}, seeds=10,
+                     num_events=1000, arrival_args={'processing_time': processing_time_for_load(0.9, 1000)})
+    for row in rows:
+        print(f"{row['scheduler_type']:<5} throughput {row['throughput_mean']:.3f} ± {row['throughput_ci']:.3f}  "
+              f"latency {row['average_latency_mean']:.2f} ± {row['average_latency_ci']:.2f}  "
+              f"drop rate {row['packet_drop_rate_mean'] * 100:.2f}% ± {row['packet_drop_rate_ci'] * 100:.2f}%")
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# On-disk topology cache. Each generated topology is stored under a directory
+# named by a hash of (generator, parameters, seed) as plain .npy files, and is
+# loaded back with mmap_mode='r', so repeated runs and sweep workers on the
+# same machine share one page-cached copy instead of regenerating it. Next-hop
+# tables are added to the same directory the first time they are computed.
+
+CACHE_DIR = '.topology_cache'
+CACHE_VERSION = 2  # 2: Waxman links drawn by grid-cell sampling
+ARRAYS = ('edges', 'bandwidth', 'latency', 'indptr', 'indices', 'edge_ids', 'slot_keys')
+
+
+def cache_key(generator, seed, **params):
+    description = json.dumps({'version': CACHE_VERSION, 'generator': generator, 'seed': seed, 'params': params},
+                             sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def _save_array(path, array):
+    # Write next to the target and rename, so readers never see a partial file
+    directory = os.path.dirname(path)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.npy.tmp')
+    with os.fdopen(handle, 'wb') as file:
+        np.save(file, np.ascontiguousarray(array))
+    os.replace(temporary, path)
+
+
+def store_topology(network, path, generator, seed, params):
+    # Writes the network's arrays into a fresh directory and renames it into
+    # place. If another process got there first, its copy is kept.
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(getattr(network, name)))
+        if getattr(network, 'positions', None) is not None:
+            np.save(os.path.join(staging, 'positions.npy'), network.positions)
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump({'generator': generator, 'seed': seed, 'params': params, 'num_nodes': network.num_nodes}, file)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def load_stored_topology(network, path):
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+    positions_path = os.path.join(path, 'positions.npy')
+    arrays['positions'] = np.load(positions_path, mmap_mode='r') if os.path.exists(positions_path) else None
+    network.install_arrays(meta['num_nodes'], arrays)
+    network.cache_path = path
+
+
+def load_topology(network, generator, seed, cache_dir=None, **params):
+    # Fills network with the topology generate_{generator}_topology(seed=seed,
+    # **params) would build, generating and storing it only on a cache miss
+    path = os.path.join(cache_dir or CACHE_DIR, cache_key(generator, seed, **params))
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        getattr(network, f'generate_{generator}_topology')(seed=seed, **params)
+        store_topology(network, path, generator, seed, params)
+    load_stored_topology(network, path)
+
+
+def cached_next_hops(path, weight, compute):
+    # Next-hop table for one routing weight, memory-mapped from the topology's
+    # cache directory and computed with compute() on the first request
+    file_path = os.path.join(path, f'next_hops_{weight or "hops"}.npy')
+    if not os.path.exists(file_path):
+        _save_array(file_path, compute())
+    return np.load(file_path, mmap_mode='r')
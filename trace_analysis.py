@@ -0,0 +1,86 @@
+import numpy as np
+
+from packet_trace import ARRIVAL, DEPARTURE, DROP, KIND_NAMES, load_records
+
+# Offline analysis of packet_trace files. Everything is a vectorized pass over
+# the memory-mapped records (boolean masks, sort, bincount), so one recorded
+# run can be sliced many ways without simulating it again.
+
+
+class Trace:
+    def __init__(self, path):
+        self.records, self.flows = load_records(path)
+
+    def __len__(self):
+        return len(self.records)
+
+    def flow_code(self, flow_id):
+        return self.flows.index(flow_id)
+
+    def select(self, kind=None, flow_id=None):
+        mask = np.ones(len(self.records), dtype=bool)
+        if kind is not None:
+            mask &= self.records['kind'] == kind
+        if flow_id is not None:
+            mask &= self.records['flow'] == self.flow_code(flow_id)
+        return self.records[mask]
+
+    def latencies(self, flow_id=None):
+        return np.asarray(self.select(DEPARTURE, flow_id)['value'])
+
+    def latency_cdf(self, flow_id=None, points=None):
+        # (latency, fraction of departures with latency <= it). With points,
+        # the curve is sampled at that many evenly spaced quantiles.
+        latencies = np.sort(self.latencies(flow_id))
+        if len(latencies) == 0:
+            return latencies, latencies.astype(float)
+        fractions = np.arange(1, len(latencies) + 1) / len(latencies)
+        if points is not None and points < len(latencies):
+            positions = np.linspace(0, len(latencies) - 1, points).round().astype(np.int64)
+            return latencies[positions], fractions[positions]
+        return latencies, fractions
+
+    def latency_percentiles(self, qs=(50, 99, 99.9), flow_id=None):
+        latencies = self.latencies(flow_id)
+        if len(latencies) == 0:
+            return {q: 0 for q in qs}
+        return dict(zip(qs, np.percentile(latencies, qs).tolist()))
+
+    def timeline(self, kind, bin_width=1.0, flow_id=None, end=None):
+        # Count of `kind` records per time bin as (bin starts, counts)
+        times = np.asarray(self.select(kind, flow_id)['time'])
+        if end is None:
+            end = float(self.records['time'].max()) if len(self.records) else 0.0
+        num_bins = int(end // bin_width) + 1
+        counts = np.bincount((times // bin_width).astype(np.int64), minlength=num_bins)[:num_bins]
+        return np.arange(num_bins) * bin_width, counts
+
+    def throughput_timeline(self, bin_width=1.0):
+        # Departures per unit time in each bin, per flow (None: packets without a flow id)
+        result = {}
+        for flow_id in self.flows or [None]:
+            starts, departures = self.timeline(DEPARTURE, bin_width, flow_id)
+            result[flow_id] = (starts, departures / bin_width)
+        return result
+
+    def drop_timeline(self, bin_width=1.0):
+        # (bin starts, drops, drop rate = drops / arrivals) per flow
+        result = {}
+        for flow_id in self.flows or [None]:
+            starts, drops = self.timeline(DROP, bin_width, flow_id)
+            _, arrivals = self.timeline(ARRIVAL, bin_width, flow_id)
+            rate = np.divide(drops, arrivals, out=np.zeros(len(drops)), where=arrivals > 0)
+            result[flow_id] = (starts, drops, rate)
+        return result
+
+    def summary(self):
+        # Record counts by kind and latency statistics, per flow
+        result = {}
+        for flow_id in self.flows or [None]:
+            records = self.select(flow_id=flow_id)
+            counts = np.bincount(records['kind'], minlength=len(KIND_NAMES))
+            latencies = np.asarray(records['value'][records['kind'] == DEPARTURE])
+            result[flow_id] = {name: int(count) for name, count in zip(KIND_NAMES, counts)}
+            result[flow_id]['mean_latency'] = float(latencies.mean()) if len(latencies) else 0.0
+            result[flow_id]['max_latency'] = float(latencies.max()) if len(latencies) else 0.0
+        return result